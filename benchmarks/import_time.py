@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure import time of morphine modules and loading time of a pickled
+model in fresh interpreters, and list third-party modules they pull in.
+
+Usage::
+
+    python benchmarks/import_time.py [--repeat N] [--model model.pickle]
+
+"""
+from __future__ import absolute_import, print_function
+import argparse
+import json
+import subprocess
+import sys
+
+MODULES = [
+    'morphine.basetagger',
+    'morphine.crfsuite',
+    'morphine.cases_model',
+    'morphine.pos_model',
+    'morphine.number_model',
+    'morphine.cli',
+]
+
+WATCHED = ['pymorphy2', 'pycrfsuite', 'tqdm', 'tabulate', 'toolz', 'cytoolz']
+
+_SCRIPT = """
+import json, sys, time
+start = time.time()
+%s
+elapsed = time.time() - start
+print(json.dumps({
+    'time': elapsed,
+    'modules': sorted(m for m in %r if m in sys.modules),
+}))
+"""
+
+
+def measure(code, repeat):
+    script = _SCRIPT % (code, WATCHED)
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', script])
+        result = json.loads(out.decode('utf8'))
+        times.append(result['time'])
+    return min(times), result['modules']
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--model', help="pickled Disambiguator to load")
+    args = p.parse_args()
+
+    cases = [("import %s" % module, "import %s" % module) for module in MODULES]
+    if args.model:
+        cases.append((
+            "load %s" % args.model,
+            "import pickle\nwith open(%r, 'rb') as f: pickle.load(f)" % args.model
+        ))
+
+    for name, code in cases:
+        best, modules = measure(code, args.repeat)
+        print("%-30s %7.1f ms   %s" % (name, best * 1000, ", ".join(modules)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Replay sentences against a Disambiguator in serial, thread-pool or
+process-pool mode and report per-sentence latency by sentence length,
+throughput and peak memory.
+
+Usage::
+
+    python benchmarks/load.py -m model.pickle --corpus sents.txt \\
+        --mode process -j 4 --save results.json
+
+    python benchmarks/load.py -m model.pickle --synthetic 2000 \\
+        --lengths 5:5,15:3,40:1 --baseline results.json
+
+``--corpus`` is a text file with one sentence per line; ``--synthetic N``
+generates N sentences with lengths drawn from ``--lengths``
+(``length:weight`` pairs) and words drawn from the corpus vocabulary
+(or a small built-in word list). In thread and process modes each
+worker loads its own copy of the model; latency is the time spent
+in ``Disambiguator.parse``, without queueing.
+
+In process mode memory of workers is reported as maximum and mean
+per-worker peak RSS and as total PSS of workers at the end of the run
+(Linux only); PSS counts pages shared with the parent once.
+
+With ``--baseline`` results are compared to a JSON file saved earlier
+by ``--save``; the exit code is 1 if tokens/sec or p95 latency of any
+length bucket are worse than the baseline by more than
+``--max-regression``.
+"""
+from __future__ import absolute_import, print_function, division
+import argparse
+import io
+import json
+import multiprocessing
+import multiprocessing.pool
+import pickle
+import random
+import sys
+import threading
+import time
+
+from morphine.basetagger import tokenize_if_needed
+from morphine.bundle import is_bundle, load_bundle
+from morphine.metrics import percentile
+from morphine.prefork import process_memory
+from morphine.utils import peak_rss
+
+PERCENTILES = [50, 95, 99]
+
+# upper bounds of sentence length buckets
+BUCKETS = [5, 10, 20, 40]
+
+WORDS = [
+    'мама', 'мыла', 'раму', 'гуси', 'летят', 'на', 'юг', 'стали', 'крепче',
+    'мы', 'видели', 'старые', 'дома', 'улице', 'в', 'лесу', 'родилась',
+    'елочка', 'и', 'он', 'она', 'был', 'это', 'не', 'что', 'с', 'по', 'к',
+]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument('-m', '--model', required=True,
+                   help="pickled Disambiguator or a model bundle")
+    p.add_argument('--corpus', help="text file, one sentence per line")
+    p.add_argument('--synthetic', type=int, default=0, metavar='N',
+                   help="generate N sentences instead of replaying the corpus")
+    p.add_argument('--lengths', default='5:5,15:3,40:1',
+                   help="sentence length distribution for --synthetic "
+                        "(default: %(default)s)")
+    p.add_argument('--mode', choices=['serial', 'thread', 'process'],
+                   default='serial')
+    p.add_argument('-j', '--workers', type=int, default=2,
+                   help="number of threads or processes (default: %(default)s)")
+    p.add_argument('--repeat', type=int, default=1,
+                   help="replay sentences this many times (default: %(default)s)")
+    p.add_argument('--no-cache', action='store_true',
+                   help="disable the Disambiguator result cache")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--save', help="save results to this JSON file")
+    p.add_argument('--baseline', help="compare results to this JSON file")
+    p.add_argument('--max-regression', type=float, default=0.1,
+                   help="allowed relative regression (default: %(default)s)")
+    args = p.parse_args(argv)
+
+    if not args.corpus and not args.synthetic:
+        p.error("pass --corpus or --synthetic")
+    sents = read_sents(args.corpus) if args.corpus else []
+    if args.synthetic:
+        sents = synthetic_sents(args.synthetic, parse_lengths(args.lengths),
+                                vocabulary(sents) or WORDS, args.seed)
+    sents = sents * args.repeat
+
+    results = run(args.model, sents, args.mode, args.workers, args.no_cache)
+    results['mode'] = args.mode
+    results['workers'] = args.workers if args.mode != 'serial' else 1
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(results, baseline, args.max_regression)
+        print()
+        print("\n".join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+def read_sents(path):
+    with io.open(path, encoding='utf8') as f:
+        return [tokenize_if_needed(line.strip()) for line in f if line.strip()]
+
+
+def vocabulary(sents):
+    return sorted(set(token for sent in sents for token in sent))
+
+
+def parse_lengths(spec):
+    """
+    Parse ``length:weight`` pairs::
+
+        >>> parse_lengths('5:2,20:1')
+        [(5, 2.0), (20, 1.0)]
+
+    """
+    res = []
+    for item in spec.split(','):
+        length, weight = item.split(':')
+        res.append((int(length), float(weight)))
+    return res
+
+
+def synthetic_sents(n, lengths, words, seed=0):
+    rng = random.Random(seed)
+    total = sum(weight for length, weight in lengths)
+    sents = []
+    for _ in range(n):
+        point = rng.random() * total
+        for length, weight in lengths:
+            point -= weight
+            if point < 0:
+                break
+        sents.append([rng.choice(words) for _ in range(length)])
+    return sents
+
+
+def bucket_name(length):
+    """
+    Return a name of a length bucket::
+
+        >>> bucket_name(3), bucket_name(10), bucket_name(100)
+        ('1-5', '6-10', '41+')
+
+    """
+    lower = 1
+    for upper in BUCKETS:
+        if length <= upper:
+            return "%d-%d" % (lower, upper)
+        lower = upper + 1
+    return "%d+" % lower
+
+
+def run(model_path, sents, mode, workers, no_cache):
+    init_args = (model_path, no_cache)
+    if mode == 'serial':
+        pool = None
+        _init_worker(*init_args)
+        results = map(_parse, sents)
+    else:
+        if mode == 'thread':
+            pool = multiprocessing.pool.ThreadPool(workers, _init_worker, init_args)
+        else:
+            pool = multiprocessing.Pool(workers, _init_worker, init_args)
+        results = pool.imap_unordered(_parse, sents, chunksize=16)
+
+    latencies = {}
+    tokens = 0
+    worker_rss = {}
+    workers_pss = None
+    started = time.time()
+    try:
+        for n_tokens, latency, pid, rss in results:
+            tokens += n_tokens
+            latencies.setdefault(bucket_name(n_tokens), []).append(latency)
+            worker_rss[pid] = rss
+        if mode == 'process':
+            # workers are still alive; shared pages are split between
+            # processes in PSS, so the sum is not inflated
+            pss = [process_memory(pid)['pss'] for pid in worker_rss]
+            workers_pss = sum(pss) if None not in pss else None
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    wall_time = time.time() - started
+
+    buckets = {}
+    for name, values in latencies.items():
+        buckets[name] = {'sentences': len(values)}
+        for q in PERCENTILES:
+            buckets[name]['p%d' % q] = percentile(values, q)
+
+    res = {
+        'sentences': len(sents),
+        'tokens': tokens,
+        'wall_time': wall_time,
+        'tokens_per_sec': tokens / wall_time if wall_time else 0.0,
+        'buckets': buckets,
+        'peak_rss': peak_rss(),
+    }
+    if mode == 'process':
+        # peak RSS of each worker includes pages shared with the parent,
+        # so per-worker values are reported, not their sum
+        rss = [value for value in worker_rss.values() if value is not None]
+        res['workers_peak_rss'] = {
+            'max': max(rss) if rss else None,
+            'mean': sum(rss) / len(rss) if rss else None,
+        }
+        res['workers_pss'] = workers_pss
+    return res
+
+
+def format_results(results):
+    lines = [
+        "mode: %s, workers: %d" % (results['mode'], results['workers']),
+        "sentences: %d, tokens: %d" % (results['sentences'], results['tokens']),
+        "tokens/sec: %0.1f" % results['tokens_per_sec'],
+        "peak RSS: %s" % _format_rss(results['peak_rss']),
+    ]
+    if 'workers_peak_rss' in results:
+        lines.append("worker peak RSS: max %s, mean %s" % (
+            _format_rss(results['workers_peak_rss']['max']),
+            _format_rss(results['workers_peak_rss']['mean'])))
+        lines.append("workers PSS: %s" % _format_rss(results['workers_pss']))
+    lines.append("")
+    lines.append("%-8s %9s" % ("length", "sentences") +
+                 "".join(" %8s" % ("p%d, ms" % q) for q in PERCENTILES))
+    for name in sorted(results['buckets'], key=_bucket_key):
+        bucket = results['buckets'][name]
+        lines.append("%-8s %9d" % (name, bucket['sentences']) + "".join(
+            " %8.2f" % (bucket['p%d' % q] * 1000) for q in PERCENTILES))
+    return "\n".join(lines)
+
+
+def compare(results, baseline, max_regression):
+    """
+    Compare ``results`` to ``baseline``; return a list of report lines
+    and a flag which is True if there is a regression
+    larger than ``max_regression``.
+    """
+    regressed = False
+    lines = []
+
+    ratio = _ratio(results['tokens_per_sec'], baseline['tokens_per_sec'])
+    bad = ratio is not None and ratio < 1 - max_regression
+    regressed |= bad
+    lines.append("tokens/sec: %0.1f vs %0.1f (%s)%s" % (
+        results['tokens_per_sec'], baseline['tokens_per_sec'],
+        _format_ratio(ratio), "  REGRESSION" if bad else ""))
+
+    for name in sorted(results['buckets'], key=_bucket_key):
+        if name not in baseline['buckets']:
+            continue
+        new, old = results['buckets'][name]['p95'], baseline['buckets'][name]['p95']
+        ratio = _ratio(new, old)
+        bad = ratio is not None and ratio > 1 + max_regression
+        regressed |= bad
+        lines.append("p95 %-8s %0.2fms vs %0.2fms (%s)%s" % (
+            name, new * 1000, old * 1000, _format_ratio(ratio),
+            "  REGRESSION" if bad else ""))
+    return lines, regressed
+
+
+def _ratio(new, old):
+    return new / old if old else None
+
+
+def _format_ratio(ratio):
+    return '-' if ratio is None else "x%0.2f" % ratio
+
+
+def _format_rss(value):
+    return '-' if value is None else "%0.1f MB" % (value / 2**20)
+
+
+def _bucket_key(name):
+    return int(name.split('-')[0].rstrip('+'))
+
+
+# each thread (or process) has its own model: partial taggers
+# are not safe to share between threads
+_local = threading.local()
+
+
+def _init_worker(model_path, no_cache):
+    if is_bundle(model_path):
+        disambiguator = load_bundle(model_path)
+    else:
+        with open(model_path, 'rb') as f:
+            disambiguator = pickle.load(f)
+    if no_cache:
+        disambiguator.cache = None
+    _local.disambiguator = disambiguator
+
+
+def _parse(tokens):
+    start = time.time()
+    _local.disambiguator.parse(tokens)
+    latency = time.time() - start
+    return len(tokens), latency, multiprocessing.current_process().pid, peak_rss()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Bitmask encoding of grammemes.
+
+Each grammeme is assigned a bit when it is first seen, so a set of
+grammemes is an integer. Tag masks and lookup tables (mask -> sorted
+grammeme names, mask -> grammeme pairs) are cached; there are only
+a few thousand distinct tags in OpenCorpora dictionaries, so the
+caches stay small.
+
+Bit assignment is process-local; masks shouldn't be pickled.
+New bits are assigned under a lock, so the registry can be used
+from several threads.
+"""
+from __future__ import absolute_import
+import threading
+
+
+class GrammemeBits(object):
+    def __init__(self):
+        self._bits = {}
+        self._lock = threading.Lock()
+        self._tag_masks = {}
+        self._names = {0: ()}
+        self._pairs = {0: ()}
+
+    def bit(self, grammeme):
+        try:
+            return self._bits[grammeme]
+        except KeyError:
+            with self._lock:
+                bit = self._bits.get(grammeme)
+                if bit is None:
+                    bit = self._bits[grammeme] = 1 << len(self._bits)
+                return bit
+
+    def mask(self, grammemes):
+        mask = 0
+        for grammeme in grammemes:
+            mask |= self.bit(grammeme)
+        return mask
+
+    def tag_mask(self, tag):
+        try:
+            return self._tag_masks[tag]
+        except KeyError:
+            mask = self._tag_masks[tag] = self.mask(tag._grammemes_tuple)
+            return mask
+
+    def names(self, mask):
+        """ Sorted tuple of grammemes in ``mask`` """
+        try:
+            return self._names[mask]
+        except KeyError:
+            with self._lock:
+                bits = list(self._bits.items())
+            names = self._names[mask] = tuple(sorted(
+                grammeme for grammeme, bit in bits if mask & bit
+            ))
+            return names
+
+    def pairs(self, mask):
+        """ Tuple of "grammeme1,grammeme2" strings for all pairs in ``mask`` """
+        try:
+            return self._pairs[mask]
+        except KeyError:
+            names = self.names(mask)
+            pairs = self._pairs[mask] = tuple(
+                ",".join([gr1, gr2])
+                for idx, gr1 in enumerate(names)
+                for gr2 in names[idx+1:]
+            )
+            return pairs
+
+
+GRAMMEME_BITS = GrammemeBits()
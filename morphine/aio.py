@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio front-end for :class:`~morphine.basetagger.Disambiguator`.
+
+Sentences submitted from coroutines are put into a queue and grouped into
+micro-batches; each batch is parsed on an executor, so the event loop
+is never blocked by CRF inference. This module requires Python 3.
+"""
+from __future__ import absolute_import
+import asyncio
+import concurrent.futures
+
+
+class BatchStats(object):
+    """
+    Counters for tuning micro-batching parameters. All times are in seconds.
+
+    * ``queue_depth`` - number of sentences waiting in the queue right now;
+    * ``max_queue_depth`` - the largest queue depth seen;
+    * ``batches`` / ``sentences`` - number of processed batches and sentences;
+    * ``batch_sizes`` - a histogram ``{batch size: number of batches}``;
+    * ``total_wait`` / ``max_wait`` - time sentences spent in the queue
+      before their batch started;
+    * ``total_run`` / ``max_run`` - time spent parsing batches.
+    """
+    def __init__(self):
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.batches = 0
+        self.sentences = 0
+        self.batch_sizes = {}
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+
+    @property
+    def mean_batch_size(self):
+        return self.sentences / self.batches if self.batches else 0.0
+
+    @property
+    def mean_wait(self):
+        return self.total_wait / self.sentences if self.sentences else 0.0
+
+    def as_dict(self):
+        dct = dict(self.__dict__)
+        dct['batch_sizes'] = dict(self.batch_sizes)
+        dct['mean_batch_size'] = self.mean_batch_size
+        dct['mean_wait'] = self.mean_wait
+        return dct
+
+    def _record_batch(self, waits, run_time):
+        size = len(waits)
+        self.batches += 1
+        self.sentences += size
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+        self.total_wait += sum(waits)
+        self.max_wait = max(self.max_wait, max(waits))
+        self.total_run += run_time
+        self.max_run = max(self.max_run, run_time)
+
+
+class AsyncDisambiguator(object):
+    """
+    Coroutine-friendly wrapper for a Disambiguator::
+
+        async with AsyncDisambiguator(disambiguator) as adis:
+            parses = await adis.parse(tokens)
+
+    Parameters
+    ----------
+
+    disambiguator : Disambiguator
+        An object with ``parse(tokens)`` method.
+
+    max_batch_size : int
+        Maximum number of sentences in a single batch.
+
+    max_wait : float
+        Maximum time (in seconds) the first sentence of a batch waits
+        for other sentences to arrive. Lower values reduce latency
+        under low load; higher values produce larger batches.
+
+    executor : concurrent.futures.Executor, optional
+        Executor to run batches on. By default a single-thread executor
+        is created and owned by the wrapper. Only one batch is processed
+        at a time because pycrfsuite taggers are not thread-safe;
+        sentences arriving while a batch is running form the next batch.
+    """
+    def __init__(self, disambiguator, max_batch_size=32, max_wait=0.002,
+                 executor=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive")
+        self.disambiguator = disambiguator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+        self.stats = BatchStats()
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    async def parse(self, tokens):
+        """ Parse a single sentence; return the same as Disambiguator.parse """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((tokens, future, self._loop.time()))
+        self._update_queue_depth()
+        return await future
+
+    async def parse_sents(self, sents):
+        return list(await asyncio.gather(*[self.parse(s) for s in sents]))
+
+    async def close(self):
+        """ Stop the batching task and release the executor """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                tokens, future, enqueued = self._queue.get_nowait()
+                if not future.done():
+                    future.cancel()
+            self._update_queue_depth()
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        self._ensure_started()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _ensure_started(self):
+        if self._worker is None:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            self._worker = self._loop.create_task(self._process_batches())
+
+    def _update_queue_depth(self):
+        depth = self._queue.qsize()
+        self.stats.queue_depth = depth
+        if depth > self.stats.max_queue_depth:
+            self.stats.max_queue_depth = depth
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self._update_queue_depth()
+        return batch
+
+    async def _process_batches(self):
+        while True:
+            batch = await self._next_batch()
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = self._loop.time()
+            try:
+                results = await self._loop.run_in_executor(
+                    self.executor, _parse_batch, self.disambiguator,
+                    [tokens for tokens, future, enqueued in batch]
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # e.g. the executor is shut down; fail this batch,
+                # but keep serving the queue
+                for tokens, future, enqueued in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats._record_batch(
+                waits=[started - enqueued for tokens, future, enqueued in batch],
+                run_time=self._loop.time() - started,
+            )
+
+            for (tokens, future, enqueued), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+
+def _parse_batch(disambiguator, sents):
+    # Errors are returned per sentence, so that a bad sentence
+    # doesn't fail the whole batch.
+    results = []
+    for tokens in sents:
+        try:
+            results.append((True, disambiguator.parse(tokens)))
+        except Exception as e:
+            results.append((False, e))
+    return results
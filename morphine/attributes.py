@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Attribute vocabulary pruning.
+
+crfsuite turns each feature dict into a set of attributes:
+``{'token_lower': 'гуси'}`` becomes ``token_lower:гуси`` attribute,
+``{'Grammeme': {'NOUN': 1.0}}`` becomes ``Grammeme:NOUN`` and
+``{'bias': 1.0}`` becomes ``bias``. Rare attributes make trainer memory
+and model size grow but rarely help; a whitelist of frequent attributes
+can be built from training data::
+
+    >>> X = [[{'bias': 1.0, 'token_lower': 'a'}, {'bias': 1.0, 'token_lower': 'b'}],
+    ...      [{'bias': 1.0, 'token_lower': 'a'}]]
+    >>> whitelist = build_whitelist(X, min_count=2)
+    >>> sorted(whitelist)
+    ['bias', 'token_lower:a']
+    >>> filter_features({'bias': 1.0, 'token_lower': 'b'}, whitelist)
+    {'bias': 1.0}
+
+See also :meth:`~morphine.feature_extractor.FeatureExtractor.prune_attributes`.
+"""
+from __future__ import absolute_import
+from collections import Counter
+
+import pycrfsuite
+import six
+
+
+def iter_attributes(feature_dict):
+    """
+    Yield ``(key, attribute)`` pairs for all attributes of a feature dict.
+    Nested dicts and lists of strings are flattened the same way
+    pycrfsuite does it::
+
+        >>> sorted(attr for key, attr in iter_attributes(
+        ...     {'a': {'b': {'c': 1.0}, 'd': 'x'}, 'e': ['y']}))
+        ['a:b:c', 'a:d:x', 'e:y']
+
+    """
+    for key, value in feature_dict.items():
+        for attr in _flatten(key, value):
+            yield key, attr
+
+
+def _flatten(prefix, value):
+    if isinstance(value, dict):
+        for subkey, subvalue in value.items():
+            for attr in _flatten("%s:%s" % (prefix, subkey), subvalue):
+                yield attr
+    elif isinstance(value, six.string_types):
+        yield "%s:%s" % (prefix, value)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            yield "%s:%s" % (prefix, item)
+    else:
+        yield prefix
+
+
+def count_attributes(X):
+    """
+    Count attributes in ``X`` (a list of lists of feature dicts
+    or of ``pycrfsuite.ItemSequence`` objects)
+    """
+    counts = Counter()
+    for xseq in X:
+        if isinstance(xseq, pycrfsuite.ItemSequence):
+            # items are already flattened: {attribute: weight}
+            xseq = xseq.items()
+        for feature_dict in xseq:
+            counts.update(attr for key, attr in iter_attributes(feature_dict))
+    return counts
+
+
+def build_whitelist(X, min_count=1, top_n=None):
+    """
+    Return a frozenset of attributes from ``X`` which occur at least
+    ``min_count`` times; if ``top_n`` is set, only ``top_n``
+    most frequent of them are kept.
+    """
+    counts = count_attributes(X)
+    frequent = [(attr, count) for attr, count in counts.most_common()
+                if count >= min_count]
+    if top_n is not None:
+        frequent = frequent[:top_n]
+    return frozenset(attr for attr, count in frequent)
+
+
+def whitelist_keys(whitelist):
+    """
+    Return a set of possible feature dict keys which have attributes
+    in ``whitelist`` (keys may contain ':', so all prefixes are included)::
+
+        >>> sorted(whitelist_keys({'bias', 'Grammeme:NOUN'}))
+        ['Grammeme', 'Grammeme:NOUN', 'bias']
+
+    """
+    keys = set()
+    for attr in whitelist:
+        keys.add(attr)
+        pos = attr.find(':')
+        while pos != -1:
+            keys.add(attr[:pos])
+            pos = attr.find(':', pos + 1)
+    return keys
+
+
+def filter_features(feature_dict, whitelist):
+    """ Return a copy of ``feature_dict`` with whitelisted attributes only """
+    res = {}
+    for key, value in feature_dict.items():
+        value = _filter_value(key, value, whitelist)
+        if value is not None:
+            res[key] = value
+    return res
+
+
+def _filter_value(prefix, value, whitelist):
+    # return None if no attributes of the value are whitelisted
+    if isinstance(value, dict):
+        filtered = {}
+        for subkey, subvalue in value.items():
+            subvalue = _filter_value("%s:%s" % (prefix, subkey), subvalue, whitelist)
+            if subvalue is not None:
+                filtered[subkey] = subvalue
+        return filtered or None
+    elif isinstance(value, six.string_types):
+        return value if "%s:%s" % (prefix, value) in whitelist else None
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = [item for item in value if "%s:%s" % (prefix, item) in whitelist]
+        return type(value)(items) if items else None
+    return value if prefix in whitelist else None
@@ -1,13 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 import abc
-from operator import mul, add
+import math
+import time
+from collections import Counter
 
 import six
-from six.moves import reduce
 from pymorphy2.tokenizers import simple_word_tokenize
 
 from morphine.feature_extractor import FeatureExtractor
+from morphine.compact import CompactParses
 
 
 def tokenize_if_needed(tokens):
@@ -21,49 +23,314 @@ class Disambiguator(object):
     Combine several "partial" taggers (e.g. taggers for detecting
     word case, POS tag, number, gender) to assign probabilities
     to pymorphy2 parses.
+
+    If a :class:`~morphine.cache.SentenceCache` is passed as ``cache``,
+    results of :meth:`parse` are cached by a tuple of tokens and returned
+    as immutable tuples of tuples. The cache is cleared when
+    ``partial_taggers``, ``threshold``, ``weights`` or ``temperature``
+    change.
+
+    Probabilities from partial taggers are multiplied in log space;
+    a log probability from i-th tagger is multiplied by ``weights[i]``
+    (all weights are 1 by default), and the sum is divided by
+    ``temperature`` before normalization. Temperature above 1 makes
+    scores flatter, below 1 - sharper. Parses with scores below
+    ``threshold`` are not returned.
+
+    If a :class:`~morphine.store.ParseStore` is passed as ``store``,
+    parses of words are looked up in the store before calling
+    ``morph.parse``; feature extractors of partial taggers
+    with token features precomputed in the store (by an extractor
+    with the same token features) start using it as well.
+
+    :meth:`parse` and :meth:`parse_sents` accept an optional ``deadline``
+    (an absolute ``time.time()`` value). Before running a partial tagger
+    its cost is estimated from previous calls; if the deadline can't be
+    met, the remaining taggers are skipped and pymorphy2 scores
+    are used instead, the way :class:`morphine.unigram_model.Tagger` does.
+    Results are then :class:`ParseResult` lists with a ``path`` attribute:
+
+    * 'crf' - all partial taggers were used;
+    * 'partial' - some taggers were used, pymorphy2 scores
+      replace the rest;
+    * 'unigram' - only pymorphy2 scores were used.
+
+    ``path_counts`` counts results by path; see also :attr:`fallback_rate`.
+
+    If ``timings`` is set to a dict, seconds spent on tokenization and
+    morphological analysis (``'morph'``) and on partial taggers
+    (``'disambiguate'``) are added to it by :meth:`parse` and other
+    parse methods; cached results take no time in either stage.
     """
-    def __init__(self, morph, partial_taggers, threshold=0):
+    weights = None
+    temperature = 1.0
+    timings = None
+
+    # smoothing factor for exponentially weighted tagger cost estimates
+    cost_smoothing = 0.3
+
+    def __init__(self, morph, partial_taggers, threshold=0, cache=None,
+                 store=None, weights=None, temperature=1.0):
+        if temperature <= 0:
+            raise ValueError("temperature must be positive")
         self.morph = morph
         self.partial_taggers = partial_taggers
         self.threshold = threshold
+        self.weights = weights
+        self.temperature = temperature
+        self.cache = cache
+        self.store = store
+        self.path_counts = Counter()
+        self._costs = {}
+        if store is not None:
+            for tagger in partial_taggers:
+                signature = store.token_features_signature(type(tagger.fe).__name__)
+                if signature == tagger.fe.token_features_signature():
+                    tagger.fe.use_store(store)
 
-    def parse_sents(self, sents):
-        return [self.parse(s) for s in sents]
+    def parse_sents(self, sents, deadline=None):
+        return [self.parse(s, deadline) for s in sents]
 
-    def parse(self, tokens):
+    def parse(self, tokens, deadline=None):
+        if deadline is not None:
+            return self._parse_with_deadline(tokens, deadline)
+        cache = getattr(self, 'cache', None)
+        if cache is not None:
+            return self._parse_cached(cache, tokens)
         tokens, parsed_tokens = self._tokenize_and_parse(tokens)
-        token_parse_probs = list(zip(*[
-            tagger.predict_proba_single(tokens, parsed_tokens)
-            for tagger in self.partial_taggers
-        ]))
+        return self._disambiguate(tokens, parsed_tokens)
+
+    def parse_incremental(self, tokens=()):
+        """
+        Return a :class:`~morphine.incremental.IncrementalParse`:
+        a sentence which can be edited and re-disambiguated without
+        reprocessing unchanged tokens.
+        """
+        from morphine.incremental import IncrementalParse
+        return IncrementalParse(self, tokens)
+
+    @property
+    def fallback_rate(self):
+        """
+        A fraction of results of :meth:`parse` calls with a deadline
+        which didn't use all partial taggers.
+        """
+        counts = getattr(self, 'path_counts', None)
+        total = sum(counts.values()) if counts else 0
+        if not total:
+            return 0.0
+        return (counts['partial'] + counts['unigram']) / float(total)
+
+    def _parse_with_deadline(self, tokens, deadline):
+        cache = getattr(self, 'cache', None)
+        key = None
+        if cache is not None:
+            self._validate_cache(cache)
+            key = tokens = tuple(tokenize_if_needed(tokens))
+            res = cache.get(key)
+            if res is not None:
+                self._count_path('crf')
+                return ParseResult(res, 'crf')
+
+        tokens, parsed_tokens = self._tokenize_and_parse(tokens)
+        tagger_probs = []
+        started = time.time()
+        for tagger in self.partial_taggers:
+            if not self._can_run(tagger, len(tokens), deadline):
+                break
+            start = time.time()
+            tagger_probs.append(tagger.predict_proba_single(tokens, parsed_tokens))
+            self._update_cost(tagger, time.time() - start, len(tokens))
+        if self.timings is not None:
+            self._add_timing('disambiguate', started)
+
+        if len(tagger_probs) == len(self.partial_taggers):
+            path = 'crf'
+            token_probs = [self._combine_marginals(parse_probs)
+                           for parse_probs in zip(*tagger_probs)]
+        else:
+            path = 'partial' if tagger_probs else 'unigram'
+            token_probs = self._fallback_probs(parsed_tokens, tagger_probs)
+
+        res = ParseResult(self._scored_parses(parsed_tokens, token_probs), path)
+        if path == 'crf' and cache is not None:
+            cache.put(key, tuple(map(tuple, res)))
+        self._count_path(path)
+        return res
+
+    def _fallback_probs(self, parsed_tokens, tagger_probs):
+        # pymorphy2 scores stand in for all skipped taggers at once
+        weights = self.weights or [1.0] * len(self.partial_taggers)
+        weights = list(weights[:len(tagger_probs)]) + [1.0]
+        unigram_probs = [[p.score for p in parses] for parses in parsed_tokens]
+        return [
+            combine_log_probs(parse_probs, weights, self.temperature)
+            for parse_probs in zip(*(tagger_probs + [unigram_probs]))
+        ]
+
+    def _can_run(self, tagger, n_tokens, deadline):
+        cost = self._tagger_costs().get(tagger)
+        if cost is None:
+            # no estimate yet; run the tagger if there is time left
+            return time.time() < deadline
+        return time.time() + cost * n_tokens <= deadline
+
+    def _update_cost(self, tagger, elapsed, n_tokens):
+        costs = self._tagger_costs()
+        cost = elapsed / max(n_tokens, 1)
+        old = costs.get(tagger)
+        if old is not None:
+            cost = old + self.cost_smoothing * (cost - old)
+        costs[tagger] = cost
+
+    def _tagger_costs(self):
+        # {tagger: estimated seconds per token}
+        if '_costs' not in self.__dict__:
+            self._costs = {}
+        return self._costs
+
+    def _count_path(self, path):
+        if 'path_counts' not in self.__dict__:
+            self.path_counts = Counter()
+        self.path_counts[path] += 1
+
+    def _validate_cache(self, cache):
+        cache.validate(
+            (self.threshold, self.temperature,
+             tuple(self.weights) if self.weights is not None else None) +
+            tuple(self.partial_taggers)
+        )
 
+    def _parse_cached(self, cache, tokens):
+        self._validate_cache(cache)
+        key = tuple(tokenize_if_needed(tokens))
+        res = cache.get(key)
+        if res is None:
+            tokens, parsed_tokens = self._tokenize_and_parse(key)
+            res = tuple(map(tuple, self._disambiguate(tokens, parsed_tokens)))
+            cache.put(key, res)
+        return res
+
+    def parse_sents_compact(self, sents):
+        return [self.parse_compact(s) for s in sents]
+
+    def parse_compact(self, tokens):
+        """
+        Same as :meth:`parse`, but return a
+        :class:`~morphine.compact.CompactParses` instance which stores
+        parse indices and scores in arrays; ``Parse`` objects are
+        only created on demand.
+        """
+        tokens, parsed_tokens = self._tokenize_and_parse(tokens)
+        token_probs = self._token_probs(tokens, parsed_tokens)
+        return CompactParses.from_probs(tokens, parsed_tokens, token_probs,
+                                        self.threshold)
+
+    def _disambiguate(self, tokens, parsed_tokens):
+        token_probs = self._token_probs(tokens, parsed_tokens)
+        return self._scored_parses(parsed_tokens, token_probs)
+
+    def _scored_parses(self, parsed_tokens, token_probs):
+        threshold = self.threshold
         res = []
-        for parses, parse_probs in zip(parsed_tokens, token_parse_probs):
-            probs = self._combine_marginals(parse_probs)
-            scored_parses = [
-                p._replace(score=prob) for p, prob in zip(parses, probs)
-                if prob >= self.threshold
+        for parses, probs in zip(parsed_tokens, token_probs):
+            scored = [
+                (prob, idx) for idx, prob in enumerate(probs)
+                if prob >= threshold
             ]
-            scored_parses.sort(key=lambda p: p.score, reverse=True)
-            res.append(scored_parses)
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            res.append([parses[idx]._replace(score=prob) for prob, idx in scored])
+        return res
 
+    def _token_probs(self, tokens, parsed_tokens):
+        start = time.time() if self.timings is not None else None
+        token_parse_probs = zip(*[
+            tagger.predict_proba_single(tokens, parsed_tokens)
+            for tagger in self.partial_taggers
+        ])
+        res = [self._combine_marginals(parse_probs)
+               for parse_probs in token_parse_probs]
+        if start is not None:
+            self._add_timing('disambiguate', start)
         return res
 
     def _tokenize_and_parse(self, sent_text):
+        start = time.time() if self.timings is not None else None
         tokens = tokenize_if_needed(sent_text)
-        parsed_tokens = [self.morph.parse(t) for t in tokens]
+        store = getattr(self, 'store', None)
+        if store is None:
+            parsed_tokens = [self.morph.parse(t) for t in tokens]
+        else:
+            parsed_tokens = [store.parse(t) or self.morph.parse(t) for t in tokens]
+        if start is not None:
+            self._add_timing('morph', start)
         return tokens, parsed_tokens
 
+    def _add_timing(self, stage, start):
+        timings = self.timings
+        timings[stage] = timings.get(stage, 0.0) + time.time() - start
+
     def _combine_marginals(self, parse_marginals):
-        # by default, multiply probabilities
-        marginals = [reduce(mul, p) for p in zip(*parse_marginals)]
+        return combine_log_probs(parse_marginals, self.weights, self.temperature)
 
-        # normalize to make them sum to 1
-        k = sum(marginals)
-        if k == 0:
-            return [0.0] * len(marginals)
-        else:
-            return [m/k for m in marginals]
+
+class ParseResult(list):
+    """
+    A list of scored parses for each token, returned by
+    :meth:`Disambiguator.parse` when a deadline is passed.
+    ``path`` is 'crf', 'partial' or 'unigram'.
+    """
+    def __init__(self, token_parses, path):
+        super(ParseResult, self).__init__(token_parses)
+        self.path = path
+
+
+def combine_log_probs(tagger_probs, weights=None, temperature=1.0):
+    """
+    Combine probabilities of parses predicted by several taggers.
+    ``tagger_probs`` is a list of per-tagger lists of parse probabilities.
+    Probabilities are multiplied (in log space, so many small values
+    don't underflow) and normalized to sum to 1::
+
+        >>> def rounded(probs): return [float('%.6g' % p) for p in probs]
+        >>> rounded(combine_log_probs([[0.5, 0.5], [0.9, 0.1]]))
+        [0.9, 0.1]
+        >>> rounded(combine_log_probs([[1e-200, 1e-210]] * 3))
+        [1.0, 1e-30]
+        >>> combine_log_probs([[0.5, 0.5], [0.9, 0.1]], weights=[1, 0])
+        [0.5, 0.5]
+        >>> combine_log_probs([[0.0, 0.0]])
+        [0.0, 0.0]
+
+    Log probability from i-th tagger is multiplied by ``weights[i]``;
+    the result is divided by ``temperature``, which must be positive.
+    """
+    if temperature <= 0:
+        raise ValueError("temperature must be positive")
+    if weights is None:
+        weights = [1.0] * len(tagger_probs)
+    log_scores = []
+    for probs in zip(*tagger_probs):
+        score = 0.0
+        for weight, prob in zip(weights, probs):
+            if not weight:
+                continue
+            if prob <= 0:
+                score = None
+                break
+            score += weight * math.log(prob)
+        log_scores.append(score if score is None else score / temperature)
+
+    finite = [score for score in log_scores if score is not None]
+    if not finite:
+        return [0.0] * len(log_scores)
+    max_score = max(finite)
+    scores = [
+        0.0 if score is None else math.exp(score - max_score)
+        for score in log_scores
+    ]
+    k = sum(scores)
+    return [score / k for score in scores]
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -87,14 +354,29 @@ class PartialTagger(object):
         pass
 
     def predict_proba_single(self, tokens, parsed_tokens):
+        xseq = self._transform_single(tokens, parsed_tokens)
+        marginals = self.crf.predict_marginals_single(xseq)
+        return self._parse_probs(parsed_tokens, marginals)
+
+    def predict_with_proba_single(self, tokens, parsed_tokens):
+        """
+        Same as :meth:`predict_proba_single`, but also return the best
+        label sequence and its probability; CRF inference is run once.
+        Return ``(labels, probability, parse_probs)`` tuple.
+        """
+        xseq = self._transform_single(tokens, parsed_tokens)
+        labels, probability, marginals = self.crf.predict_with_marginals_single(xseq)
+        return labels, probability, self._parse_probs(parsed_tokens, marginals)
+
+    def _transform_single(self, tokens, parsed_tokens):
         if self.crf is None:
             raise ValueError("Tagger is not trained")
-
-        xseq = self.fe.transform_single(
+        return self.fe.transform_single(
             self._prepared_tokens(tokens),
             parsed_tokens
         )
-        marginals = self.crf.predict_marginals_single(xseq)
+
+    def _parse_probs(self, parsed_tokens, marginals):
         return [
             [probs[self.outval(p.tag)] for p in parses]
             for parses, probs in zip(parsed_tokens, marginals)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Single-file model bundle for :class:`~morphine.basetagger.Disambiguator`.
+
+A pickled Disambiguator embeds crfsuite models into pickled
+``FileResource`` objects, and unpickling writes each model to a temporary
+file to open it. A bundle stores the same data as separate sections
+of one file instead::
+
+    save_bundle(disambiguator, 'model.morphine')
+    disambiguator = load_bundle('model.morphine')
+
+File layout: a fixed header (magic, format version, length of JSON
+metadata), JSON metadata, then sections aligned to :data:`ALIGNMENT`
+bytes. Each partial tagger has two sections: the pickled tagger with
+its feature extractor and CRF settings (but without the model)
+and the binary crfsuite model. Label sets of the models are stored
+in the metadata. The file is memory-mapped when loading; crfsuite
+models are opened from memory, without temporary files.
+"""
+from __future__ import absolute_import
+import copy
+import io
+import json
+import mmap
+import pickle
+import struct
+
+MAGIC = b'MORPHINE-BUNDLE\x00'
+VERSION = 1
+ALIGNMENT = 4096
+
+_HEADER = struct.Struct('<16sII')
+
+
+def save_bundle(disambiguator, path):
+    """ Save a trained Disambiguator to ``path`` """
+    from morphine._fileresource import FileResource
+
+    sections = [('morph', pickle.dumps(disambiguator.morph, 2))]
+    taggers = []
+    for idx, tagger in enumerate(disambiguator.partial_taggers):
+        if tagger.crf is None:
+            raise ValueError("Tagger %r is not trained" % tagger)
+
+        crf = copy.copy(tagger.crf)
+        crf._tagger = None
+        crf._model_data = None
+        crf.modelfile = FileResource(suffix=".crfsuite", prefix="model")
+        stripped = copy.copy(tagger)
+        stripped.crf = crf
+
+        tagger_section = 'tagger:%d' % idx
+        model_section = 'model:%d' % idx
+        sections.append((tagger_section, pickle.dumps(stripped, 2)))
+        sections.append((model_section, tagger.crf.model_data()))
+        taggers.append({
+            'tagger': tagger_section,
+            'model': model_section,
+            'labels': sorted(tagger.crf.tagger.labels()),
+        })
+
+    meta = {
+        'disambiguator': {
+            'threshold': disambiguator.threshold,
+            'weights': getattr(disambiguator, 'weights', None),
+            'temperature': getattr(disambiguator, 'temperature', 1.0),
+        },
+        'taggers': taggers,
+        'sections': [[name, 0, len(data)] for name, data in sections],
+    }
+    # section offsets don't change the metadata length much;
+    # reserve some space for them
+    meta_length = len(json.dumps(meta).encode('utf8')) + 24 * len(sections)
+
+    offset = _HEADER.size + meta_length
+    for section in meta['sections']:
+        offset = _align(offset)
+        section[1] = offset
+        offset += section[2]
+
+    meta_bytes = json.dumps(meta).encode('utf8')
+    meta_bytes += b' ' * (meta_length - len(meta_bytes))
+
+    with io.open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, meta_length))
+        f.write(meta_bytes)
+        for (name, data), (_, offset, length) in zip(sections, meta['sections']):
+            f.write(b'\x00' * (offset - f.tell()))
+            f.write(data)
+
+
+def load_bundle(path, morph=None):
+    """
+    Load a Disambiguator saved by :func:`save_bundle`.
+    Pass ``morph`` to use an existing pymorphy2.MorphAnalyzer instead
+    of the one stored in the bundle.
+    """
+    from morphine.basetagger import Disambiguator
+
+    with io.open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        meta = read_bundle_meta(buf, path)
+        sections = dict(
+            (name, (offset, length)) for name, offset, length in meta['sections']
+        )
+
+        def section(name):
+            offset, length = sections[name]
+            return buf[offset:offset + length]
+
+        if morph is None:
+            morph = pickle.loads(section('morph'))
+
+        taggers = []
+        for info in meta['taggers']:
+            tagger = pickle.loads(section(info['tagger']))
+            tagger.crf.load_model_data(section(info['model']))
+            taggers.append(tagger)
+    finally:
+        buf.close()
+
+    params = meta['disambiguator']
+    return Disambiguator(morph, taggers, **params)
+
+
+def is_bundle(path):
+    """ Return True if ``path`` is a bundle file """
+    with io.open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_bundle_meta(buf, path='bundle'):
+    """ Check the header of a bundle in ``buf`` and return its metadata """
+    if len(buf) < _HEADER.size:
+        raise ValueError("%s is not a morphine bundle" % path)
+    magic, version, meta_length = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("%s is not a morphine bundle" % path)
+    if version != VERSION:
+        raise ValueError("Unsupported bundle format version: %s" % version)
+    start = _HEADER.size
+    return json.loads(buf[start:start + meta_length].decode('utf8'))
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
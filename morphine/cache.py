@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division
+import sys
+from collections import OrderedDict
+
+
+class SentenceCache(object):
+    """
+    LRU cache for sentence disambiguation results, keyed by
+    a tuple of tokens. Pass it to :class:`~morphine.basetagger.Disambiguator`::
+
+        >>> cache = SentenceCache(maxsize=10000, max_bytes=64 * 2**20)
+        >>> cache.info()['hit_rate']
+        0.0
+
+    Parameters
+    ----------
+
+    maxsize : int, optional
+        Maximum number of cached sentences.
+
+    max_bytes : int, optional
+        Approximate memory limit for cached keys and values, in bytes.
+        Objects shared with pymorphy2 (tags) are not counted.
+
+    Cached values are stored and returned as is, so they must be
+    immutable; Disambiguator stores tuples of tuples of parses.
+    Cache contents is not pickled.
+    """
+    def __init__(self, maxsize=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._signature = None
+
+    def get(self, key):
+        """ Return the cached value for ``key`` or None """
+        try:
+            value, size = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data[key] = value, size  # move to the end
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self._data:
+            self.nbytes -= self._data.pop(key)[1]
+        size = _estimate_size(key, value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._data[key] = value, size
+        self.nbytes += size
+        self._evict()
+
+    def validate(self, signature):
+        """
+        Clear the cache if ``signature`` (a tuple describing what cached
+        results depend on) differs from the one passed previously.
+        """
+        old = self._signature
+        if old is not None and (
+                len(old) != len(signature) or
+                any(a is not b and a != b for a, b in zip(old, signature))):
+            self.clear()
+            self.invalidations += 1
+        self._signature = signature
+
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'size': len(self),
+            'nbytes': self.nbytes,
+            'maxsize': self.maxsize,
+            'max_bytes': self.max_bytes,
+        }
+
+    def _evict(self):
+        while self._data and (
+                (self.maxsize is not None and len(self._data) > self.maxsize) or
+                (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            key, (value, size) = self._data.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def __getstate__(self):
+        dct = self.__dict__.copy()
+        dct['_data'] = OrderedDict()
+        dct['nbytes'] = 0
+        dct['_signature'] = None
+        return dct
+
+
+def _estimate_size(key, value):
+    size = sys.getsizeof(key) + sum(sys.getsizeof(tok) for tok in key)
+    size += sys.getsizeof(value)
+    for token_parses in value:
+        size += sys.getsizeof(token_parses)
+        size += sum(sys.getsizeof(p) for p in token_parses)
+    return size
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
-from pymorphy2 import MorphAnalyzer
 from pymorphy2.tagset import OpencorporaTag
 
 from morphine import features
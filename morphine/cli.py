@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+``morphine`` console command: disambiguate sentences in batch.
+
+Input is read from files (or stdin), one sentence per line. Lines are
+tokenized with pymorphy2 tokenizer unless ``--tokenized`` is passed,
+in which case tokens are separated by whitespace. Output formats:
+
+* ``tsv`` - one parse per line: sentence number, token number, token,
+  parse rank, tag, normal form and score; sentences are separated
+  by empty lines;
+* ``jsonl`` - one JSON object per sentence.
+
+A sentence number is the index of its input line (starting from 0 and
+counting lines of all input files), so output can be joined back to
+the input; empty lines produce no output, but they are counted.
+"""
+from __future__ import absolute_import, print_function, division
+import argparse
+import codecs
+import io
+import json
+import multiprocessing
+import pickle
+import sys
+import time
+
+from morphine.basetagger import tokenize_if_needed
+from morphine.bundle import is_bundle, load_bundle
+from morphine.utils import batches
+
+
+def get_parser():
+    p = argparse.ArgumentParser(
+        prog='morphine',
+        description="Disambiguate pymorphy2 parses using a trained model.",
+    )
+    p.add_argument('files', nargs='*', metavar='FILE',
+                   help="input files (default: stdin)")
+    p.add_argument('-m', '--model', required=True,
+                   help="pickled Disambiguator or a model bundle")
+    p.add_argument('-f', '--format', choices=['tsv', 'jsonl'], default='tsv',
+                   help="output format (default: %(default)s)")
+    p.add_argument('-o', '--output', help="output file (default: stdout)")
+    p.add_argument('--tokenized', action='store_true',
+                   help="input tokens are separated by whitespace")
+    p.add_argument('--top', type=int, default=1,
+                   help="number of parses to output per token; "
+                        "0 means all parses (default: %(default)s)")
+    p.add_argument('--threshold', type=float, default=None,
+                   help="drop parses with probability below this value "
+                        "(default: the value stored in the model)")
+    p.add_argument('-j', '--workers', type=int, default=1,
+                   help="number of worker processes (default: %(default)s)")
+    p.add_argument('--batch-size', type=int, default=64,
+                   help="number of sentences sent to a worker at once "
+                        "(default: %(default)s)")
+    p.add_argument('--stats', action='store_true',
+                   help="print throughput and per-stage timings "
+                        "to stderr at exit")
+    return p
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    started = time.time()
+
+    if args.output:
+        out = io.open(args.output, 'w', encoding='utf8')
+    else:
+        out = _text_stdout()
+
+    stats = Stats()
+    lines = _read_lines(args.files)
+    sent_batches = batches(lines, args.batch_size)
+    init_args = (args.model, args.threshold, args.tokenized)
+
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers, _init_worker, init_args)
+        results = pool.imap(_process_batch, sent_batches)
+    else:
+        pool = None
+        _init_worker(*init_args)
+        results = map(_process_batch, sent_batches)
+
+    try:
+        for batch_result, timings in results:
+            stats.add_timings(timings)
+            start = time.time()
+            for sent_num, tokens, parses in batch_result:
+                _write_sentence(out, args.format, sent_num, tokens, parses, args.top)
+                stats.sentences += 1
+                stats.tokens += len(tokens)
+            stats.add_timings({'output': time.time() - start})
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if args.output:
+            out.close()
+        else:
+            _release_std_stream(out)
+
+    if args.stats:
+        stats.wall_time = time.time() - started
+        stats.print_report(sys.stderr)
+
+
+class Stats(object):
+    """ Throughput and per-stage timing counters """
+    def __init__(self):
+        self.sentences = 0
+        self.tokens = 0
+        self.wall_time = 0.0
+        self.timings = {}
+
+    def add_timings(self, timings):
+        for stage, value in timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + value
+
+    def print_report(self, fp):
+        tps = self.tokens / self.wall_time if self.wall_time else 0.0
+        print("sentences: %d" % self.sentences, file=fp)
+        print("tokens: %d" % self.tokens, file=fp)
+        print("wall time: %0.3fs" % self.wall_time, file=fp)
+        print("tokens/sec: %0.1f" % tps, file=fp)
+        for stage in ['load', 'tokenize', 'morph', 'disambiguate', 'output']:
+            if stage in self.timings:
+                print("%s: %0.3fs" % (stage, self.timings[stage]), file=fp)
+
+
+_disambiguator = None
+_tokenized = False
+_load_time = None
+
+
+def _init_worker(model_path, threshold, tokenized):
+    global _disambiguator, _tokenized, _load_time
+    start = time.time()
+    if is_bundle(model_path):
+        _disambiguator = load_bundle(model_path)
+    else:
+        with open(model_path, 'rb') as f:
+            _disambiguator = pickle.load(f)
+    if threshold is not None:
+        _disambiguator.threshold = threshold
+    _tokenized = tokenized
+    _load_time = time.time() - start
+
+
+def _process_batch(lines):
+    global _load_time
+    # Disambiguator.parse adds 'morph' and 'disambiguate' timings
+    timings = {'tokenize': 0.0, 'morph': 0.0, 'disambiguate': 0.0}
+    if _load_time is not None:
+        # report model loading time once per process
+        timings['load'], _load_time = _load_time, None
+    _disambiguator.timings = timings
+
+    res = []
+    for sent_num, line in lines:
+        start = time.time()
+        tokens = line.split() if _tokenized else tokenize_if_needed(line)
+        timings['tokenize'] += time.time() - start
+        parses = _disambiguator.parse(tokens)
+        res.append((sent_num, tokens, [
+            [(str(p.tag), p.normal_form, p.score) for p in token_parses]
+            for token_parses in parses
+        ]))
+    return res, timings
+
+
+def _write_sentence(out, fmt, sent_num, tokens, parses, top):
+    if top:
+        parses = [token_parses[:top] for token_parses in parses]
+
+    if fmt == 'jsonl':
+        data = {'sentence': sent_num, 'tokens': [
+            {
+                'token': token,
+                'parses': [
+                    {'tag': tag, 'normal_form': normal_form, 'score': score}
+                    for tag, normal_form, score in token_parses
+                ]
+            }
+            for token, token_parses in zip(tokens, parses)
+        ]}
+        out.write(json.dumps(data, ensure_ascii=False))
+        out.write('\n')
+    else:
+        for tok_num, (token, token_parses) in enumerate(zip(tokens, parses)):
+            for rank, (tag, normal_form, score) in enumerate(token_parses):
+                out.write("%d\t%d\t%s\t%d\t%s\t%s\t%0.6f\n" % (
+                    sent_num, tok_num, token, rank, tag, normal_form, score
+                ))
+        out.write('\n')
+
+
+def _read_lines(files):
+    # yield (line index, line) tuples for non-empty lines
+    if not files:
+        files = ['-']
+    line_num = 0
+    for name in files:
+        if name == '-':
+            fp = _text_stdin()
+        else:
+            fp = io.open(name, encoding='utf8')
+        try:
+            for line in fp:
+                line = line.strip()
+                if line:
+                    yield line_num, line
+                line_num += 1
+        finally:
+            if name == '-':
+                _release_std_stream(fp)
+            else:
+                fp.close()
+
+
+def _text_stdin():
+    if hasattr(sys.stdin, 'buffer'):
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf8')
+    return codecs.getreader('utf8')(sys.stdin)
+
+
+def _release_std_stream(fp):
+    # don't let the wrapper close sys.stdin / sys.stdout when collected
+    if hasattr(fp, 'detach'):
+        fp.flush()
+        fp.detach()
+    else:
+        fp.flush()
+
+
+def _text_stdout():
+    if hasattr(sys.stdout, 'buffer'):
+        return io.TextIOWrapper(sys.stdout.buffer, encoding='utf8')
+    return codecs.getwriter('utf8')(sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from array import array
+
+
+class CompactParses(object):
+    """
+    Disambiguation result for a sentence stored in flat arrays:
+    for each token there is a run of parse indices (positions in the
+    original ``morph.parse(token)`` list) and float32 scores,
+    ordered by score (best first). Parses with scores below
+    the threshold are not stored.
+
+    pymorphy2 ``Parse`` objects are created only when they are requested::
+
+        >>> res = disambiguator.parse_compact(tokens)  # doctest: +SKIP
+        >>> res.best(0)                                # doctest: +SKIP
+        Parse(word='стали', tag=OpencorporaTag('VERB,perf,intr plur,past,indc'), ...)
+
+    Attributes
+    ----------
+
+    tokens : list of str
+        Sentence tokens.
+
+    parsed_tokens : list of lists
+        pymorphy2 parses of each token.
+
+    offsets : array of ints
+        Parses of token *i* are stored at ``offsets[i]:offsets[i+1]``
+        in ``indices`` and ``scores`` arrays.
+
+    indices : array of ints
+        Parse indices.
+
+    scores : array of floats
+        Parse scores (float32).
+    """
+    __slots__ = ['tokens', 'parsed_tokens', 'offsets', 'indices', 'scores']
+
+    def __init__(self, tokens, parsed_tokens, offsets, indices, scores):
+        self.tokens = tokens
+        self.parsed_tokens = parsed_tokens
+        self.offsets = offsets
+        self.indices = indices
+        self.scores = scores
+
+    @classmethod
+    def from_probs(cls, tokens, parsed_tokens, token_probs, threshold):
+        """
+        Build the result from per-token lists of parse probabilities.
+        """
+        offsets = array('I', [0])
+        indices = array('I')
+        scores = array('f')
+        for probs in token_probs:
+            order = sorted(range(len(probs)), key=probs.__getitem__, reverse=True)
+            for idx in order:
+                prob = probs[idx]
+                if prob < threshold:
+                    break
+                indices.append(idx)
+                scores.append(prob)
+            offsets.append(len(indices))
+        return cls(tokens, parsed_tokens, offsets, indices, scores)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def best_index(self, i):
+        """ Index of the best parse of i-th token, or -1 if there is none """
+        start, end = self.offsets[i], self.offsets[i+1]
+        return self.indices[start] if start < end else -1
+
+    def best_indices(self):
+        """ List of best parse indices for all tokens """
+        return [self.best_index(i) for i in range(len(self))]
+
+    def best(self, i):
+        """ The best Parse of i-th token, or None if there is none """
+        start, end = self.offsets[i], self.offsets[i+1]
+        if start == end:
+            return None
+        return self._parse(i, start)
+
+    def parses(self, i):
+        """ List of scored Parse objects of i-th token, best first """
+        return [self._parse(i, pos)
+                for pos in range(self.offsets[i], self.offsets[i+1])]
+
+    def to_parses(self):
+        """ Convert to the format returned by Disambiguator.parse """
+        return [self.parses(i) for i in range(len(self))]
+
+    def _parse(self, i, pos):
+        parse = self.parsed_tokens[i][self.indices[pos]]
+        return parse._replace(score=float(self.scores[pos]))
@@ -1,19 +1,149 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import io
+import json
+
+import six
 from six.moves import zip
-from tabulate import tabulate
-from tqdm import tqdm
 import pycrfsuite
 
 from morphine._fileresource import FileResource
 
 
+class StopTraining(Exception):
+    """
+    Raised by :class:`EarlyStopping` to stop training;
+    ``best_iteration`` is the iteration to keep.
+    """
+    def __init__(self, best_iteration):
+        super(StopTraining, self).__init__(
+            "Stopped early; best iteration is %s" % best_iteration)
+        self.best_iteration = best_iteration
+
+
+class EarlyStopping(object):
+    """
+    Early stopping policy for :class:`LessNoisyTrainer`: stop training
+    when ``metric`` hasn't improved by more than ``min_delta`` for
+    ``patience`` iterations.
+
+    ``metric`` is a key of iteration metrics (see
+    :class:`LessNoisyTrainer`); 'loss' is minimized, other metrics
+    (e.g. 'f1' or 'item_accuracy' on holdout data) are maximized.
+    """
+    def __init__(self, metric='f1', patience=10, min_delta=0.0):
+        self.metric = metric
+        self.patience = patience
+        self.min_delta = min_delta
+        self.reset()
+
+    def reset(self):
+        self.best_iteration = None
+        self.best_score = None
+
+    def update(self, metrics):
+        score = metrics.get(self.metric)
+        if score is None:
+            raise ValueError("Metric %r is not available; holdout metrics "
+                             "require dev data" % self.metric)
+        if self.metric == 'loss':
+            score = -score
+
+        if self.best_score is None or score > self.best_score + self.min_delta:
+            self.best_score = score
+            self.best_iteration = metrics['iteration']
+        elif metrics['iteration'] - self.best_iteration >= self.patience:
+            raise StopTraining(self.best_iteration)
+
+
 class LessNoisyTrainer(pycrfsuite.Trainer):
     """
     This pycrfsuite.Trainer prints information about each iteration
     on a single line.
+
+    Metrics of each iteration are collected as dicts with
+    ``iteration``, ``time``, ``loss``, ``active_features``, ``feature_norm``
+    keys and, when there is holdout data, ``precision``, ``recall``, ``f1``
+    (averaged over labels), ``item_accuracy``, ``instance_accuracy``
+    and ``scores`` (``{label: {"precision": ..., "recall": ..., "f1": ...,
+    "support": ...}}``). They are stored in ``metrics`` attribute,
+    passed to ``callback`` and written to ``log_path`` (one JSON object
+    per line), regardless of ``verbose``.
+
+    If ``early_stopping`` (:class:`EarlyStopping`) is passed, training is
+    stopped when it says so; then the model is trained again for
+    ``best_iteration`` iterations (crfsuite can't save an intermediate
+    model), and this model is saved.
+
+    tabulate is imported only when the training summary is printed,
+    so it is not required for loading models.
     """
+    def __init__(self, algorithm=None, params=None, verbose=True,
+                 callback=None, log_path=None, early_stopping=None):
+        super(LessNoisyTrainer, self).__init__(algorithm, params, verbose)
+        self.callback = callback
+        self.log_path = log_path
+        self.early_stopping = early_stopping
+        self.metrics = []
+        self.best_iteration = None
+        self._log = None
+        self._retraining = False
+
+    def train(self, model, holdout=-1):
+        self.metrics = []
+        self.best_iteration = None
+        if self.early_stopping is not None:
+            self.early_stopping.reset()
+        if self.log_path is not None:
+            self._log = io.open(self.log_path, 'w', encoding='utf8')
+        try:
+            super(LessNoisyTrainer, self).train(model, holdout)
+        except StopTraining as e:
+            self.best_iteration = e.best_iteration
+            self._retrain(model, holdout, e.best_iteration)
+        finally:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def _retrain(self, model, holdout, max_iterations):
+        old_value = self.get('max_iterations')
+        self.set('max_iterations', max_iterations)
+        self._retraining = True
+        try:
+            super(LessNoisyTrainer, self).train(model, holdout)
+        finally:
+            self._retraining = False
+            self.set('max_iterations', old_value)
+
+    def message(self, message):
+        event = self.logparser.feed(message)
+        if event is None:
+            return
+        log = self.logparser.last_log
+        if event == 'iteration':
+            info = self.logparser.last_iteration
+            if not self._retraining:
+                self._on_metrics(_iteration_metrics(info))
+            if self.verbose:
+                self.on_iteration(log, info)
+        elif self.verbose:
+            if event == 'featgen_progress':
+                self.on_featgen_progress(log, self.logparser.featgen_percent)
+            else:
+                getattr(self, 'on_' + event)(log)
+
+    def _on_metrics(self, metrics):
+        self.metrics.append(metrics)
+        if self._log is not None:
+            self._log.write(six.text_type(json.dumps(metrics, sort_keys=True)) + '\n')
+            self._log.flush()
+        if self.callback is not None:
+            self.callback(metrics)
+        if self.early_stopping is not None:
+            self.early_stopping.update(metrics)
+
     def on_iteration(self, log, info):
         if 'avg_precision' in info:
             print(("Iter {num:<3} "
@@ -38,6 +168,7 @@ class LessNoisyTrainer(pycrfsuite.Trainer):
     def on_optimization_end(self, log):
         last_iter = self.logparser.last_iteration
         if 'scores' in last_iter:
+            from tabulate import tabulate
             data = [
                 [entity, score.precision, score.recall, score.f1, score.ref]
                 for entity, score in sorted(last_iter['scores'].items())
@@ -53,9 +184,44 @@ class LessNoisyTrainer(pycrfsuite.Trainer):
         super(LessNoisyTrainer, self).on_optimization_end(log)
 
 
+def _len(seq):
+    return len(seq) if hasattr(seq, '__len__') else None
+
+
+def _iteration_metrics(info):
+    metrics = {
+        'iteration': info['num'],
+        'time': info['time'],
+        'loss': info['loss'],
+        'active_features': info['active_features'],
+        'feature_norm': info['feature_norm'],
+    }
+    if 'avg_f1' in info:
+        metrics.update(
+            precision=info['avg_precision'],
+            recall=info['avg_recall'],
+            f1=info['avg_f1'],
+            item_accuracy=info['item_accuracy_float'],
+            instance_accuracy=info['instance_accuracy_float'],
+            scores=dict(
+                (label, {'precision': score.precision, 'recall': score.recall,
+                         'f1': score.f1, 'support': score.ref})
+                for label, score in info['scores'].items()
+            ),
+        )
+    return metrics
+
+
 class CRF(object):
+    # model contents when the model is loaded from memory
+    # (see :meth:`load_model_data`) instead of a file
+    _model_data = None
+
+    trainer_kwargs = None
+
     def __init__(self, algorithm=None, train_params=None, verbose=False,
-                 model_filename=None, keep_tempfiles=False, trainer_cls=None):
+                 model_filename=None, keep_tempfiles=False, trainer_cls=None,
+                 trainer_kwargs=None):
         self.algorithm = algorithm
         self.train_params = train_params
         self.modelfile = FileResource(
@@ -70,7 +236,11 @@ class CRF(object):
             self.trainer_cls = pycrfsuite.Trainer
         else:
             self.trainer_cls = trainer_cls
+        # extra arguments for trainer_cls, e.g. early_stopping
+        # for LessNoisyTrainer
+        self.trainer_kwargs = trainer_kwargs
         self.training_log_ = None
+        self.training_metrics_ = None
 
     def fit(self, X, y, X_dev=None, y_dev=None):
         """
@@ -79,13 +249,15 @@ class CRF(object):
         Parameters
         ----------
         X : list of lists of dicts
-            Feature dicts for several documents (in a python-crfsuite format).
+            Feature dicts for several documents (in a python-crfsuite format)
+            or a list of ``pycrfsuite.ItemSequence`` instances.
+            It can be an iterator.
 
         y : list of lists of strings
             Labels for several documents.
 
         X_dev : (optional) list of lists of dicts
-            Feature dicts used for testing.
+            Feature dicts (or ItemSequence instances) used for testing.
 
         y_dev : (optional) list of lists of strings
             Labels corresponding to X_dev.
@@ -96,13 +268,15 @@ class CRF(object):
         if self._tagger is not None:
             self._tagger.close()
             self._tagger = None
+        self._model_data = None
         self.modelfile.refresh()
 
         trainer = self._get_trainer()
         train_data = zip(X, y)
 
         if self.verbose:
-            train_data = tqdm(train_data, "loading training data to CRFsuite", len(X), leave=True)
+            from tqdm import tqdm
+            train_data = tqdm(train_data, "loading training data to CRFsuite", _len(X), leave=True)
 
         for xseq, yseq in train_data:
             trainer.append(xseq, yseq)
@@ -114,7 +288,7 @@ class CRF(object):
             test_data = zip(X_dev, y_dev)
 
             if self.verbose:
-                test_data = tqdm(test_data, "loading dev data to CRFsuite", len(X_dev), leave=True)
+                test_data = tqdm(test_data, "loading dev data to CRFsuite", _len(X_dev), leave=True)
 
             for xseq, yseq in test_data:
                 trainer.append(xseq, yseq, 1)
@@ -124,6 +298,7 @@ class CRF(object):
 
         trainer.train(self.modelfile.name, holdout=-1 if X_dev is None else 1)
         self.training_log_ = trainer.logparser
+        self.training_metrics_ = getattr(trainer, 'metrics', None)
         return self
 
     def predict(self, X):
@@ -134,6 +309,7 @@ class CRF(object):
         ----------
         X : list of lists of dicts
             feature dicts in python-crfsuite format
+            or a list of ``pycrfsuite.ItemSequence`` instances
 
         Returns
         -------
@@ -151,6 +327,7 @@ class CRF(object):
         ----------
         xseq : list of dicts
             feature dicts in python-crfsuite format
+            or ``pycrfsuite.ItemSequence``
 
         Returns
         -------
@@ -168,6 +345,7 @@ class CRF(object):
         ----------
         X : list of lists of dicts
             feature dicts in python-crfsuite format
+            or a list of ``pycrfsuite.ItemSequence`` instances
 
         Returns
         -------
@@ -185,6 +363,7 @@ class CRF(object):
         ----------
         xseq : list of dicts
             feature dicts in python-crfsuite format
+            or ``pycrfsuite.ItemSequence``
 
         Returns
         -------
@@ -199,14 +378,90 @@ class CRF(object):
             for i in range(len(xseq))
         ]
 
+    def predict_with_marginals(self, X):
+        """
+        Make a prediction; return labels, sequence probabilities and
+        marginals at once.
+
+        Parameters
+        ----------
+        X : list of lists of dicts
+            feature dicts in python-crfsuite format
+            or a list of ``pycrfsuite.ItemSequence`` instances
+
+        Returns
+        -------
+        res : list of (y, probability, marginals) tuples
+            see :meth:`predict_with_marginals_single`
+
+        """
+        return list(map(self.predict_with_marginals_single, X))
+
+    def predict_with_marginals_single(self, xseq):
+        """
+        Make a prediction. Features are loaded to the tagger once,
+        so this is cheaper than calling :meth:`predict_single`
+        and :meth:`predict_marginals_single`.
+
+        Parameters
+        ----------
+        xseq : list of dicts
+            feature dicts in python-crfsuite format
+            or ``pycrfsuite.ItemSequence``
+
+        Returns
+        -------
+        y : list of strings
+            predicted labels (the best path)
+
+        probability : float
+            probability of the predicted label sequence
+
+        marginals : list of dicts
+            predicted probabilities for each label at each position
+
+        """
+        tagger = self.tagger
+        labels = tagger.labels()
+        tagger.set(xseq)
+        y = tagger.tag()
+        marginals = [
+            {label: tagger.marginal(label, i) for label in labels}
+            for i in range(len(xseq))
+        ]
+        return y, tagger.probability(y), marginals
+
+    def model_data(self):
+        """ Return the binary crfsuite model """
+        if self._model_data is not None:
+            return self._model_data
+        if self.modelfile.name is None:
+            raise Exception("Model is not available. Is the model trained?")
+        with open(self.modelfile.name, 'rb') as f:
+            return f.read()
+
+    def load_model_data(self, data):
+        """
+        Use a binary crfsuite model ``data`` (bytes) without writing it
+        to a file. crfsuite reads the model from this buffer,
+        so it is kept as long as the CRF uses it.
+        """
+        if self._tagger is not None:
+            self._tagger.close()
+            self._tagger = None
+        self.modelfile.cleanup()
+        self._model_data = data
+
     @property
     def tagger(self):
         if self._tagger is None:
-            if self.modelfile.name is None:
-                raise Exception("Can't load model. Is the model trained?")
-
             tagger = pycrfsuite.Tagger()
-            tagger.open(self.modelfile.name)
+            if self._model_data is not None:
+                tagger.open_inmemory(self._model_data)
+            elif self.modelfile.name is None:
+                raise Exception("Can't load model. Is the model trained?")
+            else:
+                tagger.open(self.modelfile.name)
             self._tagger = tagger
         return self._tagger
 
@@ -215,6 +470,7 @@ class CRF(object):
             algorithm=self.algorithm,
             params=self.train_params,
             verbose=self.verbose,
+            **(self.trainer_kwargs or {})
         )
 
     def __getstate__(self):
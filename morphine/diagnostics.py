@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Memory footprint of a Disambiguator, broken down by component::
+
+    report = memory_report(disambiguator)
+    print(format_memory_report(report))
+
+For each partial tagger the report has CRF model statistics from
+``pycrfsuite.Tagger.info()`` (numbers of labels, attributes, state
+features and transitions) and the model size (crfsuite keeps the
+whole model in memory), and the size of Python objects of its
+feature extractor (features, Pattern closures, attribute whitelist).
+The report also has sizes of the MorphAnalyzer (Python objects and
+dictionary files, which are loaded into memory), the result cache,
+the parse store and the process RSS.
+
+Sizes of Python objects are computed by :func:`deep_size`; objects shared
+with other components (e.g. the MorphAnalyzer) are not counted twice.
+"""
+from __future__ import absolute_import, division
+import gc
+import os
+import sys
+import types
+
+from morphine.utils import current_rss, peak_rss, tagger_name
+
+
+def memory_report(disambiguator, include_morph=True):
+    """
+    Return a dict with the memory footprint of ``disambiguator``:
+
+    * ``taggers`` - a list of dicts with ``name``, ``labels``,
+      ``attributes``, ``state_features``, ``transitions``,
+      ``model_size`` (bytes), ``extractor_size`` (bytes) and
+      ``shared_with`` keys; ``shared_with`` is the index of an earlier
+      tagger with the same feature extractor (its size is counted
+      there, so ``extractor_size`` is 0) or None;
+    * ``morph`` - ``{'objects': bytes, 'dictionary_files': bytes}``,
+      or None if ``include_morph`` is False (Python objects
+      of a MorphAnalyzer take a while to traverse);
+    * ``cache`` - ``SentenceCache.info()`` or None;
+    * ``store`` - ``{'entries': count, 'size': bytes}`` or None;
+    * ``rss`` and ``peak_rss`` - memory of this process in bytes
+      (None if it is not available).
+    """
+    morph = disambiguator.morph
+    # disambiguators pickled by older versions have no cache and store
+    cache = getattr(disambiguator, 'cache', None)
+    store = getattr(disambiguator, 'store', None)
+    shared = [morph, cache, store]
+    seen = set(id(obj) for obj in shared if obj is not None)
+
+    taggers = []
+    extractors = {}
+    for idx, tagger in enumerate(disambiguator.partial_taggers):
+        info = {'name': tagger_name(tagger),
+                'shared_with': extractors.setdefault(id(tagger.fe), idx),
+                'extractor_size': deep_size(tagger.fe, seen)}
+        if info['shared_with'] == idx:
+            info['shared_with'] = None
+        info.update(model_info(tagger.crf))
+        taggers.append(info)
+
+    report = {
+        'taggers': taggers,
+        'morph': None,
+        'cache': None,
+        'store': None,
+        'rss': current_rss(),
+        'peak_rss': peak_rss(),
+    }
+    if include_morph:
+        report['morph'] = {
+            'objects': deep_size(morph),
+            'dictionary_files': _dir_size(morph.dictionary.path),
+        }
+    if cache is not None:
+        report['cache'] = cache.info()
+    if store is not None:
+        report['store'] = {'entries': len(store), 'size': os.path.getsize(store.path)}
+    return report
+
+
+def model_info(crf):
+    """
+    Return a dict with ``labels``, ``attributes``, ``state_features``,
+    ``transitions`` and ``model_size`` of a :class:`~morphine.crfsuite.CRF`
+    model; all values are 0 if there is no trained model.
+    """
+    if crf is None or (crf._model_data is None and crf.modelfile.name is None):
+        return {'labels': 0, 'attributes': 0, 'state_features': 0,
+                'transitions': 0, 'model_size': 0}
+    info = crf.tagger.info()
+    if crf._model_data is not None:
+        model_size = len(crf._model_data)
+    else:
+        model_size = os.path.getsize(crf.modelfile.name)
+    return {
+        'labels': len(info.labels),
+        'attributes': len(info.attributes),
+        'state_features': len(info.state_features),
+        'transitions': len(info.transitions),
+        'model_size': model_size,
+    }
+
+
+def deep_size(obj, seen=None):
+    """
+    Return an approximate size of ``obj`` and all objects reachable
+    from it, in bytes. Objects with ids in ``seen`` are skipped; ids of
+    counted objects are added to ``seen``. Classes, modules and code are
+    not counted; functions are counted with their closures and
+    default values::
+
+        >>> deep_size([]) == sys.getsizeof([])
+        True
+        >>> items = [[1.5] * 10]
+        >>> deep_size(items) > sys.getsizeof(items)
+        True
+        >>> deep_size(items, seen={id(items)})
+        0
+
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIPPED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, types.FunctionType):
+            stack.extend(cell.cell_contents for cell in obj.__closure__ or ()
+                         if _cell_is_set(cell))
+            stack.extend(obj.__defaults__ or ())
+        else:
+            stack.extend(gc.get_referents(obj))
+    return size
+
+
+def format_memory_report(report):
+    """ Return a text report for :func:`memory_report` results """
+    lines = ["%-28s %7s %9s %11s %11s %11s %11s" % (
+        "tagger", "labels", "attrs", "state feats", "transitions",
+        "model, MB", "fe, MB")]
+    for idx, info in enumerate(report['taggers']):
+        if info['shared_with'] is None:
+            extractor = "%11.2f" % (info['extractor_size'] / 2**20)
+        else:
+            extractor = " shared with #%d" % info['shared_with']
+        lines.append("#%-2d %-24s %7d %9d %11d %11d %11.2f %s" % (
+            idx, info['name'], info['labels'], info['attributes'],
+            info['state_features'], info['transitions'],
+            info['model_size'] / 2**20, extractor
+        ))
+    lines.append("")
+    morph = report['morph']
+    if morph is not None:
+        lines.append("morph: %s objects, %s dictionary files" % (
+            _format_mb(morph['objects']), _format_mb(morph['dictionary_files'])))
+    cache = report['cache']
+    if cache is not None:
+        lines.append("cache: %d sentences, %s" % (cache['size'], _format_mb(cache['nbytes'])))
+    store = report['store']
+    if store is not None:
+        lines.append("store: %d entries, %s mapped" % (store['entries'], _format_mb(store['size'])))
+    lines.append("RSS: %s (peak %s)" % (_format_mb(report['rss']),
+                                        _format_mb(report['peak_rss'])))
+    return "\n".join(lines)
+
+
+def _format_mb(value):
+    return '-' if value is None else "%0.1f MB" % (value / 2**20)
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+def _cell_is_set(cell):
+    try:
+        cell.cell_contents
+    except ValueError:
+        return False
+    return True
+
+
+_SKIPPED_TYPES = (type, types.ModuleType, types.CodeType)
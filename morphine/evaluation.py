@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of a Disambiguator (or a single partial tagger) on a corpus
+with gold tags.
+
+The corpus is a UTF-8 text file with one token per line: a token and its
+OpenCorpora tag separated by whitespace; sentences are separated by empty
+lines::
+
+    Стали   VERB,perf,intr plur,past,indc
+    стали   NOUN,inan,femn sing,gent
+    крепче  COMP,Qual
+
+The file is read in batches, so corpora of any size can be evaluated;
+batches are processed in parallel with ``workers > 1``::
+
+    report = evaluate(disambiguator, 'gold.txt', workers=4)
+    print(format_evaluation(report))
+
+Errors of the best parse are counted for each attribute
+(see :data:`ATTRIBUTES`) and compared with errors of pymorphy2 without
+disambiguation (:class:`morphine.unigram_model.Tagger`).
+When a :class:`~morphine.basetagger.PartialTagger` is evaluated,
+its label (``outval``) is the only attribute. Throughput and
+per-sentence latency are measured for the evaluated model only.
+"""
+from __future__ import absolute_import, division, print_function
+import io
+import multiprocessing
+import time
+
+from morphine.metrics import percentile
+from morphine.utils import batches
+
+ATTRIBUTES = ['POS', 'case', 'number', 'gender', 'animacy', 'transitivity',
+              'tense', 'person']
+
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+def read_tagged_sents(path):
+    """ Yield sentences from ``path`` as lists of (token, tag string) tuples """
+    with io.open(path, encoding='utf8') as f:
+        sent = []
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                if sent:
+                    yield sent
+                    sent = []
+                continue
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                raise ValueError("%s:%d: expected a token and a tag, got %r"
+                                 % (path, lineno, line))
+            sent.append((parts[0], parts[1].strip()))
+        if sent:
+            yield sent
+
+
+def evaluate(model, path, morph=None, workers=1, batch_size=100):
+    """
+    Evaluate ``model`` (a Disambiguator or a PartialTagger) on gold
+    tagged sentences from ``path``. ``morph`` is required for a
+    PartialTagger; a Disambiguator uses its own.
+
+    Return a dict with ``sentences``, ``tokens``, ``errors``
+    (``{attribute: {'model': count, 'baseline': count}}``), ``wall_time``,
+    ``tokens_per_sec`` and ``latency`` (``{percentile: seconds}``,
+    time to process a sentence) keys.
+    """
+    if morph is None:
+        morph = getattr(model, 'morph', None)
+        if morph is None:
+            raise ValueError("Pass morph to evaluate a partial tagger")
+
+    started = time.time()
+    sent_batches = batches(read_tagged_sents(path), batch_size)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_worker, (model, morph))
+        results = pool.imap(_evaluate_batch, sent_batches)
+    else:
+        pool = None
+        _init_worker(model, morph)
+        results = map(_evaluate_batch, sent_batches)
+
+    report = {'sentences': 0, 'tokens': 0, 'errors': {}, 'model_time': 0.0}
+    latencies = []
+    try:
+        for batch_errors, batch_latencies, n_tokens in results:
+            report['sentences'] += len(batch_latencies)
+            report['tokens'] += n_tokens
+            latencies.extend(batch_latencies)
+            for attr, counts in batch_errors.items():
+                total = report['errors'].setdefault(attr, {'model': 0, 'baseline': 0})
+                total['model'] += counts['model']
+                total['baseline'] += counts['baseline']
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    report['wall_time'] = time.time() - started
+    model_time = sum(latencies)
+    report['model_time'] = model_time
+    # parallel workers: throughput is measured by wall clock time
+    elapsed = report['wall_time'] if workers > 1 else model_time
+    report['tokens_per_sec'] = report['tokens'] / elapsed if elapsed else 0.0
+    report['latency'] = dict(
+        (q, percentile(latencies, q)) for q in LATENCY_PERCENTILES
+    )
+    return report
+
+
+def format_evaluation(report):
+    """ Return a text report for :func:`evaluate` results """
+    lines = [
+        "sentences: %d" % report['sentences'],
+        "tokens: %d" % report['tokens'],
+        "tokens/sec: %0.1f" % report['tokens_per_sec'],
+    ]
+    for q in LATENCY_PERCENTILES:
+        latency = report['latency'][q]
+        if latency is not None:
+            lines.append("latency p%d: %0.2fms" % (q, latency * 1000))
+    lines.append("")
+    lines.append("%-14s %8s %10s %8s" % ("attribute", "errors", "pymorphy2", "fixed"))
+    for attr in sorted(report['errors']):
+        counts = report['errors'][attr]
+        lines.append("%-14s %8d %10d %+8d" % (
+            attr, counts['model'], counts['baseline'],
+            counts['baseline'] - counts['model']
+        ))
+    return "\n".join(lines)
+
+
+_model = None
+_morph = None
+_baseline = None
+
+
+def _init_worker(model, morph):
+    from morphine.unigram_model import Tagger
+    global _model, _morph, _baseline
+    _model = model
+    _morph = morph
+    _baseline = Tagger(morph)
+
+
+def _evaluate_batch(sents):
+    is_tagger = hasattr(_model, 'outval')
+    errors = {}
+    latencies = []
+    n_tokens = 0
+    for sent in sents:
+        tokens = [token for token, tag in sent]
+        gold = [_morph.TagClass(tag) for token, tag in sent]
+        n_tokens += len(tokens)
+        baseline = [p.tag for p in _baseline.predict(tokens)]
+
+        start = time.time()
+        if is_tagger:
+            predicted = _tagger_labels(_model, tokens)
+        else:
+            predicted = [
+                token_parses[0].tag if token_parses else None
+                for token_parses in _model.parse(tokens)
+            ]
+        latencies.append(time.time() - start)
+
+        if is_tagger:
+            _count_errors(errors, 'outval',
+                          [_model.outval(tag) for tag in gold],
+                          predicted,
+                          [_model.outval(tag) for tag in baseline])
+        else:
+            for attr in ATTRIBUTES:
+                _count_errors(errors, attr,
+                              [_attribute(tag, attr) for tag in gold],
+                              [_attribute(tag, attr) for tag in predicted],
+                              [_attribute(tag, attr) for tag in baseline])
+    return errors, latencies, n_tokens
+
+
+def _tagger_labels(tagger, tokens):
+    parsed_tokens = [_morph.parse(token) for token in tokens]
+    xseq = tagger.fe.transform_single(tokens, parsed_tokens)
+    return tagger.crf.predict_single(xseq)
+
+
+def _attribute(tag, attr):
+    if tag is None:
+        return None
+    value = getattr(tag, attr)
+    if attr == 'case':
+        value = tag.RARE_CASES.get(value, value)
+    return value
+
+
+def _count_errors(errors, attr, gold, predicted, baseline):
+    counts = errors.setdefault(attr, {'model': 0, 'baseline': 0})
+    for gold_value, value, baseline_value in zip(gold, predicted, baseline):
+        counts['model'] += value != gold_value
+        counts['baseline'] += baseline_value != gold_value
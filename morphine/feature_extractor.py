@@ -1,14 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 from itertools import starmap
-from operator import mul
-from six.moves import reduce
-try:
-    from cytoolz import functoolz, dicttoolz
-except ImportError:
-    from toolz import functoolz, dicttoolz
+import types
+
 import pycrfsuite
 
+from morphine.feature_table import FeatureTable
+from morphine.feature_plan import build_plan
+
 def get_parsed_sents(morph, sents):
     return [
         (sent, [morph.parse(t) for t in sent])
@@ -52,6 +51,11 @@ class FeatureExtractor(object):
             >>> def current_token_lower(token, parses):
             ...     return {'token_lower': token.lower()}
 
+        To avoid creating a dict for each call, a token feature can provide
+        ``write_features(feature_dict, token, parses)`` method
+        (or function attribute) which updates ``feature_dict`` inplace;
+        FeatureExtractor uses it instead of calling the feature.
+
     global_features : list of callables, optional
         List of "global" feature functions. Each "global" feature function
         accepts 3 arguments:
@@ -66,10 +70,110 @@ class FeatureExtractor(object):
 
         Global feature functions are applied after token feature
         functions in the order they are passed.
+
+        If all global features provide ``apply_columns`` method (see
+        :class:`~morphine.feature_table.FeatureTable`), they are applied
+        to columns of a feature table instead of per-token dicts;
+        the table is converted to feature dicts at the end.
+
+    output : {'dicts', 'items'}, optional
+        Output format. By default each sentence is a list of feature dicts.
+        With ``output='items'`` each sentence is a ``pycrfsuite.ItemSequence``
+        with already flattened features; it can be passed to
+        :class:`~morphine.crfsuite.CRF` methods (and used many times)
+        without converting dicts to crfsuite items again.
+
+    Global features may declare ``feature_reach``: how far (in tokens)
+    from a position are the tokens which can change its feature dict.
+    When all global features declare it, feature dicts of a part of
+    a sentence can be updated with :meth:`transform_window`.
+
+    Token feature dicts can be precomputed for frequent tokens and
+    read from a :class:`~morphine.store.ParseStore`; see :meth:`use_store`.
+
+    Rare attributes can be pruned with :meth:`prune_attributes`;
+    the whitelist is saved with the extractor.
     """
-    def __init__(self, token_features, global_features=None):
+    store = None
+    store_name = None
+    output = 'dicts'
+    attribute_whitelist = None
+
+    def __init__(self, token_features, global_features=None, output='dicts'):
         self.combined_token_features = _CombinedFeatures(*token_features)
         self.global_features = global_features or []
+        self.set_output(output)
+
+    def set_output(self, output):
+        """ Change output format: 'dicts' or 'items' """
+        if output not in ('dicts', 'items'):
+            raise ValueError("Unknown output format: %r" % output)
+        self.output = output
+
+    def use_store(self, store, name=None):
+        """
+        Read token feature dicts from ``store`` when they are available.
+        ``name`` is the extractor name used when the store was built;
+        by default it is the class name. Pass None as ``store``
+        to stop using a store.
+
+        Stored feature dicts are looked up by token text, so parses
+        passed to :meth:`transform_single` must come from the same
+        MorphAnalyzer the store was built with. ValueError is raised
+        if the store has no token features under this name or they
+        were computed with different token features
+        (see :meth:`token_features_signature`).
+        """
+        name = name if name is not None else type(self).__name__
+        if store is not None and \
+                store.token_features_signature(name) != self.token_features_signature():
+            raise ValueError("Token features %r in %s don't match this extractor"
+                             % (name, store.path))
+        self.store = store
+        self.store_name = name
+
+    def token_features_signature(self):
+        """
+        Return a list of strings which describe token feature functions
+        and their parameters; it is saved to a
+        :class:`~morphine.store.ParseStore` with precomputed features.
+        """
+        return [_feature_signature(func)
+                for func in self.combined_token_features.feature_funcs]
+
+    def prune_attributes(self, X, min_count=1, top_n=None):
+        """
+        Build a whitelist of attributes which occur in ``X`` (extracted
+        training features) at least ``min_count`` times (and are among
+        ``top_n`` most frequent, if ``top_n`` is set) and use it in
+        :meth:`transform_single` from now on. Features which have
+        no whitelisted attributes are not computed when possible.
+
+        Return an iterator over ``X`` with pruned attributes; it can be
+        passed to :meth:`~morphine.crfsuite.CRF.fit`. ``X`` may be
+        extracted with ``output='items'``; ItemSequence objects are
+        returned for it then.
+        """
+        from morphine.attributes import build_whitelist
+        self.set_attribute_whitelist(build_whitelist(X, min_count, top_n))
+        whitelist = self.attribute_whitelist
+        return (self._prune_sequence(xseq, whitelist) for xseq in X)
+
+    def _prune_sequence(self, xseq, whitelist):
+        pruned = self._filter_attributes(xseq, whitelist)
+        if isinstance(xseq, pycrfsuite.ItemSequence):
+            return pycrfsuite.ItemSequence(pruned)
+        return pruned
+
+    def set_attribute_whitelist(self, whitelist):
+        """ Use ``whitelist`` of attributes; pass None to disable pruning """
+        self.attribute_whitelist = frozenset(whitelist) if whitelist is not None else None
+
+    def _filter_attributes(self, feature_dicts, whitelist):
+        from morphine.attributes import filter_features
+        if isinstance(feature_dicts, pycrfsuite.ItemSequence):
+            feature_dicts = feature_dicts.items()
+        return [filter_features(fd, whitelist) for fd in feature_dicts]
 
     def fit(self, parsed_sents, y=None):
         self.fit_transform(parsed_sents)
@@ -82,13 +186,159 @@ class FeatureExtractor(object):
         return list(starmap(self.transform_single, parsed_sents))
 
     def transform_single(self, tokens, parsed_tokens):
-        feature_dicts = list(map(self.combined_token_features, tokens, parsed_tokens))
+        feature_dicts = self._transform_dicts(tokens, parsed_tokens)
+        if self.attribute_whitelist is not None:
+            feature_dicts = self._filter_attributes(feature_dicts, self.attribute_whitelist)
+        if self.output == 'items':
+            return pycrfsuite.ItemSequence(feature_dicts)
+        return feature_dicts
 
+    def feature_reach(self):
+        """
+        Return the maximum distance between a token and tokens which can
+        change its feature dict, or None if some global features
+        don't declare ``feature_reach``. Being the first or the last
+        token of a sentence can change a feature dict as well.
+        """
+        # global features may read values written by previous ones,
+        # so reach is tracked for each key (see morphine.feature_plan)
+        key_reach = {}
+        default = max_reach = 0
         for feat in self.global_features:
-            feat(tokens, parsed_tokens, feature_dicts)
+            feat_reach = getattr(feat, 'feature_reach', None)
+            if feat_reach is None:
+                return None
+            reads = getattr(feat, 'required_keys', ())
+            if reads is None:
+                reach = max_reach + feat_reach
+            else:
+                reach = max([key_reach.get(key, default) for key in reads] + [0]) + feat_reach
+            if hasattr(feat, 'feature_keys') or hasattr(feat, 'dropped_keys'):
+                for key in getattr(feat, 'feature_keys', ()):
+                    key_reach[key] = reach
+            else:
+                default = max(default, reach)
+            max_reach = max(max_reach, reach)
+        return max_reach
 
+    def transform_window(self, tokens, parsed_tokens, start, stop):
+        """
+        Return feature dicts for tokens ``start:stop`` of a sentence;
+        they are the same as ``transform_single(tokens, parsed_tokens)[start:stop]``
+        (but always dicts, regardless of ``output``). Only tokens within
+        :meth:`feature_reach` of the window are processed; the whole
+        sentence is if the reach is unknown.
+        """
+        reach = self.feature_reach()
+        if reach is None:
+            low, high = 0, len(tokens)
+        else:
+            low = max(start - reach - 1, 0)
+            high = min(stop + reach + 1, len(tokens))
+        feature_dicts = self._transform_dicts(tokens[low:high], parsed_tokens[low:high])
+        feature_dicts = feature_dicts[start - low:stop - low]
+        if self.attribute_whitelist is not None:
+            feature_dicts = self._filter_attributes(feature_dicts, self.attribute_whitelist)
         return feature_dicts
 
+    def _transform_dicts(self, tokens, parsed_tokens):
+        if not self._uses_columns():
+            feature_dicts = self._token_feature_dicts(
+                self.combined_token_features, tokens, parsed_tokens)
+            for feat in self.global_features:
+                feat(tokens, parsed_tokens, feature_dicts)
+            return feature_dicts
+
+        plan, combined_token_features = self._get_plan()
+        feature_dicts = self._token_feature_dicts(
+            combined_token_features, tokens, parsed_tokens)
+        table = FeatureTable.from_dicts(feature_dicts, plan.scratch_keys)
+        for feat in plan.global_features:
+            feat.apply_columns(tokens, parsed_tokens, table)
+        return table.to_dicts()
+
+    def _token_feature_dicts(self, combined_token_features, tokens, parsed_tokens):
+        if self.store is not None:
+            return list(map(self._stored_token_features, tokens, parsed_tokens))
+        return list(map(combined_token_features, tokens, parsed_tokens))
+
+    def _uses_columns(self):
+        return all(hasattr(feat, 'apply_columns') for feat in self.global_features)
+
+    def plan(self):
+        """
+        Return a :class:`~morphine.feature_plan.FeaturePlan` which describes
+        how features depend on each other and which of them are not
+        computed. The plan is used when global features are applied
+        to a feature table (see ``global_features``).
+        """
+        return self._get_plan()[0]
+
+    def _get_plan(self):
+        # the plan is rebuilt if features are replaced after it is computed
+        key = [self.combined_token_features, self.attribute_whitelist] + \
+              list(self.global_features)
+        cached = self.__dict__.get('_plan')
+        if cached is None or not _same_items(cached[0], key):
+            output_keys = None
+            if self.attribute_whitelist is not None:
+                from morphine.attributes import whitelist_keys
+                output_keys = whitelist_keys(self.attribute_whitelist)
+            plan = build_plan(self.combined_token_features.feature_funcs,
+                              self.global_features, output_keys)
+            cached = self._plan = (key, plan, _CombinedFeatures(*plan.token_features))
+        return cached[1], cached[2]
+
+    def __getstate__(self):
+        dct = self.__dict__.copy()
+        dct.pop('_plan', None)
+        return dct
+
+    def _stored_token_features(self, token, parses):
+        features = self.store.token_features(self.store_name, token)
+        if features is None:
+            return self.combined_token_features(token, parses)
+        return features
+
+
+def _feature_signature(func):
+    """
+    Return a string which describes a feature function and its
+    parameters; it is the same in all processes::
+
+        >>> from morphine import features
+        >>> _feature_signature(features.token_lower)
+        'morphine.features.token_lower'
+        >>> sig = _feature_signature(features.Grammeme(ignore=['NOUN', 'ADJF']))
+        >>> sig == _feature_signature(features.Grammeme(ignore=['ADJF', 'NOUN']))
+        True
+        >>> sig == _feature_signature(features.Grammeme(ignore=['NOUN']))
+        False
+
+    """
+    if isinstance(func, (types.FunctionType, types.BuiltinFunctionType)):
+        return "%s.%s" % (func.__module__, func.__name__)
+    cls = type(func)
+    state = func.__getstate__() if hasattr(func, '__getstate__') else vars(func)
+    params = ", ".join("%s=%r" % (key, _signature_value(state[key]))
+                       for key in sorted(state or {}))
+    return "%s.%s(%s)" % (cls.__module__, cls.__name__, params)
+
+
+def _signature_value(value):
+    # sets are sorted: their order changes between processes
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, (list, tuple)):
+        return [_signature_value(item) for item in value]
+    if callable(value):
+        return _feature_signature(value)
+    return value
+
+
+def _same_items(seq1, seq2):
+    return len(seq1) == len(seq2) and all(a is b for a, b in zip(seq1, seq2))
+
 
 class _CombinedFeatures(object):
     """
@@ -101,9 +351,43 @@ class _CombinedFeatures(object):
         >>> pprint(features('foo'))
         {'len': 3, 'upper': False}
 
+    Features with ``write_features`` method write their values
+    directly to the resulting dict::
+
+        >>> def f3(tok): raise Exception()
+        >>> f3.write_features = lambda dct, tok: dct.update(first=tok[0])
+        >>> pprint(_CombinedFeatures(f1, f3)('foo'))
+        {'first': 'f', 'upper': False}
+
     """
     def __init__(self, *feature_funcs):
-        self._combined = functoolz.juxt(feature_funcs)
+        self.feature_funcs = feature_funcs
+        self._writers = [_get_writer(func) for func in feature_funcs]
 
     def __call__(self, *args, **kwargs):
-        return dicttoolz.merge(*self._combined(*args, **kwargs))
+        feature_dict = {}
+        for write in self._writers:
+            write(feature_dict, *args, **kwargs)
+        return feature_dict
+
+    def __getstate__(self):
+        return {'feature_funcs': self.feature_funcs}
+
+    def __setstate__(self, state):
+        if '_combined' in state:
+            # pickled by an older version which used toolz.juxt;
+            # unpickling such models requires toolz ('legacy' extra)
+            feature_funcs = tuple(state['_combined'].funcs)
+        else:
+            feature_funcs = state['feature_funcs']
+        self.__init__(*feature_funcs)
+
+
+def _get_writer(func):
+    write_features = getattr(func, 'write_features', None)
+    if write_features is not None:
+        return write_features
+
+    def write(feature_dict, *args, **kwargs):
+        feature_dict.update(func(*args, **kwargs))
+    return write
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency analysis of :class:`~morphine.feature_extractor.FeatureExtractor`
+features.
+
+Features describe themselves with optional attributes:
+
+* ``feature_keys`` - keys a token or global feature writes;
+* ``required_keys`` - keys a global feature reads (None means
+  "any key");
+* ``dropped_keys`` - keys a global feature deletes.
+
+From these a dependency graph of feature keys is built. Keys whose only
+fate is to be dropped are not computed; keys which are only looked up by
+other features and then dropped ("scratch" keys) are kept out of
+the final feature dicts without running the Drop.
+"""
+from __future__ import absolute_import
+
+
+class FeaturePlan(object):
+    """
+    Execution plan for a FeatureExtractor; see :func:`build_plan`.
+
+    Attributes
+    ----------
+
+    dependencies : dict
+        ``{key: set of keys it is computed from}`` for all known keys.
+
+    dead_keys : set
+        Keys which are dropped without being read; they are not computed
+        when possible.
+
+    scratch_keys : set
+        Keys which are computed only to be looked up by other features;
+        they are discarded at the end instead of being dropped.
+
+    token_features : list
+        Token features to compute.
+
+    global_features : list
+        Global features to apply.
+
+    skipped : list
+        Features (token or global) which are not needed.
+
+    enabled : bool
+        False if some global feature doesn't describe its keys;
+        in this case all features are computed as is and ``reason``
+        explains why.
+    """
+    def __init__(self, token_features, global_features):
+        self.token_features = list(token_features)
+        self.global_features = list(global_features)
+        self.dependencies = {}
+        self.dead_keys = set()
+        self.scratch_keys = set()
+        self.skipped = []
+        self.enabled = True
+        self.reason = None
+
+    def report(self):
+        """ Return a human-readable description of the plan """
+        lines = []
+        if not self.enabled:
+            lines.append("optimization disabled: %s" % self.reason)
+        for key in sorted(self.dependencies):
+            deps = self.dependencies[key]
+            if key in self.dead_keys:
+                status = 'dead'
+            elif key in self.scratch_keys:
+                status = 'scratch'
+            else:
+                status = 'output'
+            lines.append("%s [%s] <- %s" % (
+                key, status, ", ".join(sorted(deps)) if deps else "token"
+            ))
+        for feat in self.skipped:
+            lines.append("skipped: %s" % _feature_name(feat))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "<FeaturePlan: %d dead, %d scratch, %d skipped>" % (
+            len(self.dead_keys), len(self.scratch_keys), len(self.skipped)
+        )
+
+
+def build_plan(token_features, global_features, output_keys=None):
+    """
+    Analyze ``token_features`` and ``global_features`` of a FeatureExtractor
+    and return a :class:`FeaturePlan`. If ``output_keys`` is passed,
+    other keys are not needed in the output (e.g. all their attributes
+    are pruned, see :mod:`morphine.attributes`).
+    """
+    plan = FeaturePlan(token_features, global_features)
+    for feat in global_features:
+        if not hasattr(feat, 'dropped_keys') and not hasattr(feat, 'feature_keys'):
+            plan.enabled = False
+            plan.reason = "%s doesn't describe its keys" % _feature_name(feat)
+            return plan
+
+    for feat in token_features:
+        for key in getattr(feat, 'feature_keys', ()):
+            plan.dependencies.setdefault(key, set())
+    for feat in global_features:
+        reads = getattr(feat, 'required_keys', ())
+        for key in getattr(feat, 'feature_keys', ()):
+            deps = plan.dependencies.setdefault(key, set())
+            deps.update(reads if reads is not None else ['*'])
+
+    # Backward liveness analysis. Everything which survives until the end
+    # goes to the output, so at each step a set of *dead* keys is tracked.
+    dead = set()
+    if output_keys is not None:
+        dead.update(key for key in plan.dependencies if key not in output_keys)
+        plan.scratch_keys.update(dead)
+    live_globals = []
+    for feat in reversed(global_features):
+        dropped = getattr(feat, 'dropped_keys', ())
+        written = getattr(feat, 'feature_keys', ())
+        if dropped:
+            dead.update(dropped)
+            live_globals.append(feat)
+            continue
+
+        if written and all(key in dead for key in written):
+            plan.skipped.append(feat)
+            continue
+
+        # Writers only update some positions, so written keys stay
+        # as live as they were; read keys become live.
+        reads = getattr(feat, 'required_keys', ())
+        if reads is None:
+            dead = set()
+        else:
+            dead.difference_update(reads)
+        live_globals.append(feat)
+    live_globals.reverse()
+
+    plan.token_features = []
+    for feat in token_features:
+        keys = getattr(feat, 'feature_keys', None)
+        if keys is not None and all(key in dead for key in keys):
+            plan.skipped.append(feat)
+        else:
+            plan.token_features.append(feat)
+    plan.dead_keys = set(key for key in plan.dependencies if key in dead)
+
+    # Drops which are the last operation on a key can be replaced
+    # by discarding the key at the end.
+    plan.global_features = []
+    for idx, feat in enumerate(live_globals):
+        dropped = getattr(feat, 'dropped_keys', ())
+        if dropped and all(_is_final_drop(key, live_globals[idx+1:]) for key in dropped):
+            plan.scratch_keys.update(dropped)
+            plan.skipped.append(feat)
+        else:
+            plan.global_features.append(feat)
+    return plan
+
+
+def _is_final_drop(key, later_features):
+    for feat in later_features:
+        reads = getattr(feat, 'required_keys', ())
+        if reads is None or key in reads:
+            return False
+        if key in getattr(feat, 'feature_keys', ()):
+            return False
+        if key in getattr(feat, 'dropped_keys', ()):
+            return False
+    return True
+
+
+def _feature_name(feat):
+    if hasattr(feat, 'name') and isinstance(feat.name, str):
+        return "%s(%r)" % (type(feat).__name__, feat.name)
+    if hasattr(feat, 'key'):
+        return "%s(%r)" % (type(feat).__name__, feat.key)
+    return getattr(feat, '__name__', repr(feat))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+
+class FeatureTable(object):
+    """
+    Columnar representation of sentence features: a mapping from
+    a feature name to a list of its values at each position,
+    with None for positions where the feature is missing.
+
+    Global features which provide ``apply_columns(tokens, parsed_tokens,
+    table)`` method (or function attribute) can work on whole columns
+    instead of per-token dicts::
+
+        >>> table = FeatureTable.from_dicts([{'a': 1}, {'a': 2, 'b': 'x'}])
+        >>> table.column('a')
+        [1, 2]
+        >>> table.column('b')
+        [None, 'x']
+        >>> table.set_column('c', [None, 'y'])
+        >>> table.to_dicts() == [{'a': 1}, {'a': 2, 'b': 'x', 'c': 'y'}]
+        True
+
+    """
+    __slots__ = ['length', 'columns', 'scratch']
+
+    def __init__(self, length, columns=None, scratch=()):
+        self.length = length
+        self.columns = columns if columns is not None else {}
+        self.scratch = scratch
+
+    @classmethod
+    def from_dicts(cls, feature_dicts, scratch=()):
+        """
+        Create a table from feature dicts. Columns with names from
+        ``scratch`` are available to global features, but are not included
+        in the result of :meth:`to_dicts`.
+        """
+        length = len(feature_dicts)
+        columns = {}
+        for index, feature_dict in enumerate(feature_dicts):
+            for key, value in feature_dict.items():
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [None] * length
+                column[index] = value
+        return cls(length, columns, scratch)
+
+    def to_dicts(self):
+        feature_dicts = [{} for _ in range(self.length)]
+        for key, column in self.columns.items():
+            if key in self.scratch:
+                continue
+            for feature_dict, value in zip(feature_dicts, column):
+                if value is not None:
+                    feature_dict[key] = value
+        return feature_dicts
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def column(self, key):
+        """ Return a column (not a copy) or None if there is no such feature """
+        return self.columns.get(key)
+
+    def set_column(self, key, values):
+        self.columns[key] = values
+
+    def set_value(self, key, index, value):
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = [None] * self.length
+        column[index] = value
+
+    def drop(self, key):
+        self.columns.pop(key, None)
+
+    def row(self, index):
+        """ Return a feature dict for a single position (a copy) """
+        return dict(
+            (key, column[index])
+            for key, column in self.columns.items()
+            if column[index] is not None
+        )
@@ -7,6 +7,7 @@ from operator import mul
 import six
 from six.moves import reduce
 from morphine.utils import func_takes_argument
+from morphine._grammemes import GRAMMEME_BITS
 
 
 def skips_empty_sents(func):
@@ -26,6 +27,14 @@ def single_value(func):
         if value is None:
             return {}
         return {key: value}
+
+    def write_features(feature_dict, *args, **kwargs):
+        value = func(*args, **kwargs)
+        if value is not None:
+            feature_dict[key] = value
+
+    wrapper.write_features = write_features
+    wrapper.feature_keys = (key,)
     return wrapper
 
 
@@ -34,11 +43,31 @@ def sentence_start(tokens, parsed_tokens, feature_dicts):
     feature_dicts[0]['sentence_start'] = 1.0
 
 
+def _sentence_start_columns(tokens, parsed_tokens, table):
+    if len(table):
+        table.set_value('sentence_start', 0, 1.0)
+
+sentence_start.apply_columns = _sentence_start_columns
+sentence_start.feature_keys = ('sentence_start',)
+sentence_start.required_keys = ()
+sentence_start.feature_reach = 0
+
+
 @skips_empty_sents
 def sentence_end(tokens, parsed_tokens, feature_dicts):
     feature_dicts[-1]['sentence_end'] = 1.0
 
 
+def _sentence_end_columns(tokens, parsed_tokens, table):
+    if len(table):
+        table.set_value('sentence_end', len(table) - 1, 1.0)
+
+sentence_end.apply_columns = _sentence_end_columns
+sentence_end.feature_keys = ('sentence_end',)
+sentence_end.required_keys = ()
+sentence_end.feature_reach = 0
+
+
 @single_value
 def bias(token, parses):
     return 1.0
@@ -68,11 +97,20 @@ class Drop(object):
     def __init__(self, key):
         self.key = key
 
+    @property
+    def dropped_keys(self):
+        return (self.key,)
+
+    feature_reach = 0
+
     def __call__(self, tokens, parsed_tokens, feature_dicts):
         for featdict in feature_dicts:
             if self.key in featdict:
                 del featdict[self.key]
 
+    def apply_columns(self, tokens, parsed_tokens, table):
+        table.drop(self.key)
+
 
 class _GrammemeFeatures(object):
     default_name = None
@@ -84,24 +122,111 @@ class _GrammemeFeatures(object):
         self.unambig_name = self.name + '[unambig]'
         self.threshold = threshold if threshold is not None else self.default_threshold
         self.add_unambig = add_unambig
-        self.ignore = set(ignore) if ignore is not None else set()
-        self.only = set(only) if only is not None else None
+        self.ignore = ignore if ignore is not None else ()
+        self.only = only
 
     def __call__(self, token, parses):
         parses = [p for p in parses if p.score >= self.threshold]
         return self.extract(parses)
 
-    def _filtered_grammemes(self, parse):
-        grammemes = [gr for gr in parse.tag._grammemes_tuple if gr not in self.ignore]
-        if self.only is not None:
-            grammemes = [gr for gr in grammemes if gr in self.only]
-            if not grammemes:
-                grammemes = ['NA']
-        return grammemes
+    @property
+    def ignore(self):
+        return self._ignore
+
+    @ignore.setter
+    def ignore(self, value):
+        self._ignore = frozenset(value)
+        self.__dict__.pop('_keep_mask_value', None)
+
+    @property
+    def only(self):
+        return self._only
+
+    @only.setter
+    def only(self, value):
+        self._only = frozenset(value) if value is not None else None
+        self.__dict__.pop('_keep_mask_value', None)
+
+    @property
+    def feature_keys(self):
+        if self.add_unambig:
+            return (self.name, self.unambig_name)
+        return (self.name,)
+
+    def write_features(self, feature_dict, token, parses):
+        """ Same as __call__, but update ``feature_dict`` inplace """
+        keep_mask = self._keep_mask()
+        tag_mask = GRAMMEME_BITS.tag_mask
+        threshold = self.threshold
+        self._write_masked(feature_dict, [
+            (p.score, tag_mask(p.tag) & keep_mask)
+            for p in parses if p.score >= threshold
+        ])
+
+    def extract_sentence(self, parsed_tokens):
+        """
+        Extract features for all tokens of a sentence at once;
+        the result is the same as calling this feature for each token.
+        """
+        keep_mask = self._keep_mask()
+        tag_mask = GRAMMEME_BITS.tag_mask
+        threshold = self.threshold
+        res = []
+        for parses in parsed_tokens:
+            features = {}
+            self._write_masked(features, [
+                (p.score, tag_mask(p.tag) & keep_mask)
+                for p in parses if p.score >= threshold
+            ])
+            res.append(features)
+        return res
 
     def extract(self, parses):
+        keep_mask = self._keep_mask()
+        tag_mask = GRAMMEME_BITS.tag_mask
+        res = {}
+        self._write_masked(res, [
+            (p.score, tag_mask(p.tag) & keep_mask) for p in parses
+        ])
+        return res
+
+    def _filtered_grammemes(self, parse):
+        mask = GRAMMEME_BITS.tag_mask(parse.tag) & self._keep_mask()
+        return self._names(mask)
+
+    def _names(self, mask):
+        if not mask and self.only is not None:
+            return ('NA',)
+        return GRAMMEME_BITS.names(mask)
+
+    def _keep_mask(self):
+        # Grammemes to keep, as a bit mask. It is computed lazily
+        # because bit assignment is process-local.
+        try:
+            return self._keep_mask_value
+        except AttributeError:
+            mask = ~GRAMMEME_BITS.mask(self.ignore)
+            if self.only is not None:
+                mask &= GRAMMEME_BITS.mask(self.only)
+            self._keep_mask_value = mask
+            return mask
+
+    def _write_masked(self, feature_dict, scored_masks):
         raise NotImplementedError()
 
+    def __getstate__(self):
+        dct = self.__dict__.copy()
+        dct.pop('_keep_mask_value', None)
+        return dct
+
+    def __setstate__(self, state):
+        state = dict(state)
+        # older versions stored 'ignore' and 'only' as plain attributes
+        old = dict((key, state.pop(key)) for key in ('ignore', 'only') if key in state)
+        self.__dict__.update(state)
+        for key, value in old.items():
+            setattr(self, key, value)
+
 
 class Grammeme(_GrammemeFeatures):
     """
@@ -110,24 +235,23 @@ class Grammeme(_GrammemeFeatures):
     """
     default_name = 'Grammeme'
 
-    def extract(self, parses):
+    def _write_masked(self, feature_dict, scored_masks):
         features = {}
         features_unambig = {}
 
-        for p in parses:
-            for grammeme in self._filtered_grammemes(p):
+        for score, mask in scored_masks:
+            for grammeme in self._names(mask):
                 # TODO/FIXME: sum instead of max or in addition to max
-                features[grammeme] = max(p.score, features.get(grammeme, 0))
-                # features[grammeme] = features.get(grammeme, 0) + p.score
+                if grammeme not in features or features[grammeme] < score:
+                    features[grammeme] = score
 
                 # TODO/FIXME: grammeme is unambiguous when its scores sums to 1?
-                if self.add_unambig and p.score == 1:
+                if self.add_unambig and score == 1:
                     features_unambig[grammeme] = 1
 
-        res = {self.name: features}
+        feature_dict[self.name] = features
         if self.add_unambig:
-            res[self.unambig_name] = features_unambig
-        return res
+            feature_dict[self.unambig_name] = features_unambig
 
 
 class GrammemePair(_GrammemeFeatures):
@@ -138,34 +262,24 @@ class GrammemePair(_GrammemeFeatures):
     default_name = 'GrammemePair'
     default_threshold = 0.1
 
-    def extract(self, parses):
+    def _write_masked(self, feature_dict, scored_masks):
         features = {}
         features_unambig = {}
-        for p in parses:
-            grammemes = self._filtered_grammemes(p)
-            for pair in _iter_grammeme_pairs(grammemes):
+        for score, mask in scored_masks:
+            if not mask:  # 'NA' or no grammemes: there are no pairs
+                continue
+            for pair in GRAMMEME_BITS.pairs(mask):
                 # TODO/FIXME: sum instead of max or in addition to max
-                features[pair] = max(p.score, features.get(pair, 0))
-                # features[pair] = features.get(pair, 0) + p.score
+                if pair not in features or features[pair] < score:
+                    features[pair] = score
 
                 # TODO/FIXME: grammeme is unambiguous when its scores sums to 1
-                if self.add_unambig and p.score == 1:
+                if self.add_unambig and score == 1:
                     features_unambig[pair] = 1
 
-        res = {self.name: features}
+        feature_dict[self.name] = features
         if self.add_unambig:
-            res[self.unambig_name] = features_unambig
-        return res
-
-
-def _iter_grammeme_pairs(grammemes):
-    for idx, grammeme in enumerate(grammemes):
-        for grammeme2 in grammemes[idx+1:]:
-            # make grammeme order always the same
-            if grammeme < grammeme2:
-                yield ",".join([grammeme, grammeme2])
-            else:
-                yield ",".join([grammeme2, grammeme])
+            feature_dict[self.unambig_name] = features_unambig
 
 
 
@@ -257,12 +371,17 @@ class Pattern(object):
 
     def _init(self):
         self.patterns = []
+        self._column_specs = []
         index_low, index_high, names = 0, 0, []
 
         for pattern in self._init_patterns:
             offset, feat, name = self._parse_pattern(pattern)
             func = self._get_feature_func(feat)
             self.patterns.append((offset, func, name))
+            if callable(feat):
+                self._column_specs.append((offset, None, feat))
+            else:
+                self._column_specs.append((offset, feat, None))
 
             if index_low < -offset:
                 index_low = -offset
@@ -279,6 +398,26 @@ class Pattern(object):
         else:
             self._get_combined_value = self._get_combined_value_multi
 
+        self.feature_keys = (self.name,)
+        # the value at a position depends on tokens this far from it
+        self.feature_reach = max(
+            [abs(offset) for offset, func, name in self.patterns] +
+            [self.index_low, self.index_high, 0]
+        )
+        if any(func is not None and func_takes_argument(func, 'feature_dict')
+               for offset, key, func in self._column_specs):
+            self.required_keys = None  # callables may read any key
+        else:
+            self.required_keys = tuple(
+                key for offset, key, func in self._column_specs if key is not None
+            )
+
+        # Patterns which read their own output or pass feature dicts
+        # to callables must be evaluated position by position.
+        self._columns_by_position = (
+            self.required_keys is None or self.name in self.required_keys
+        )
+
     def _parse_pattern(self, pattern):
         if len(pattern) == 2:
             offset, feat = pattern
@@ -342,6 +481,65 @@ class Pattern(object):
 
             featdict[self.name] = self._get_combined_value(values)
 
+    def apply_columns(self, tokens, parsed_tokens, table):
+        """
+        Same as __call__, but for a :class:`~morphine.feature_table.FeatureTable`.
+        Dictionary lookups are column shifts.
+        """
+        length = len(table)
+        positions = range(self.index_low, length - self.index_high)
+        if not positions:
+            return
+
+        if self._columns_by_position:
+            self._apply_columns_by_position(tokens, parsed_tokens, table, positions)
+            return
+
+        value_columns = []
+        for offset, key, func in self._column_specs:
+            start, stop = positions[0] + offset, positions[-1] + offset + 1
+            if key is not None:
+                column = table.column(key)
+                if column is None:
+                    column = [None] * length
+                values = [
+                    column[index] if 0 <= index < length else self.out_value
+                    for index in range(start, stop)
+                ]
+                values = [self.missing_value if v is None else v for v in values]
+            else:
+                values = [
+                    func(tokens[index], parsed_tokens[index]) if 0 <= index < length
+                    else self.out_value
+                    for index in range(start, stop)
+                ]
+            value_columns.append(values)
+
+        if len(value_columns) == 1:
+            combined = value_columns[0]
+        else:
+            combined = [self._get_combined_value(list(values))
+                        for values in zip(*value_columns)]
+
+        column = table.column(self.name)
+        if column is None:
+            column = [None] * length
+            table.set_column(self.name, column)
+        column[positions[0]:positions[-1] + 1] = combined
+
+    def _apply_columns_by_position(self, tokens, parsed_tokens, table, positions):
+        length = len(table)
+        for pos in positions:
+            values = []
+            for offset, func, name in self.patterns:
+                index = pos + offset
+                if 0 <= index < length:
+                    value = func(tokens[index], parsed_tokens[index], table.row(index))
+                else:
+                    value = self.out_value
+                values.append(value)
+            table.set_value(self.name, pos, self._get_combined_value(values))
+
     def _get_combined_value_single(self, values):
         return values[0]
 
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental disambiguation of a sentence which is being edited::
+
+    sent = IncrementalParse(disambiguator, ['Мама', 'мыла', 'раму'])
+    sent.replace(2, 3, ['окно'])
+    sent.insert(0, ['Вчера'])
+    sent.delete(1, 2)
+    sent.parses  # same as disambiguator.parse(sent.tokens)
+
+Tokens, their pymorphy2 parses and feature dicts of each feature
+extractor are kept between edits. After an edit only new tokens are
+parsed, and only feature dicts within
+:meth:`~morphine.feature_extractor.FeatureExtractor.feature_reach`
+of the changed tokens are recomputed. CRF marginals depend on the whole
+sentence, so they are recomputed from the kept feature dicts.
+"""
+from __future__ import absolute_import
+
+from morphine.basetagger import tokenize_if_needed
+
+
+class IncrementalParse(object):
+    """
+    A sentence disambiguated by ``disambiguator``; ``parses`` are
+    the same as ``disambiguator.parse(tokens)`` would return
+    (without a deadline).
+    """
+    def __init__(self, disambiguator, tokens=()):
+        self.disambiguator = disambiguator
+        self.tokens = []
+        self.parsed_tokens = []
+        self.parses = []
+        self._feature_dicts = {}
+        for tagger in disambiguator.partial_taggers:
+            if tagger.crf is None:
+                raise ValueError("Tagger is not trained")
+            self._feature_dicts[id(tagger.fe)] = []
+        self.replace(0, 0, tokens)
+
+    def insert(self, pos, tokens):
+        """ Insert ``tokens`` before position ``pos`` """
+        return self.replace(pos, pos, tokens)
+
+    def delete(self, start, stop):
+        """ Delete tokens ``start:stop`` """
+        return self.replace(start, stop, [])
+
+    def replace(self, start, stop, tokens):
+        """
+        Replace tokens ``start:stop`` with ``tokens`` (a list of tokens
+        or a text to tokenize) and return updated parses.
+        """
+        if not 0 <= start <= stop <= len(self.tokens):
+            raise IndexError("Invalid token range: %d:%d" % (start, stop))
+        tokens, parsed_tokens = self.disambiguator._tokenize_and_parse(
+            list(tokenize_if_needed(tokens)))
+        self.tokens[start:stop] = tokens
+        self.parsed_tokens[start:stop] = parsed_tokens
+
+        new_stop = start + len(tokens)
+        for tagger in self._unique_extractor_taggers():
+            self._update_features(tagger.fe, start, stop, new_stop)
+
+        self.parses = self._disambiguate()
+        return self.parses
+
+    def _unique_extractor_taggers(self):
+        seen = set()
+        for tagger in self.disambiguator.partial_taggers:
+            if id(tagger.fe) not in seen:
+                seen.add(id(tagger.fe))
+                yield tagger
+
+    def _update_features(self, fe, start, stop, new_stop):
+        feature_dicts = self._feature_dicts[id(fe)]
+        feature_dicts[start:stop] = [None] * (new_stop - start)
+
+        reach = fe.feature_reach()
+        if reach is None:
+            low, high = 0, len(self.tokens)
+        else:
+            # edge features of tokens next to the edit may change, too
+            low = max(start - reach - 1, 0)
+            high = min(new_stop + reach + 1, len(self.tokens))
+        feature_dicts[low:high] = fe.transform_window(
+            self.tokens, self.parsed_tokens, low, high)
+
+    def _disambiguate(self):
+        if not self.tokens:
+            return []
+        dis = self.disambiguator
+        tagger_probs = []
+        for tagger in dis.partial_taggers:
+            xseq = self._feature_dicts[id(tagger.fe)]
+            marginals = tagger.crf.predict_marginals_single(xseq)
+            tagger_probs.append(tagger._parse_probs(self.parsed_tokens, marginals))
+        token_probs = [dis._combine_marginals(parse_probs)
+                       for parse_probs in zip(*tagger_probs)]
+        return dis._scored_parses(self.parsed_tokens, token_probs)
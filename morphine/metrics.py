@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation metrics for sequence labelling results.
+"""
+from __future__ import absolute_import, division
+import math
+from collections import Counter
+
+from six.moves import zip
+
+
+def flat_accuracy(y_true, y_pred):
+    """
+    Fraction of correctly predicted labels in all sequences::
+
+        >>> flat_accuracy([['a', 'b'], ['a']], [['a', 'a'], ['a']])
+        0.6666666666666666
+
+    """
+    total = correct = 0
+    for yseq_true, yseq_pred in zip(y_true, y_pred):
+        for true, pred in zip(yseq_true, yseq_pred):
+            total += 1
+            correct += true == pred
+    return correct / total if total else 0.0
+
+
+def label_scores(y_true, y_pred):
+    """
+    Return ``{label: (precision, recall, f1, support)}`` for all labels
+    from ``y_true`` and ``y_pred``::
+
+        >>> scores = label_scores([['a', 'b'], ['a']], [['a', 'a'], ['a']])
+        >>> scores['b']
+        (0.0, 0.0, 0.0, 1)
+
+    """
+    true_counts, pred_counts, correct = Counter(), Counter(), Counter()
+    for yseq_true, yseq_pred in zip(y_true, y_pred):
+        for true, pred in zip(yseq_true, yseq_pred):
+            true_counts[true] += 1
+            pred_counts[pred] += 1
+            if true == pred:
+                correct[true] += 1
+
+    scores = {}
+    for label in set(true_counts) | set(pred_counts):
+        precision = correct[label] / pred_counts[label] if pred_counts[label] else 0.0
+        recall = correct[label] / true_counts[label] if true_counts[label] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        scores[label] = (precision, recall, f1, true_counts[label])
+    return scores
+
+
+def flat_f1(y_true, y_pred):
+    """
+    Macro-averaged F1 score over labels present in ``y_true``::
+
+        >>> flat_f1([['a', 'b'], ['a']], [['a', 'a'], ['a']])
+        0.4
+
+    """
+    scores = label_scores(y_true, y_pred)
+    f1s = [f1 for precision, recall, f1, support in scores.values() if support]
+    return sum(f1s) / len(f1s) if f1s else 0.0
+
+
+def percentile(values, q):
+    """
+    Return ``q``-th percentile (0 <= q <= 100) of ``values``
+    using the nearest-rank method::
+
+        >>> percentile([1, 2, 3, 4], 50)
+        2
+        >>> percentile([1, 2, 3, 4], 99)
+        4
+        >>> percentile([], 50)
+
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(q / 100 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Preforking worker pool. A Disambiguator is loaded and warmed up once
+in the parent process; workers are forked afterwards, so model data
+(pymorphy2 dictionaries, CRF models, feature extractors) stays in
+memory pages shared copy-on-write between all workers.
+
+Only POSIX systems support :func:`os.fork`; per-process memory
+reports are available on Linux.
+"""
+from __future__ import absolute_import, print_function
+import gc
+import os
+import signal
+import sys
+import traceback
+
+from morphine.utils import current_rss
+
+
+def warm_up(disambiguator, sents=None):
+    """
+    Prepare ``disambiguator`` for forking: open all CRF taggers
+    (normally they are opened lazily on the first request),
+    parse warm-up ``sents`` to populate internal caches and
+    move all objects created so far to the permanent GC generation,
+    so that garbage collection in workers doesn't touch (and copy)
+    the shared pages.
+    """
+    for tagger in disambiguator.partial_taggers:
+        if tagger.crf is not None:
+            tagger.crf.tagger
+
+    for sent in sents or []:
+        disambiguator.parse(sent)
+
+    gc.collect()
+    if hasattr(gc, 'freeze'):  # Python 3.7+
+        gc.freeze()
+
+
+class PreforkPool(object):
+    """
+    Fork ``workers`` processes; each process calls
+    ``target(disambiguator, worker_index)`` and exits when it returns.
+
+    A typical ``target`` serves requests from a listening socket
+    created in the parent before :meth:`start` is called.
+
+    Parameters
+    ----------
+
+    disambiguator : Disambiguator
+        Fully loaded disambiguator to share between workers.
+
+    target : callable
+        Worker main function.
+
+    workers : int
+        Number of worker processes.
+
+    warmup_sents : list, optional
+        Sentences to parse in the parent process before forking.
+        See :func:`warm_up`.
+    """
+    def __init__(self, disambiguator, target, workers=2, warmup_sents=None):
+        self.disambiguator = disambiguator
+        self.target = target
+        self.workers = workers
+        self.warmup_sents = warmup_sents
+        self.pids = []
+
+    def start(self):
+        warm_up(self.disambiguator, self.warmup_sents)
+        for index in range(self.workers):
+            pid = os.fork()
+            if pid == 0:
+                self._run_worker(index)
+            self.pids.append(pid)
+        return self
+
+    def join(self):
+        """
+        Wait for all workers to exit; return a list of their exit codes.
+        """
+        codes = []
+        for pid in self.pids:
+            _, status = os.waitpid(pid, 0)
+            if os.WIFSIGNALED(status):
+                codes.append(-os.WTERMSIG(status))
+            else:
+                codes.append(os.WEXITSTATUS(status))
+        self.pids = []
+        return codes
+
+    def terminate(self, sig=signal.SIGTERM):
+        for pid in self.pids:
+            try:
+                os.kill(pid, sig)
+            except OSError:
+                pass
+
+    def memory_report(self):
+        """
+        Return a list of memory usage dicts (see :func:`process_memory`)
+        for the parent process and all workers. ``unique`` is the memory
+        which is not shared with other processes; if model pages are
+        shared, it should stay small for each worker.
+        """
+        report = [dict(process_memory(os.getpid()), role='parent')]
+        for index, pid in enumerate(self.pids):
+            report.append(dict(process_memory(pid), role='worker %d' % index))
+        return report
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.terminate()
+        self.join()
+
+    def _run_worker(self, index):
+        code = 0
+        try:
+            self.target(self.disambiguator, index)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+
+def process_memory(pid):
+    """
+    Return a dict with memory usage of a process, in bytes:
+
+    * ``rss`` - resident set size;
+    * ``pss`` - proportional set size (shared pages are divided
+      between processes sharing them);
+    * ``unique`` - private (not shared) resident memory.
+
+    Values are None if the information is not available
+    (``/proc/<pid>/smaps`` is Linux-specific).
+    """
+    res = {'pid': pid, 'rss': current_rss(pid), 'pss': None, 'unique': None}
+    fields = _read_smaps(pid)
+    if fields is None:
+        return res
+    kb = 1024
+    res['pss'] = fields.get('Pss', 0) * kb
+    res['unique'] = (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) * kb
+    return res
+
+
+def _read_smaps(pid):
+    # smaps_rollup (Linux 4.14+) is much faster than smaps
+    for name in ['smaps_rollup', 'smaps']:
+        path = '/proc/%d/%s' % (pid, name)
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except (IOError, OSError):
+            continue
+
+        fields = {}
+        for line in lines:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                key = parts[0].rstrip(':')
+                fields[key] = fields.get(key, 0) + int(parts[1])
+        return fields
+    return None
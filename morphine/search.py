@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel search over CRF training parameters and feature extractors.
+
+Features are extracted once per extractor and saved to temporary files;
+each worker process loads features of an extractor the first time
+a trial needs them and keeps them for other trials::
+
+    results = grid_search(
+        extractors={'base': CaseFeatureExtractor(), 'big': BigExtractor()},
+        param_grid={'c1': [0.01, 0.1, 1.0], 'c2': [0.001, 0.01]},
+        train=(train_parsed_sents, y_train),
+        dev=(dev_parsed_sents, y_dev),
+        workers=4,
+    )
+    print(format_results(results))
+    fast = pick_fast(results, tolerance=0.005)
+
+Results are dicts sorted by dev F1 (best first) with ``extractor``,
+``params``, ``f1``, ``accuracy``, ``model_size`` (bytes),
+``tokens_per_sec`` (dev set speed: feature extraction and tagging),
+``extract_time`` and ``tag_time`` (seconds spent on the dev set),
+``train_time`` and ``pareto`` keys; ``pareto`` is True for results
+not beaten by another result on F1, size and speed at once.
+"""
+from __future__ import absolute_import, division
+import itertools
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+from morphine.crfsuite import CRF
+from morphine.metrics import flat_accuracy, flat_f1
+
+
+def grid_search(extractors, param_grid, train, dev, algorithm='lbfgs',
+                workers=None):
+    """
+    Train a CRF for each combination of an extractor and training
+    parameters and evaluate it on the dev set.
+
+    Parameters
+    ----------
+
+    extractors : dict or list of FeatureExtractor
+        Feature extractors to try. If a list is passed, class names
+        are used as extractor names.
+
+    param_grid : dict or list of dicts
+        ``{param: list of values}``; all combinations are tried.
+        A list of such dicts is a union of grids.
+
+    train, dev : tuples
+        ``(parsed_sents, y)`` for training and evaluation; ``parsed_sents``
+        is a list of ``(tokens, parsed_tokens)`` tuples
+        (see :func:`~morphine.feature_extractor.get_parsed_sents`),
+        ``y`` is a list of label sequences.
+
+    algorithm : str
+        crfsuite training algorithm.
+
+    workers : int, optional
+        Number of processes (default is the number of CPUs).
+        With ``workers=1`` trials run in this process.
+    """
+    if not isinstance(extractors, dict):
+        extractors = dict((type(fe).__name__, fe) for fe in extractors)
+    trials = [
+        (name, params)
+        for name in sorted(extractors)
+        for params in expand_grid(param_grid)
+    ]
+
+    tmpdir = tempfile.mkdtemp(prefix='morphine-search-')
+    try:
+        feature_files = {}
+        for idx, name in enumerate(sorted(extractors)):
+            fe = extractors[name]
+            path = feature_files[name] = os.path.join(tmpdir, '%d.pickle' % idx)
+            X_train = fe.transform(train[0])
+            start = time.time()
+            X_dev = fe.transform(dev[0])
+            extract_time = time.time() - start
+            data = (X_train, train[1], X_dev, dev[1], extract_time)
+            with open(path, 'wb') as f:
+                pickle.dump(data, f, 2)
+
+        init_args = (feature_files, algorithm)
+        if workers == 1:
+            _init_worker(*init_args)
+            try:
+                results = list(map(_run_trial, trials))
+            finally:
+                _features.clear()
+        else:
+            pool = multiprocessing.Pool(workers, _init_worker, init_args)
+            try:
+                results = pool.map(_run_trial, trials, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return rank_results(results)
+
+
+def expand_grid(param_grid):
+    """
+    Return a list of parameter dicts for all combinations of values::
+
+        >>> grid = expand_grid({'c1': [0, 1], 'c2': [0.1]})
+        >>> grid == [{'c1': 0, 'c2': 0.1}, {'c1': 1, 'c2': 0.1}]
+        True
+
+    """
+    if isinstance(param_grid, dict):
+        param_grid = [param_grid]
+    res = []
+    for grid in param_grid:
+        keys = sorted(grid)
+        for values in itertools.product(*[grid[key] for key in keys]):
+            res.append(dict(zip(keys, values)))
+    return res
+
+
+def rank_results(results):
+    """
+    Sort results by F1 (then by model size and speed) and mark
+    Pareto-optimal ones.
+    """
+    results = sorted(results, key=lambda r: (-r['f1'], r['model_size'], -r['tokens_per_sec']))
+    for res in results:
+        res['pareto'] = not any(_dominates(other, res) for other in results)
+    return results
+
+
+def pick_fast(results, tolerance=0.0):
+    """
+    Return the fastest result with F1 no more than ``tolerance`` below
+    the best F1.
+    """
+    best_f1 = max(res['f1'] for res in results)
+    good = [res for res in results if res['f1'] >= best_f1 - tolerance]
+    return max(good, key=lambda r: (r['tokens_per_sec'], -r['model_size']))
+
+
+def format_results(results):
+    """ Return a text table with search results """
+    lines = ["%-20s %-6s %-8s %-10s %-10s %-8s %s" % (
+        "extractor", "F1", "acc", "size", "tokens/s", "pareto", "params")]
+    for res in results:
+        lines.append("%-20s %0.4f %0.4f %-10d %-10.0f %-8s %s" % (
+            res['extractor'], res['f1'], res['accuracy'], res['model_size'],
+            res['tokens_per_sec'], '*' if res['pareto'] else '',
+            ", ".join("%s=%s" % item for item in sorted(res['params'].items()))
+        ))
+    return "\n".join(lines)
+
+
+def _dominates(a, b):
+    not_worse = (a['f1'] >= b['f1'] and a['model_size'] <= b['model_size'] and
+                 a['tokens_per_sec'] >= b['tokens_per_sec'])
+    better = (a['f1'] > b['f1'] or a['model_size'] < b['model_size'] or
+              a['tokens_per_sec'] > b['tokens_per_sec'])
+    return not_worse and better
+
+
+_feature_files = None
+_algorithm = None
+_features = {}
+
+
+def _init_worker(feature_files, algorithm):
+    global _feature_files, _algorithm
+    _feature_files = feature_files
+    _algorithm = algorithm
+    _features.clear()
+
+
+def _load_features(name):
+    if name not in _features:
+        with open(_feature_files[name], 'rb') as f:
+            _features[name] = pickle.load(f)
+    return _features[name]
+
+
+def _run_trial(trial):
+    name, params = trial
+    X_train, y_train, X_dev, y_dev, extract_time = _load_features(name)
+
+    crf = CRF(algorithm=_algorithm, train_params=params)
+    start = time.time()
+    crf.fit(X_train, y_train)
+    train_time = time.time() - start
+
+    tagger = crf.tagger
+    start = time.time()
+    y_pred = [tagger.tag(xseq) for xseq in X_dev]
+    tag_time = time.time() - start
+    n_tokens = sum(len(yseq) for yseq in y_dev)
+    total_time = extract_time + tag_time
+
+    return {
+        'extractor': name,
+        'params': params,
+        'f1': flat_f1(y_dev, y_pred),
+        'accuracy': flat_accuracy(y_dev, y_pred),
+        'model_size': os.path.getsize(crf.modelfile.name),
+        'tokens_per_sec': n_tokens / total_time if total_time else float('inf'),
+        'extract_time': extract_time,
+        'tag_time': tag_time,
+        'train_time': train_time,
+    }
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent read-only store for precomputed pymorphy2 parses and
+token feature dicts.
+
+A store is built once for a frequency-ranked vocabulary
+(see :func:`build_store`) and then opened with :class:`ParseStore`
+by every process; the file is memory-mapped, so all processes share
+the same pages and start warm.
+
+File layout: a fixed header (magic, format version, length of JSON
+metadata), JSON metadata, then one table per section. A table is
+an array of little-endian uint64 entry offsets followed by entries
+sorted by key; each entry is ``uint32 key length, key, uint32 value
+length, value`` where key is UTF-8 and value is UTF-8 JSON.
+"""
+from __future__ import absolute_import
+import io
+import json
+import mmap
+import struct
+from collections import OrderedDict
+
+import six
+
+MAGIC = b'MORPHINE-STORE\x00\x00'
+VERSION = 2
+
+_HEADER = struct.Struct('<16sII')
+_OFFSET = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+
+PARSES_SECTION = 'parses'
+
+
+def build_store(path, morph, vocabulary, extractors=None, max_words=None):
+    """
+    Precompute ``morph.parse`` results (and, optionally, token feature
+    dicts) for words from ``vocabulary`` and write them to ``path``.
+
+    Parameters
+    ----------
+
+    path : str
+        Output file name.
+
+    morph : pymorphy2.MorphAnalyzer
+        Analyzer to use.
+
+    vocabulary : iterable of str
+        Tokens, most frequent first. Parses and token features are
+        stored for tokens as is: pymorphy2 results depend on letter
+        case (e.g. 'И' may be an abbreviation), so 'Мама' and 'мама'
+        are different entries.
+
+    extractors : dict or list of FeatureExtractor, optional
+        Extractors to precompute token features for. If a list is passed,
+        class names are used as extractor names (see
+        :meth:`~morphine.feature_extractor.FeatureExtractor.use_store`).
+        Signatures of their token features are saved, so the features
+        are only used by extractors with the same token features.
+
+    max_words : int, optional
+        Only store this many first tokens of ``vocabulary``.
+    """
+    if extractors is None:
+        extractors = {}
+    elif not isinstance(extractors, dict):
+        extractors = dict((type(fe).__name__, fe) for fe in extractors)
+
+    parses = {}
+    features = dict((name, {}) for name in extractors)
+    for num, token in enumerate(vocabulary):
+        if max_words is not None and num >= max_words:
+            break
+        token_parses = morph.parse(token)
+        if token not in parses:
+            parses[token] = [
+                [p.word, str(p.tag), p.normal_form, p.score,
+                 _encode_stack(p.methods_stack)]
+                for p in token_parses
+            ]
+        for name, fe in extractors.items():
+            features[name][token] = fe.combined_token_features(token, token_parses)
+
+    sections = [(PARSES_SECTION, parses)]
+    sections += [(_features_section(name), features[name]) for name in sorted(features)]
+    signatures = dict((name, fe.token_features_signature())
+                      for name, fe in extractors.items())
+    _write(path, sections, {'extractors': sorted(extractors),
+                            'signatures': signatures})
+
+
+class ParseStore(object):
+    """
+    Read-only memory-mapped store created by :func:`build_store`::
+
+        store = ParseStore('vocab.store', morph)
+        disambiguator = Disambiguator(morph, taggers, store=store)
+
+    :meth:`parse` returns pymorphy2 parses for stored words and None
+    for unknown words (decoded parses of up to ``cache_size`` recently
+    used words are kept in memory); :meth:`token_features` returns
+    a fresh copy of a stored token feature dict or None.
+    """
+    cache_size = 50000
+
+    def __init__(self, path, morph, cache_size=50000):
+        self.path = path
+        self.morph = morph
+        self.cache_size = cache_size
+        self._open()
+
+    def _open(self):
+        with io.open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, meta_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a morphine store" % self.path)
+        if version != VERSION:
+            raise ValueError("Unsupported store format version: %s" % version)
+
+        start = _HEADER.size
+        meta = json.loads(self._mmap[start:start + meta_length].decode('utf8'))
+        self.extractors = meta['extractors']
+        self._signatures = meta.get('signatures', {})
+        self._tables = dict(
+            (name, _Table(self._mmap, offset, count))
+            for name, offset, count in meta['sections']
+        )
+        self._tags = {}
+        self._parses = OrderedDict()
+        self._units = _collect_units(self.morph)
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, word):
+        parses = self._parses.pop(word, None)
+        if parses is None:
+            data = self._tables[PARSES_SECTION].get(word)
+            if data is None:
+                self.misses += 1
+                return None
+            # Parse tuples are immutable, so decoded entries are reused
+            parses = [
+                self.morph._result_type(
+                    parse_word, self._tag(tag), normal_form, score,
+                    self._decode_stack(stack)
+                )
+                for parse_word, tag, normal_form, score, stack in data
+            ]
+            if len(self._parses) >= self.cache_size and self._parses:
+                self._parses.popitem(last=False)
+        if self.cache_size > 0:
+            self._parses[word] = parses  # most recently used is the last
+        self.hits += 1
+        return list(parses)
+
+    def token_features_signature(self, name):
+        """
+        Return the signature of token features stored under ``name``
+        (see :meth:`~morphine.feature_extractor.FeatureExtractor.token_features_signature`)
+        or None if there are no such features.
+        """
+        if name not in self.extractors:
+            return None
+        return self._signatures.get(name)
+
+    def token_features(self, name, token):
+        table = self._tables.get(_features_section(name))
+        if table is None:
+            return None
+        return table.get(token)
+
+    def __len__(self):
+        return len(self._tables[PARSES_SECTION])
+
+    def close(self):
+        self._mmap.close()
+
+    def _tag(self, tag_string):
+        try:
+            return self._tags[tag_string]
+        except KeyError:
+            tag = self._tags[tag_string] = self.morph.TagClass(tag_string)
+            return tag
+
+    def _decode_stack(self, obj):
+        if isinstance(obj, dict):
+            return self._units[obj['unit']]
+        if isinstance(obj, list):
+            return tuple(self._decode_stack(item) for item in obj)
+        return obj
+
+    def __getstate__(self):
+        return {'path': self.path, 'morph': self.morph,
+                'cache_size': self.cache_size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+
+class _Table(object):
+    def __init__(self, buf, offset, count):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def _entry_offset(self, idx):
+        return _OFFSET.unpack_from(self._buf, self._offset + idx * _OFFSET.size)[0]
+
+    def _key(self, pos):
+        length = _LENGTH.unpack_from(self._buf, pos)[0]
+        start = pos + _LENGTH.size
+        return self._buf[start:start + length], start + length
+
+    def get(self, key):
+        key = key.encode('utf8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_key, pos = self._key(self._entry_offset(mid))
+            if entry_key < key:
+                lo = mid + 1
+            elif entry_key > key:
+                hi = mid
+            else:
+                length = _LENGTH.unpack_from(self._buf, pos)[0]
+                start = pos + _LENGTH.size
+                return json.loads(self._buf[start:start + length].decode('utf8'))
+        return None
+
+
+def _features_section(name):
+    return 'features:' + name
+
+
+def _collect_units(morph):
+    """
+    Return a dict {class name: analyzer unit} with all units of ``morph``,
+    including helper units stored as attributes of other units
+    (e.g. a fake dictionary of KnownSuffixAnalyzer).
+    """
+    from pymorphy2.units.base import BaseAnalyzerUnit
+
+    units = {}
+    top_level = [unit for unit, terminal in morph._units]
+    for unit in top_level:
+        units.setdefault(type(unit).__name__, unit)
+    for unit in top_level:
+        for value in vars(unit).values():
+            if isinstance(value, BaseAnalyzerUnit):
+                units.setdefault(type(value).__name__, value)
+    return units
+
+
+def _encode_stack(obj):
+    # analyzer units are stored by class name
+    if isinstance(obj, (tuple, list)):
+        return [_encode_stack(item) for item in obj]
+    if isinstance(obj, six.string_types + six.integer_types + (float, type(None))):
+        return obj
+    return {'unit': type(obj).__name__}
+
+
+def _write(path, sections, meta):
+    encoded = []
+    for name, data in sections:
+        entries = sorted(
+            (key.encode('utf8'), json.dumps(value, ensure_ascii=False).encode('utf8'))
+            for key, value in data.items()
+        )
+        encoded.append((name, entries))
+
+    # metadata size depends on section offsets; reserve enough space
+    # by computing offsets with a placeholder first
+    meta = dict(meta, sections=[[name, 0, len(entries)] for name, entries in encoded])
+    meta_length = len(json.dumps(meta).encode('utf8')) + 32 * len(encoded)
+
+    offset = _HEADER.size + meta_length
+    for section, (name, entries) in zip(meta['sections'], encoded):
+        section[1] = offset
+        offset += _OFFSET.size * len(entries)
+        offset += sum(2 * _LENGTH.size + len(k) + len(v) for k, v in entries)
+
+    meta_bytes = json.dumps(meta).encode('utf8')
+    meta_bytes += b' ' * (meta_length - len(meta_bytes))
+
+    with io.open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, meta_length))
+        f.write(meta_bytes)
+        for section, (name, entries) in zip(meta['sections'], encoded):
+            pos = section[1] + _OFFSET.size * len(entries)
+            for key, value in entries:
+                f.write(_OFFSET.pack(pos))
+                pos += 2 * _LENGTH.size + len(key) + len(value)
+            for key, value in entries:
+                f.write(_LENGTH.pack(len(key)))
+                f.write(key)
+                f.write(_LENGTH.pack(len(value)))
+                f.write(value)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Train all partial taggers of a Disambiguator at once::
+
+    taggers = [
+        cases_model.Tagger(cases_model.CaseFeatureExtractor()),
+        pos_model.Tagger(pos_model.POSFeatureExtractor()),
+        number_model.Tagger(number_model.NumberFeatureExtractor()),
+    ]
+    disambiguator, report = train_disambiguator(morph, tagged_sents, taggers)
+    print(format_report(report))
+
+The corpus is parsed by pymorphy2 once, features are extracted once per
+feature extractor, and CRF models are trained concurrently, each in its
+own process. Features are passed to worker processes through temporary
+files, written once per extractor.
+
+Sentences without ambiguity for a tagger (e.g. all words have the same
+number in all pymorphy2 parses) teach its CRF little; they can be
+dropped or downsampled with :func:`reduce_corpus` (or ``reduction``
+argument of :func:`train_disambiguator`). :func:`evaluate_reduction`
+shows how training time and accuracy change.
+"""
+from __future__ import absolute_import, division
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import time
+
+from morphine.basetagger import Disambiguator
+from morphine.crfsuite import CRF
+from morphine.feature_extractor import get_parsed_sents
+from morphine.utils import current_rss, peak_rss, tagger_name
+
+
+def train_disambiguator(morph, tagged_sents, taggers, algorithm='lbfgs',
+                        train_params=None, workers=None, threshold=0,
+                        reduction=None):
+    """
+    Train ``taggers`` and return ``(disambiguator, report)`` tuple.
+
+    Parameters
+    ----------
+
+    morph : pymorphy2.MorphAnalyzer
+        Analyzer to parse the corpus with.
+
+    tagged_sents : list of lists of (token, tag) tuples
+        Training corpus; tags are pymorphy2 tags or tag strings.
+        Labels for each tagger are computed with its ``outval`` method.
+
+    taggers : list of PartialTagger
+        Taggers to train. If a tagger already has a ``crf``, its
+        algorithm, training parameters and trainer class are reused
+        for the new model; otherwise ``algorithm`` and ``train_params``
+        are used.
+
+    workers : int, optional
+        Number of processes (default is the number of CPUs).
+        With ``workers=1`` models are trained in this process
+        one after another.
+
+    reduction : dict, optional
+        Keyword arguments for :func:`reduce_corpus`; if passed, each
+        tagger is trained on sentences selected for it.
+
+    Returns
+    -------
+
+    disambiguator : Disambiguator
+        Disambiguator with trained taggers.
+
+    report : list of dicts
+        Per-tagger ``name``, ``sentences`` (number of training
+        sentences), ``extract_time``, ``train_time`` (seconds)
+        and ``peak_rss`` (bytes; how much the peak resident memory of
+        the training process grew above its resident memory when
+        the process started, i.e. memory used by loading features
+        and by the model training itself, without the memory forked
+        processes share with the parent; None with ``workers=1``
+        or if it is not available).
+        The first item is ``'parse'``: the time spent on parsing
+        the corpus.
+    """
+    report = []
+    start = time.time()
+    sents = [[token for token, tag in sent] for sent in tagged_sents]
+    parsed_sents = get_parsed_sents(morph, sents)
+    tags = [
+        [morph.TagClass(tag) if not isinstance(tag, morph.TagClass) else tag
+         for token, tag in sent]
+        for sent in tagged_sents
+    ]
+    report.append({'name': 'parse', 'sentences': len(parsed_sents),
+                   'extract_time': time.time() - start,
+                   'train_time': 0.0, 'peak_rss': None})
+
+    # taggers which share an extractor and training sentences
+    # share extracted features
+    features = {}
+    tasks = []
+    for tagger in taggers:
+        start = time.time()
+        if reduction is None:
+            keep = None
+        else:
+            keep = tuple(reduce_corpus(tagger, parsed_sents, **reduction))
+            if not keep:
+                raise ValueError("No training sentences left for %s after reduction"
+                                 % tagger_name(tagger))
+        key = id(tagger.fe), keep
+        if key not in features:
+            sents = parsed_sents if keep is None else [parsed_sents[idx] for idx in keep]
+            features[key] = tagger.fe.transform(sents)
+        X = features[key]
+        y = [[tagger.outval(tag) for tag in tags[idx]]
+             for idx in (keep if keep is not None else range(len(tags)))]
+        tasks.append((_new_crf(tagger.crf, algorithm, train_params), key, y))
+        report.append({'name': tagger_name(tagger), 'sentences': len(X),
+                       'extract_time': time.time() - start})
+
+    if workers == 1:
+        results = [_train((crf, features[key], y)) for crf, key, y in tasks]
+    else:
+        results = _train_in_processes(tasks, features, workers)
+
+    for tagger, info, (crf, train_time, peak_rss) in zip(taggers, report[1:], results):
+        tagger.crf = crf
+        info['train_time'] = train_time
+        info['peak_rss'] = peak_rss if workers != 1 else None
+
+    return Disambiguator(morph, taggers, threshold=threshold), report
+
+
+def sentence_ambiguity(tagger, parsed_tokens):
+    """
+    Return a fraction of tokens which have parses with different
+    ``tagger.outval`` values.
+    """
+    if not parsed_tokens:
+        return 0.0
+    ambiguous = sum(
+        1 for parses in parsed_tokens
+        if len(set(tagger.outval(p.tag) for p in parses)) > 1
+    )
+    return ambiguous / len(parsed_tokens)
+
+
+def reduce_corpus(tagger, parsed_sents, keep_unambiguous=0.0, keep_low=1.0,
+                  low_ambiguity=0.0, seed=0):
+    """
+    Select training sentences for ``tagger`` by their ambiguity
+    (see :func:`sentence_ambiguity`) and return a list of their indices.
+
+    Sentences without ambiguous tokens are kept with probability
+    ``keep_unambiguous``; sentences with ambiguity not above
+    ``low_ambiguity`` - with probability ``keep_low``;
+    other sentences are kept. ``seed`` makes sampling reproducible.
+    """
+    rng = random.Random(seed)
+    keep = []
+    for idx, (tokens, parsed_tokens) in enumerate(parsed_sents):
+        score = sentence_ambiguity(tagger, parsed_tokens)
+        if score == 0:
+            ratio = keep_unambiguous
+        elif score <= low_ambiguity:
+            ratio = keep_low
+        else:
+            ratio = 1.0
+        if ratio >= 1.0 or rng.random() < ratio:
+            keep.append(idx)
+    return keep
+
+
+def evaluate_reduction(tagger, train, dev, algorithm='lbfgs',
+                       train_params=None, **reduction):
+    """
+    Train ``tagger`` models on a full and on a reduced training corpus
+    and compare them. ``train`` and ``dev`` are ``(parsed_sents, y)``
+    tuples; other keyword arguments are passed to :func:`reduce_corpus`.
+
+    Return ``{'full': stats, 'reduced': stats}`` where stats
+    are dicts with ``sentences``, ``tokens``, ``train_time``
+    and ``accuracy`` (on dev data) keys.
+    """
+    from morphine.metrics import flat_accuracy
+
+    parsed_sents, y = train
+    X = tagger.fe.transform(parsed_sents)
+    X_dev = tagger.fe.transform(dev[0])
+    keep = reduce_corpus(tagger, parsed_sents, **reduction)
+    subsets = {
+        'full': (X, y),
+        'reduced': ([X[idx] for idx in keep], [y[idx] for idx in keep]),
+    }
+    res = {}
+    for name, (X_train, y_train) in subsets.items():
+        crf = _new_crf(tagger.crf, algorithm, train_params)
+        crf, train_time, _ = _train((crf, X_train, y_train))
+        res[name] = {
+            'sentences': len(X_train),
+            'tokens': sum(len(yseq) for yseq in y_train),
+            'train_time': train_time,
+            'accuracy': flat_accuracy(dev[1], crf.predict(X_dev)),
+        }
+    return res
+
+
+def format_report(report):
+    """ Return a text table for a :func:`train_disambiguator` report """
+    lines = ["%-30s %9s %10s %10s %12s" % (
+        "stage", "sentences", "extract, s", "train, s", "peak RSS, MB")]
+    for info in report:
+        peak_rss = info['peak_rss']
+        lines.append("%-30s %9d %10.2f %10.2f %12s" % (
+            info['name'], info['sentences'], info['extract_time'], info['train_time'],
+            '-' if peak_rss is None else '%0.1f' % (peak_rss / 2**20)
+        ))
+    return "\n".join(lines)
+
+
+def _new_crf(crf, algorithm, train_params):
+    if crf is None:
+        return CRF(algorithm=algorithm, train_params=train_params)
+    return CRF(algorithm=crf.algorithm, train_params=crf.train_params,
+               trainer_cls=crf.trainer_cls, trainer_kwargs=crf.trainer_kwargs)
+
+
+def _train_in_processes(tasks, features, workers):
+    # Features are saved to files once per extractor instead of being
+    # pickled into every task; taggers sharing an extractor load
+    # the same file.
+    tmpdir = tempfile.mkdtemp(prefix='morphine-train-')
+    try:
+        feature_files = {}
+        for idx, key in enumerate(features):
+            path = feature_files[key] = os.path.join(tmpdir, '%d.pickle' % idx)
+            with open(path, 'wb') as f:
+                pickle.dump(features[key], f, 2)
+        # a fresh process per model makes peak memory per-model;
+        # see _train_from_file for how the parent's memory is excluded
+        pool = multiprocessing.Pool(workers, maxtasksperchild=1)
+        try:
+            return pool.map(_train_from_file, [
+                (crf, feature_files[key], y) for crf, key, y in tasks
+            ], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _train_from_file(task):
+    # A forked worker starts with the parent's resident memory
+    # (the corpus, extracted features), so the peak is reported
+    # relative to the memory at the start of the task. ru_maxrss
+    # can't be reset, so the peak includes loading the features.
+    crf, path, y = task
+    start_rss = current_rss()
+    with open(path, 'rb') as f:
+        X = pickle.load(f)
+    return _train((crf, X, y), start_rss)
+
+
+def _train(task, start_rss=None):
+    crf, X, y = task
+    if start_rss is None:
+        start_rss = current_rss()
+    start = time.time()
+    crf.fit(X, y)
+    train_time = time.time() - start
+    peak = peak_rss()
+    if peak is None or start_rss is None:
+        return crf, train_time, None
+    return crf, train_time, max(peak - start_rss, 0)
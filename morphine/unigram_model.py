@@ -1,12 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
-from pymorphy2 import MorphAnalyzer
 from pymorphy2.tokenizers import simple_word_tokenize
 
 
 class Tagger(object):
     def __init__(self, morph=None):
         if morph is None:
+            from pymorphy2 import MorphAnalyzer
             morph = MorphAnalyzer()
         self.morph = morph
 
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 import inspect
+import os
+import sys
 
 
 def func_takes_argument(func, argname):
@@ -23,3 +25,58 @@ def func_takes_argument(func, argname):
     """
     spec = inspect.getargspec(func)
     return spec.keywords is not None or argname in spec.args
+
+
+def batches(iterable, size):
+    """
+    Split ``iterable`` into lists of ``size`` items (the last one
+    may be shorter)::
+
+    >>> list(batches(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def tagger_name(tagger):
+    """
+    Return a short name of a partial tagger class::
+
+    >>> from morphine.cases_model import Tagger, CaseFeatureExtractor
+    >>> tagger_name(Tagger(CaseFeatureExtractor()))
+    'cases_model.Tagger'
+    """
+    cls = type(tagger)
+    return "%s.%s" % (cls.__module__.rsplit('.', 1)[-1], cls.__name__)
+
+
+def current_rss(pid=None):
+    """
+    Resident memory of a process (this process by default) in bytes,
+    or None if it is not available (``/proc`` is Linux-specific).
+    """
+    path = '/proc/%s/statm' % ('self' if pid is None else pid)
+    try:
+        with open(path) as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def peak_rss():
+    """ Peak resident memory of this process in bytes, or None """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
@@ -11,19 +11,27 @@ setup(
     long_description = open('README.rst').read(),
     license = 'MIT license',
     packages = ['morphine'],
-    requires=['pymorphy2', 'pycrfsuite', 'toolz'],
+    entry_points = {
+        'console_scripts': ['morphine = morphine.cli:main'],
+    },
+    requires=['pymorphy2', 'pycrfsuite'],
     install_requires=[
         'python-crfsuite >= 0.7',
-        'toolz >= 0.7',
         'pymorphy2 >= 0.8',
         'six',
-        'tqdm',
-        'tabulate',
     ],
     extras_require = {
         'fast':  [
             "DAWG >= 0.7.6",
-            "cytoolz >= 0.7",
+        ],
+        # progress bars and reports shown during training
+        'train': [
+            'tqdm',
+            'tabulate',
+        ],
+        # loading models pickled by versions which used toolz.juxt
+        'legacy': [
+            'toolz >= 0.7',
         ],
     },
     classifiers=[
@@ -3,7 +3,56 @@ from __future__ import unicode_literals
 import pytest
 import pymorphy2
 
+from morphine import cases_model, pos_model, number_model
+from morphine.basetagger import Disambiguator
+from morphine.crfsuite import CRF
+from morphine.feature_extractor import get_parsed_sents
+
+
+SENTS = [
+    'Летят гуси на юг',
+    'Мама мыла раму',
+    'Стали стали крепче',
+    'Мы видели старые дома на улице',
+    'В лесу родилась елочка',
+]
+
 
 @pytest.fixture(scope='session')
 def morph():
     return pymorphy2.MorphAnalyzer()
+
+
+@pytest.fixture(scope='session')
+def sents():
+    return [s.split() for s in SENTS]
+
+
+def train_tagger(tagger, parsed_sents, max_iterations=30):
+    """
+    Train a tagger on a tiny corpus. Each sentence is repeated once for
+    each parse variant, so every label seen in the corpus is learned.
+    """
+    X, y = [], []
+    for tokens, parsed_tokens in parsed_sents:
+        xseq = tagger.fe.transform_single(tokens, parsed_tokens)
+        for k in range(max(len(parses) for parses in parsed_tokens)):
+            X.append(xseq)
+            y.append([tagger.outval(parses[k % len(parses)].tag)
+                      for parses in parsed_tokens])
+    tagger.crf = CRF(train_params={'max_iterations': max_iterations})
+    tagger.crf.fit(X, y)
+    return tagger
+
+
+@pytest.fixture(scope='session')
+def disambiguator(morph, sents):
+    parsed_sents = get_parsed_sents(morph, sents)
+    taggers = [
+        cases_model.Tagger(cases_model.CaseFeatureExtractor()),
+        pos_model.Tagger(pos_model.POSFeatureExtractor()),
+        number_model.Tagger(number_model.NumberFeatureExtractor()),
+    ]
+    for tagger in taggers:
+        train_tagger(tagger, parsed_sents)
+    return Disambiguator(morph, taggers)
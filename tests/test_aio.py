@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+from morphine.aio import AsyncDisambiguator
+
+
+class UpperDisambiguator(object):
+    def __init__(self):
+        self.threads = set()
+
+    def parse(self, tokens):
+        self.threads.add(threading.current_thread().name)
+        if not tokens:
+            raise ValueError("empty sentence")
+        return [tok.upper() for tok in tokens]
+
+
+def test_results_are_routed_to_callers():
+    dis = UpperDisambiguator()
+
+    async def run():
+        async with AsyncDisambiguator(dis, max_batch_size=4, max_wait=0.01) as adis:
+            sents = [['a', str(i)] for i in range(10)]
+            return await adis.parse_sents(sents), adis.stats
+
+    res, stats = asyncio.run(run())
+    assert res == [['A', str(i)] for i in range(10)]
+    assert stats.sentences == 10
+    assert max(stats.batch_sizes) <= 4
+    assert stats.batches >= 3
+    assert stats.max_queue_depth >= 1
+    assert threading.current_thread().name not in dis.threads
+
+
+def test_errors_are_per_sentence():
+    async def run():
+        async with AsyncDisambiguator(UpperDisambiguator()) as adis:
+            return await asyncio.gather(
+                adis.parse(['foo']), adis.parse([]), adis.parse(['bar']),
+                return_exceptions=True,
+            )
+
+    good1, bad, good2 = asyncio.run(run())
+    assert good1 == ['FOO']
+    assert good2 == ['BAR']
+    assert isinstance(bad, ValueError)
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        AsyncDisambiguator(UpperDisambiguator(), max_batch_size=0)
+
+
+class FailingExecutor(concurrent.futures.ThreadPoolExecutor):
+    def __init__(self):
+        super(FailingExecutor, self).__init__(max_workers=1)
+        self.calls = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("executor is broken")
+        return super(FailingExecutor, self).submit(fn, *args, **kwargs)
+
+
+def test_executor_errors_are_propagated():
+    executor = FailingExecutor()
+
+    async def run():
+        adis = AsyncDisambiguator(UpperDisambiguator(), executor=executor)
+        try:
+            first = await asyncio.wait_for(
+                asyncio.gather(adis.parse(['foo']), return_exceptions=True), 5)
+            second = await asyncio.wait_for(adis.parse(['bar']), 5)
+        finally:
+            await adis.close()
+        return first[0], second
+
+    try:
+        error, result = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert isinstance(error, RuntimeError)
+    assert result == ['BAR']
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import io
+import pickle
+import struct
+
+import pytest
+
+from morphine.bundle import (save_bundle, load_bundle, is_bundle,
+                             read_bundle_meta, ALIGNMENT)
+
+
+def _as_tuples(parses):
+    return [[(p.word, str(p.tag), round(p.score, 5)) for p in token_parses]
+            for token_parses in parses]
+
+
+def test_save_load(tmpdir, disambiguator, sents):
+    path = str(tmpdir.join('model.morphine'))
+    save_bundle(disambiguator, path)
+    assert is_bundle(path)
+
+    with io.open(path, 'rb') as f:
+        data = f.read()
+    meta = read_bundle_meta(data)
+    assert [section[1] % ALIGNMENT for section in meta['sections']] == \
+           [0] * len(meta['sections'])
+    assert len(meta['taggers']) == len(disambiguator.partial_taggers)
+    for info, tagger in zip(meta['taggers'], disambiguator.partial_taggers):
+        assert info['labels'] == sorted(tagger.crf.tagger.labels())
+
+    dis = load_bundle(path, morph=disambiguator.morph)
+    assert dis.morph is disambiguator.morph
+    for tagger in dis.partial_taggers:
+        assert tagger.crf.modelfile.name is None
+    for sent in sents:
+        assert _as_tuples(dis.parse(sent)) == _as_tuples(disambiguator.parse(sent))
+
+    # a Disambiguator loaded from a bundle can be saved and pickled again
+    path2 = str(tmpdir.join('model2.morphine'))
+    save_bundle(dis, path2)
+    dis2 = pickle.loads(pickle.dumps(load_bundle(path2)))
+    assert _as_tuples(dis2.parse(sents[0])) == _as_tuples(disambiguator.parse(sents[0]))
+
+
+def test_version_check(tmpdir, disambiguator):
+    path = str(tmpdir.join('model.morphine'))
+    save_bundle(disambiguator, path)
+    with io.open(path, 'r+b') as f:
+        f.seek(16)
+        f.write(struct.pack('<I', 999))
+    with pytest.raises(ValueError) as e:
+        load_bundle(path)
+    assert 'version' in str(e.value)
+
+    pickle_path = str(tmpdir.join('model.pickle'))
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(disambiguator, f)
+    assert not is_bundle(pickle_path)
+    with pytest.raises(ValueError):
+        load_bundle(pickle_path)
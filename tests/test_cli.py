@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import io
+import json
+import pickle
+
+import pytest
+
+from morphine import cli
+
+
+@pytest.fixture()
+def model_path(tmpdir, disambiguator):
+    path = tmpdir.join('model.pickle')
+    with open(str(path), 'wb') as f:
+        pickle.dump(disambiguator, f)
+    return str(path)
+
+
+@pytest.fixture()
+def input_path(tmpdir, sents):
+    path = tmpdir.join('input.txt')
+    with io.open(str(path), 'w', encoding='utf8') as f:
+        for sent in sents:
+            f.write(' '.join(sent) + '\n\n')
+    return str(path)
+
+
+def _read(path):
+    with io.open(path, encoding='utf8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_jsonl(tmpdir, model_path, input_path, disambiguator, sents, workers):
+    out_path = str(tmpdir.join('out.jsonl'))
+    cli.main(['-m', model_path, '-f', 'jsonl', '-o', out_path,
+              '--tokenized', '-j', str(workers), '--batch-size', '2',
+              input_path])
+
+    lines = _read(out_path).splitlines()
+    assert len(lines) == len(sents)
+    for sent_num, (line, sent) in enumerate(zip(lines, sents)):
+        data = json.loads(line)
+        # sentences are numbered by input lines; every other line is empty
+        assert data['sentence'] == sent_num * 2
+        assert [t['token'] for t in data['tokens']] == sent
+        expected = disambiguator.parse(sent)
+        for tok, parses in zip(data['tokens'], expected):
+            assert len(tok['parses']) == 1
+            assert tok['parses'][0]['tag'] == str(parses[0].tag)
+            assert tok['parses'][0]['score'] == pytest.approx(parses[0].score)
+
+
+def test_tsv_top_and_stats(tmpdir, model_path, input_path, capsys):
+    out_path = str(tmpdir.join('out.tsv'))
+    cli.main(['-m', model_path, '-o', out_path, '--top', '0',
+              '--threshold', '0.1', '--stats', input_path])
+
+    sentences = _read(out_path).strip().split('\n\n')
+    assert len(sentences) == 5
+    rows = [line.split('\t') for line in sentences[2].splitlines()]
+    assert all(len(row) == 7 for row in rows)
+    assert rows[0][:4] == ['4', '0', 'Стали', '0']
+    assert all(float(row[6]) >= 0.1 for row in rows)
+    assert len(rows) > 3  # ambiguous tokens have several parses
+
+    err = capsys.readouterr().err
+    assert 'tokens: 20' in err
+    assert 'tokens/sec' in err
+    assert 'disambiguate' in err
+    assert 'morph' in err
+
+
+def test_bundle_model(tmpdir, input_path, disambiguator, sents):
+    from morphine.bundle import save_bundle
+    bundle_path = str(tmpdir.join('model.morphine'))
+    save_bundle(disambiguator, bundle_path)
+    out_path = str(tmpdir.join('out.jsonl'))
+    cli.main(['-m', bundle_path, '-f', 'jsonl', '-o', out_path, '--tokenized',
+              input_path])
+    lines = _read(out_path).splitlines()
+    data = json.loads(lines[2])
+    expected = disambiguator.parse(sents[2])
+    assert [t['parses'][0]['tag'] for t in data['tokens']] == \
+           [str(parses[0].tag) for parses in expected]
+
+
+def test_cached_model(tmpdir, input_path, disambiguator, sents):
+    from morphine.basetagger import Disambiguator
+    from morphine.cache import SentenceCache
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                        cache=SentenceCache(maxsize=10))
+    path = str(tmpdir.join('cached.pickle'))
+    with open(path, 'wb') as f:
+        pickle.dump(dis, f)
+    out_path = str(tmpdir.join('out.jsonl'))
+    cli.main(['-m', path, '-f', 'jsonl', '-o', out_path, '--tokenized',
+              input_path, input_path])
+    lines = _read(out_path).splitlines()
+    assert len(lines) == len(sents) * 2
+    # line numbers continue in the second file
+    assert json.loads(lines[len(sents)])['sentence'] == len(sents) * 2
+    assert json.loads(lines[0])['tokens'] == json.loads(lines[len(sents)])['tokens']
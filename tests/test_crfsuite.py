@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import io
+import json
+
+import pytest
+
+from morphine.crfsuite import CRF, LessNoisyTrainer, EarlyStopping
+from morphine.feature_extractor import get_parsed_sents
+from morphine.pos_model import POSFeatureExtractor
+
+
+@pytest.fixture()
+def pos_data(morph, sents):
+    fe = POSFeatureExtractor()
+    parsed_sents = get_parsed_sents(morph, sents)
+    X = fe.transform(parsed_sents)
+    y = [[str(parses[0].tag.POS) for parses in parsed]
+         for tokens, parsed in parsed_sents]
+    return X, y
+
+
+def test_metrics_callback_and_log(tmpdir, pos_data):
+    X, y = pos_data
+    log_path = str(tmpdir.join('train.jsonl'))
+    received = []
+    crf = CRF(train_params={'max_iterations': 7}, trainer_cls=LessNoisyTrainer,
+              trainer_kwargs={'callback': received.append, 'log_path': log_path})
+    crf.fit(X, y, X, y)
+
+    assert [m['iteration'] for m in received] == list(range(1, 8))
+    assert crf.training_metrics_ == received
+    for metrics in received:
+        assert metrics['loss'] > 0
+        assert 0 <= metrics['f1'] <= 1
+        assert set(metrics['scores']) <= {label for yseq in y for label in yseq}
+
+    with io.open(log_path, encoding='utf8') as f:
+        logged = [json.loads(line) for line in f]
+    assert [m['iteration'] for m in logged] == list(range(1, 8))
+    assert logged[-1]['loss'] == pytest.approx(received[-1]['loss'])
+
+
+def test_early_stopping(pos_data):
+    X, y = pos_data
+    stopping = EarlyStopping('loss', patience=1, min_delta=1e9)
+    crf = CRF(train_params={'max_iterations': 50}, trainer_cls=LessNoisyTrainer,
+              trainer_kwargs={'early_stopping': stopping})
+    crf.fit(X, y)
+    # loss never improves by 1e9, so training stops after iteration 2
+    assert [m['iteration'] for m in crf.training_metrics_] == [1, 2]
+    assert stopping.best_iteration == 1
+    assert crf.training_log_.last_iteration['num'] == 1
+    assert len(crf.predict(X)) == len(X)
+
+    reference = CRF(train_params={'max_iterations': 1}).fit(X, y)
+    assert crf.predict_marginals(X) == reference.predict_marginals(X)
+
+
+def test_early_stopping_requires_holdout(pos_data):
+    X, y = pos_data
+    crf = CRF(trainer_cls=LessNoisyTrainer,
+              trainer_kwargs={'early_stopping': EarlyStopping('f1')})
+    with pytest.raises(ValueError):
+        crf.fit(X, y)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from morphine.basetagger import Disambiguator
+from morphine.cache import SentenceCache
+from morphine.diagnostics import memory_report, format_memory_report, deep_size
+
+
+def test_memory_report(disambiguator):
+    report = memory_report(disambiguator)
+    assert [info['name'] for info in report['taggers']] == [
+        'cases_model.Tagger', 'pos_model.Tagger', 'number_model.Tagger']
+    for tagger, info in zip(disambiguator.partial_taggers, report['taggers']):
+        header = tagger.crf.tagger.info().header
+        assert info['labels'] == int(header['num_labels'])
+        assert info['attributes'] == int(header['num_attrs'])
+        assert info['state_features'] > 0
+        assert info['model_size'] == int(header['size'])
+        assert info['extractor_size'] > 0
+    assert report['morph']['objects'] > 0
+    assert report['morph']['dictionary_files'] > 0
+    assert report['cache'] is None
+    assert report['rss'] > 0
+    assert 'cases_model.Tagger' in format_memory_report(report)
+
+
+def test_memory_report_shared(disambiguator):
+    cache = SentenceCache(maxsize=10)
+    tagger = disambiguator.partial_taggers[0]
+    dis = Disambiguator(disambiguator.morph, [tagger, tagger], cache=cache)
+    dis.parse(['Мама', 'мыла', 'раму'])
+
+    report = memory_report(dis, include_morph=False)
+    assert report['morph'] is None
+    assert report['cache']['size'] == 1
+    # the extractor is counted once; the analyzer is not counted
+    first, second = report['taggers']
+    assert second['extractor_size'] == 0
+    assert (first['shared_with'], second['shared_with']) == (None, 0)
+    assert 'shared with #0' in format_memory_report(report)
+    assert first['extractor_size'] < deep_size(disambiguator.morph)
+    assert 'cache: 1 sentences' in format_memory_report(report)
+
+
+def test_model_info_untrained():
+    from morphine.crfsuite import CRF
+    from morphine.diagnostics import model_info
+    assert model_info(CRF())['model_size'] == 0
+    assert model_info(None)['labels'] == 0
+
+
+def test_memory_report_old_pickle(disambiguator):
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers)
+    del dis.cache
+    del dis.store
+    report = memory_report(dis, include_morph=False)
+    assert report['cache'] is None and report['store'] is None
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals, division
+import pickle
+
+import pytest
+
+from morphine.basetagger import Disambiguator
+from morphine.cache import SentenceCache
+
+
+def _as_tuples(parses):
+    return [[(p.word, str(p.tag), round(p.score, 5)) for p in token_parses]
+            for token_parses in parses]
+
+
+def test_parse(disambiguator, sents):
+    for sent in sents:
+        res = disambiguator.parse(sent)
+        assert len(res) == len(sent)
+        for token_parses in res:
+            scores = [p.score for p in token_parses]
+            assert scores == sorted(scores, reverse=True)
+            assert sum(scores) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('threshold', [0, 0.2])
+def test_parse_compact(disambiguator, sents, threshold):
+    disambiguator.threshold = threshold
+    try:
+        for sent in sents:
+            expected = disambiguator.parse(sent)
+            res = disambiguator.parse_compact(sent)
+            assert len(res) == len(sent)
+            assert _as_tuples(res.to_parses()) == _as_tuples(expected)
+            for i, token_parses in enumerate(expected):
+                if token_parses:
+                    assert res.best(i) == res.parses(i)[0]
+                    assert res.parsed_tokens[i][res.best_index(i)].tag == token_parses[0].tag
+                else:
+                    assert res.best(i) is None
+                    assert res.best_index(i) == -1
+    finally:
+        disambiguator.threshold = 0
+
+
+def test_cache(disambiguator, sents):
+    cache = SentenceCache(maxsize=3)
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                        cache=cache)
+
+    res = dis.parse(sents[0])
+    assert isinstance(res, tuple) and isinstance(res[0], tuple)
+    assert _as_tuples(res) == _as_tuples(disambiguator.parse(sents[0]))
+    assert dis.parse(list(sents[0])) is res
+    assert dis.parse(' '.join(sents[0])) is res
+    assert cache.info()['hits'] == 2
+    assert cache.hit_rate == pytest.approx(2 / 3)
+
+    for sent in sents:
+        dis.parse(sent)
+    assert len(cache) == 3
+    assert cache.evictions == 2
+
+    dis.threshold = 0.2
+    res2 = dis.parse(sents[0])
+    assert res2 is not res
+    assert cache.invalidations == 1
+    assert len(cache) == 1
+
+    dis.partial_taggers = dis.partial_taggers[:1]
+    assert dis.parse(sents[0]) is not res2
+    assert cache.invalidations == 2
+
+    dis.threshold = 0.2
+    dis.parse(sents[0])
+    assert cache.invalidations == 2
+
+
+def test_timings(disambiguator, sents):
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                        cache=SentenceCache(maxsize=3))
+    dis.timings = {}
+    dis.parse(sents[0])
+    timings = dict(dis.timings)
+    assert set(timings) == {'morph', 'disambiguate'}
+    assert all(value > 0 for value in timings.values())
+    dis.parse(sents[0])
+    assert dis.timings == timings  # cached
+
+    dis.parse_compact(sents[1])
+    dis.parse(sents[2], deadline=float('inf'))
+    assert dis.timings['morph'] > timings['morph']
+    assert dis.timings['disambiguate'] > timings['disambiguate']
+
+
+def test_cache_memory_bound(disambiguator, sents):
+    cache = SentenceCache(max_bytes=1)
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                        cache=cache)
+    dis.parse(sents[0])
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+    cache.max_bytes = 100000
+    for sent in sents * 2:
+        dis.parse(sent)
+    assert 0 < cache.nbytes <= 100000
+
+    cache = pickle.loads(pickle.dumps(cache))
+    assert len(cache) == 0
+
+
+def test_predict_with_proba(disambiguator, sents):
+    for tagger in disambiguator.partial_taggers:
+        for sent in sents:
+            parsed = [disambiguator.morph.parse(t) for t in sent]
+            labels, probability, parse_probs = tagger.predict_with_proba_single(sent, parsed)
+            assert parse_probs == tagger.predict_proba_single(sent, parsed)
+
+            xseq = tagger.fe.transform_single(sent, parsed)
+            assert labels == tagger.crf.predict_single(xseq)
+            assert 0 < probability <= 1
+            assert tagger.crf.predict_with_marginals([xseq]) == [
+                (labels, probability, tagger.crf.predict_marginals_single(xseq))
+            ]
+
+
+def test_weights_and_temperature(disambiguator, sents):
+    sent = sents[2]
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers)
+    default = dis.parse(sent)
+
+    dis.weights = [1.0, 1.0, 1.0]
+    assert _as_tuples(dis.parse(sent)) == _as_tuples(default)
+
+    dis.weights = [0.0, 1.0, 0.0]
+    pos_only = dis.parse(sent)
+    pos_tagger = dis.partial_taggers[1]
+    parsed = [dis.morph.parse(t) for t in sent]
+    for token_parses, parses, probs in zip(
+            pos_only, parsed, pos_tagger.predict_proba_single(sent, parsed)):
+        total = sum(probs)
+        assert sorted(p.score for p in token_parses) == \
+               pytest.approx(sorted(prob / total for prob in probs))
+
+    dis.weights = None
+    dis.temperature = 100.0
+    flat = dis.parse(sent)
+    for token_parses, default_parses in zip(flat, default):
+        assert token_parses[0].score <= default_parses[0].score + 1e-9
+        assert sum(p.score for p in token_parses) == pytest.approx(1.0)
+
+
+def test_weights_changed_inplace_invalidate_cache(disambiguator, sents):
+    sent = sents[2]
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                        cache=SentenceCache(), weights=[1.0, 1.0, 1.0])
+    default = _as_tuples(dis.parse(sent))
+    dis.weights[0] = dis.weights[2] = 0.0
+    pos_only = _as_tuples(dis.parse(sent))
+    assert pos_only != default
+    dis.cache = None
+    assert pos_only == _as_tuples(dis.parse(sent))
+
+
+def test_invalid_temperature(disambiguator):
+    from morphine.basetagger import combine_log_probs
+    with pytest.raises(ValueError):
+        Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                      temperature=0)
+    with pytest.raises(ValueError):
+        combine_log_probs([[0.5, 0.5]], temperature=-1.0)
+
+
+def test_threshold_prunes_parses(disambiguator, sents):
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                        threshold=0.2)
+    for sent in sents:
+        for token_parses in dis.parse(sent):
+            assert all(p.score >= 0.2 for p in token_parses)
+
+
+def test_deadline(disambiguator, sents):
+    import time
+    from morphine.basetagger import ParseResult
+
+    dis = Disambiguator(disambiguator.morph, disambiguator.partial_taggers,
+                        cache=SentenceCache())
+    far = time.time() + 3600
+    for sent in sents:
+        res = dis.parse(sent, deadline=far)
+        assert isinstance(res, ParseResult) and res.path == 'crf'
+        assert _as_tuples(res) == _as_tuples(disambiguator.parse(sent))
+    assert set(dis._costs) == set(dis.partial_taggers)
+    assert dis.fallback_rate == 0
+
+    # a cached result is returned even if the deadline has passed
+    assert dis.parse(sents[0], deadline=0).path == 'crf'
+
+    dis.cache.clear()
+    res = dis.parse_sents(sents[1:], deadline=0)
+    assert [r.path for r in res] == ['unigram'] * (len(sents) - 1)
+    for token_parses, parses in zip(res[1], [dis.morph.parse(t) for t in sents[2]]):
+        total = sum(p.score for p in parses)
+        assert [(p.tag, p.score) for p in token_parses] == \
+               [(p.tag, pytest.approx(p.score / total)) for p in parses]
+
+    dis._costs[dis.partial_taggers[1]] = 1000.0
+    res = dis.parse(sents[3], deadline=time.time() + 100)
+    assert res.path == 'partial'
+    for token_parses in res:
+        assert sum(p.score for p in token_parses) == pytest.approx(1.0)
+
+    assert dis.path_counts == {'crf': len(sents) + 1, 'unigram': len(sents) - 1,
+                               'partial': 1}
+    assert dis.fallback_rate == pytest.approx(len(sents) / (2 * len(sents) + 1))
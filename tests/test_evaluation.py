@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import io
+
+import pytest
+
+from morphine.evaluation import (
+    ATTRIBUTES, evaluate, format_evaluation, read_tagged_sents)
+
+
+@pytest.fixture()
+def gold_path(tmpdir, morph, sents):
+    path = tmpdir.join('gold.txt')
+    with io.open(str(path), 'w', encoding='utf8') as f:
+        for sent in sents:
+            for token in sent:
+                f.write("%s\t%s\n" % (token, morph.parse(token)[0].tag))
+            f.write("\n")
+    return str(path)
+
+
+def test_read_tagged_sents(gold_path, sents):
+    gold = list(read_tagged_sents(gold_path))
+    assert [[token for token, tag in sent] for sent in gold] == sents
+    assert gold[1][0] == ('Мама', 'NOUN,anim,femn sing,nomn')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_evaluate(disambiguator, gold_path, sents, workers):
+    report = evaluate(disambiguator, gold_path, workers=workers, batch_size=2)
+    assert report['sentences'] == len(sents)
+    assert report['tokens'] == sum(len(sent) for sent in sents)
+    assert sorted(report['errors']) == sorted(ATTRIBUTES)
+    for attr, counts in report['errors'].items():
+        # gold tags are pymorphy2 guesses
+        assert counts['baseline'] == 0
+        assert 0 <= counts['model'] <= report['tokens']
+    assert report['tokens_per_sec'] > 0
+    assert report['latency'][50] <= report['latency'][99]
+    assert 'POS' in format_evaluation(report)
+
+
+def test_evaluate_partial_tagger(disambiguator, morph, gold_path):
+    tagger = disambiguator.partial_taggers[1]
+    report = evaluate(tagger, gold_path, morph=morph)
+    assert list(report['errors']) == ['outval']
+    assert report['errors']['outval']['baseline'] == 0
+
+    with pytest.raises(ValueError):
+        evaluate(tagger, gold_path)
+
+
+def test_read_tagged_sents_malformed(tmpdir):
+    path = tmpdir.join('bad.txt')
+    path.write_text('Мама\tNOUN,anim,femn sing,nomn\nмыла\n', encoding='utf8')
+    with pytest.raises(ValueError) as excinfo:
+        list(read_tagged_sents(str(path)))
+    assert 'bad.txt:2' in str(excinfo.value)
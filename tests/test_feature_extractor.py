@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import pickle
+
+import pytest
+
 from morphine import features
-from morphine.feature_extractor import FeatureExtractor
+from morphine.feature_extractor import FeatureExtractor, _CombinedFeatures
 
 
 def test_token_features(morph):
@@ -39,3 +43,278 @@ def test_token_and_global_features(morph):
         {'token_lower': 'юг', 'sentence_start': 1.0, 'sentence_end': 1.0},
     ]
 
+
+
+def test_write_features_protocol(morph):
+    def legacy(token, parses):
+        return {'len': len(token)}
+
+    token_features = [
+        features.bias, features.token_lower, features.suffix2, legacy,
+        features.Grammeme(threshold=0.1, add_unambig=True),
+        features.GrammemePair(),
+    ]
+    fe = FeatureExtractor(token_features)
+    for tok in ['Стали', 'гуси', 'на']:
+        parses = morph.parse(tok)
+        expected = {}
+        for feat in token_features:
+            expected.update(feat(tok, parses))
+        assert fe.combined_token_features(tok, parses) == expected
+        assert expected['len'] == len(tok)
+        assert 'Grammeme[unambig]' in expected
+
+
+def test_pickle(morph):
+    fe = FeatureExtractor(
+        [features.bias, features.token_lower, features.Grammeme()],
+        [features.Pattern([-1, 'token_lower'])],
+    )
+    sent = 'Летят гуси на юг'.split()
+    parsed = [morph.parse(t) for t in sent]
+    fe2 = pickle.loads(pickle.dumps(fe))
+    assert fe2.transform_single(sent, parsed) == fe.transform_single(sent, parsed)
+
+
+def test_unpickle_juxt_state(morph):
+    toolz = pytest.importorskip('toolz')
+    combined = _CombinedFeatures.__new__(_CombinedFeatures)
+    combined.__setstate__({
+        '_combined': toolz.juxt([features.bias, features.token_lower])
+    })
+    assert combined('Гуси', morph.parse('Гуси')) == {'bias': 1.0, 'token_lower': 'гуси'}
+
+
+def test_load_juxt_pickle(morph, monkeypatch):
+    # a FeatureExtractor pickled by a version which used toolz.juxt
+    toolz = pytest.importorskip('toolz')
+    fe = FeatureExtractor([features.bias, features.token_lower])
+    juxt = toolz.juxt([features.bias, features.token_lower])
+    monkeypatch.setattr(_CombinedFeatures, '__getstate__',
+                        lambda self: {'_combined': juxt})
+    data = pickle.dumps(fe, 2)
+    monkeypatch.undo()
+    assert b'toolz.functoolz' in data
+
+    fe2 = pickle.loads(data)
+    sent = ['Гуси']
+    parsed = [morph.parse(t) for t in sent]
+    assert fe2.transform_single(sent, parsed) == fe.transform_single(sent, parsed)
+
+
+def _transform_with_dicts(fe, tokens, parsed_tokens):
+    feature_dicts = list(map(fe.combined_token_features, tokens, parsed_tokens))
+    for feat in fe.global_features:
+        feat(tokens, parsed_tokens, feature_dicts)
+    return feature_dicts
+
+
+def test_columns_match_dicts(morph, sents):
+    from morphine.cases_model import CaseFeatureExtractor
+    from morphine.pos_model import POSFeatureExtractor
+    from morphine.number_model import NumberFeatureExtractor
+
+    extractors = [
+        CaseFeatureExtractor(), POSFeatureExtractor(), NumberFeatureExtractor(),
+        FeatureExtractor([features.token_lower], [
+            features.Pattern([-1, 'token_lower'], [+2, 'missing']),
+            features.Pattern([-1, 'prev'], [0, 'token_lower'], name='prev'),
+            features.Pattern([-3, 'token_lower'], index_low=1, index_high=1),
+            features.Pattern([0, lambda token, parses: token.istitle(), 'title']),
+        ]),
+    ]
+    for fe in extractors:
+        assert fe._uses_columns()
+        for sent in sents + [['юг'], []]:
+            parsed = [morph.parse(t) for t in sent]
+            assert fe.transform_single(sent, parsed) == \
+                   _transform_with_dicts(fe, sent, parsed)
+
+
+def test_mixed_global_features(morph):
+    def custom(tokens, parsed_tokens, feature_dicts):
+        feature_dicts[-1]['last'] = True
+
+    fe = FeatureExtractor([features.token_lower], [
+        features.Pattern([-1, 'token_lower']),
+        custom,
+    ])
+    assert not fe._uses_columns()
+    sent = 'Летят гуси'.split()
+    assert fe.transform_single(sent, [morph.parse(t) for t in sent]) == [
+        {'token_lower': 'летят'},
+        {'token_lower': 'гуси', 'token_lower[i-1]': 'летят', 'last': True},
+    ]
+
+
+def test_plan(morph, sents):
+    from morphine.cases_model import CaseFeatureExtractor
+
+    plan = CaseFeatureExtractor().plan()
+    assert plan.enabled
+    assert not plan.dead_keys and not plan.scratch_keys and not plan.skipped
+    assert plan.dependencies['Grammeme[i-1]/Grammeme[i]'] == {'Grammeme'}
+    assert 'token_lower [output] <- token' in plan.report()
+
+    def legacy(token, parses):
+        return {'len': len(token)}
+
+    fe = FeatureExtractor(
+        [features.token_lower, features.suffix2, legacy,
+         features.Grammeme(add_unambig=True)],
+        [
+            features.Pattern([-1, 'suffix2']),
+            features.Drop('suffix2'),
+            features.Pattern([-1, 'token_lower']),
+            features.Drop('token_lower[i-1]'),
+            features.Drop('Grammeme'),
+            features.Drop('len'),
+        ],
+    )
+    plan = fe.plan()
+    assert plan.dead_keys == {'token_lower[i-1]', 'Grammeme'}
+    assert plan.scratch_keys == {'suffix2', 'token_lower[i-1]', 'Grammeme', 'len'}
+    assert plan.global_features == fe.global_features[:1]
+    # legacy feature doesn't describe its keys and Grammeme[unambig]
+    # is still used, so all token features are computed
+    assert plan.token_features == list(fe.combined_token_features.feature_funcs)
+    report = plan.report()
+    assert "token_lower[i-1] [dead] <- token_lower" in report
+    assert "skipped: Pattern('token_lower[i-1]')" in report
+
+    for sent in sents + [['юг'], []]:
+        parsed = [morph.parse(t) for t in sent]
+        assert fe.transform_single(sent, parsed) == \
+               _transform_with_dicts(fe, sent, parsed)
+
+    fe.global_features = fe.global_features[:2]
+    assert fe.plan().dead_keys == set()
+    assert fe.plan().scratch_keys == {'suffix2'}
+
+
+def test_plan_skips_token_features(morph):
+    fe = FeatureExtractor(
+        [features.token_lower, features.suffix2],
+        [features.Drop('suffix2')],
+    )
+    plan = fe.plan()
+    assert plan.token_features == [features.token_lower]
+    assert plan.skipped == [features.suffix2, fe.global_features[0]]
+    sent = 'Летят гуси'.split()
+    expected = [{'token_lower': 'летят'}, {'token_lower': 'гуси'}]
+    assert fe.transform_single(sent, [morph.parse(t) for t in sent]) == expected
+
+    fe.plan()
+    fe2 = pickle.loads(pickle.dumps(fe))
+    assert '_plan' not in fe2.__dict__
+    assert fe2.transform_single(sent, [morph.parse(t) for t in sent]) == expected
+
+
+def test_item_sequence_output(morph, sents):
+    import pycrfsuite
+    from morphine.cases_model import CaseFeatureExtractor
+    from morphine.crfsuite import CRF
+
+    fe = CaseFeatureExtractor()
+    parsed_sents = [(sent, [morph.parse(t) for t in sent]) for sent in sents]
+    X = fe.transform(parsed_sents)
+    fe.set_output('items')
+    X_items = fe.transform(parsed_sents)
+    assert all(isinstance(xseq, pycrfsuite.ItemSequence) for xseq in X_items)
+    assert [xseq.items() for xseq in X_items] == \
+           [pycrfsuite.ItemSequence(xseq).items() for xseq in X]
+
+    with pytest.raises(ValueError):
+        fe.set_output('arrays')
+
+    y = [[str(parses[0].tag.POS) for parses in parsed] for sent, parsed in parsed_sents]
+    crf = CRF(train_params={'max_iterations': 10}).fit(X, y)
+    crf_items = CRF(train_params={'max_iterations': 10}).fit(X_items, y)
+    assert crf_items.predict(X_items) == crf.predict(X)
+    assert crf_items.predict_marginals(X_items) == crf.predict_marginals(X)
+
+
+def test_prune_attributes(morph, sents):
+    from morphine.attributes import count_attributes
+    from morphine.crfsuite import CRF
+
+    fe = FeatureExtractor(
+        [features.bias, features.token_lower, features.Grammeme()],
+        [features.Pattern([-2, 'token_lower']), features.Pattern([-1, 'Grammeme'])],
+    )
+    parsed_sents = [(sent, [morph.parse(t) for t in sent]) for sent in sents]
+    X = fe.transform(parsed_sents)
+    counts = count_attributes(X)
+    assert counts['bias'] == sum(len(sent) for sent in sents)
+    assert counts['token_lower[i-2]:летят'] == 1
+
+    X_pruned = list(fe.prune_attributes(X, min_count=2))
+    whitelist = fe.attribute_whitelist
+    assert whitelist == {attr for attr, count in counts.items() if count >= 2}
+    assert 'token_lower[i-2]:летят' not in whitelist
+    assert X_pruned == fe.transform(parsed_sents)
+    assert count_attributes(X_pruned) == {
+        attr: count for attr, count in counts.items() if attr in whitelist}
+
+    # token_lower[i-2] attributes are all rare, so the Pattern is skipped
+    plan = fe.plan()
+    assert 'token_lower[i-2]' in plan.dead_keys
+    assert fe.global_features[0] in plan.skipped
+
+    fe2 = pickle.loads(pickle.dumps(fe))
+    assert fe2.attribute_whitelist == whitelist
+    assert fe2.transform(parsed_sents) == X_pruned
+
+    assert len(list(fe.prune_attributes(X, top_n=5))[0][0]) <= 5
+    y = [[str(parses[0].tag.POS) for parses in parsed] for sent, parsed in parsed_sents]
+    crf = CRF(train_params={'max_iterations': 5})
+    crf.fit(fe.prune_attributes(X, min_count=2), y)
+    assert len(crf.predict(fe.transform(parsed_sents))) == len(sents)
+
+    fe.set_attribute_whitelist(None)
+    assert fe.transform(parsed_sents) == X
+
+
+def test_prune_item_sequences(morph, sents):
+    import pycrfsuite
+    from morphine.attributes import count_attributes
+    from morphine.cases_model import CaseFeatureExtractor
+
+    fe = CaseFeatureExtractor()
+    parsed_sents = [(sent, [morph.parse(t) for t in sent]) for sent in sents]
+    X = fe.transform(parsed_sents)
+    fe.set_output('items')
+    X_items = fe.transform(parsed_sents)
+    assert count_attributes(X_items) == count_attributes(X)
+
+    X_pruned = fe.prune_attributes(X_items, min_count=2)
+    whitelist = fe.attribute_whitelist
+    X_pruned = list(X_pruned)
+    assert whitelist and all(count_attributes(X)[attr] >= 2 for attr in whitelist)
+    assert all(isinstance(xseq, pycrfsuite.ItemSequence) for xseq in X_pruned)
+    assert [xseq.items() for xseq in X_pruned] == \
+           [xseq.items() for xseq in fe.transform(parsed_sents)]
+    assert set(count_attributes(X_pruned)) == whitelist
+
+
+def test_nested_attributes_match_crfsuite():
+    from morphine.attributes import build_whitelist, count_attributes, filter_features
+    from morphine.crfsuite import CRF
+
+    X = [
+        [{'a': {'b': {'c': 1.0}, 'd': 'x'}, 'e': ['y', 'z'], 'f': 0.5},
+         {'a': {'b': {'g': 1.0}}, 'e': ['y']}],
+        [{'a': {'b': {'c': 1.0}, 'd': 'w'}, 'e': ['y']}],
+    ]
+    y = [['1', '2'], ['1']]
+    crf = CRF(train_params={'c1': 0.0, 'max_iterations': 5}).fit(X, y)
+    info = crf.tagger.info()
+    assert set(count_attributes(X)) == set(info.attributes)
+
+    whitelist = build_whitelist(X, min_count=2)
+    assert whitelist == {'a:b:c', 'e:y'}
+    filtered = [[filter_features(fd, whitelist) for fd in xseq] for xseq in X]
+    assert filtered[0][0] == {'a': {'b': {'c': 1.0}}, 'e': ['y']}
+    assert set(count_attributes(filtered)) == whitelist
+    crf = CRF(train_params={'c1': 0.0, 'max_iterations': 5}).fit(filtered, y)
+    assert set(crf.tagger.info().attributes) == whitelist
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import threading
+
 from morphine import features
+from morphine._grammemes import GrammemeBits
 
 def _parse(tokens, morph):
     return [morph.parse(tok) for tok in tokens]
@@ -97,3 +100,92 @@ def test_GrammemePair_threshold(morph):
     assert 'VERB,plur' in res['GrammemePair']
     assert 'NOUN,nomn' not in res['GrammemePair']
 
+
+
+def _reference_grammemes(feat, parse):
+    # implementation based on string tuples, for comparison
+    grammemes = [gr for gr in parse.tag._grammemes_tuple if gr not in feat.ignore]
+    if feat.only is not None:
+        grammemes = [gr for gr in grammemes if gr in feat.only]
+        if not grammemes:
+            grammemes = ['NA']
+    return grammemes
+
+
+def _reference_features(feat, parses, pairs):
+    features = {}
+    for p in parses:
+        if p.score < feat.threshold:
+            continue
+        grammemes = _reference_grammemes(feat, p)
+        if pairs:
+            keys = [",".join(sorted([gr1, gr2]))
+                    for idx, gr1 in enumerate(grammemes)
+                    for gr2 in grammemes[idx+1:]]
+        else:
+            keys = grammemes
+        for key in keys:
+            features[key] = max(p.score, features.get(key, 0))
+    return features
+
+
+def test_grammeme_features_bitmasks(morph):
+    tokens = 'Стали стали крепче , мы видели старые дома на улице 2014 года хрюкотали'.split()
+    parsed_tokens = _parse(tokens, morph)
+    kwargs_list = [
+        {},
+        {'threshold': 0.1},
+        {'ignore': {'anim', 'inan', 'masc', 'femn', 'neut'}},
+        {'only': {'NOUN', 'VERB', 'plur', 'sing'}},
+        {'only': {'nomn', 'gent', 'accs'}, 'ignore': {'gent'}},
+    ]
+    for kwargs in kwargs_list:
+        for cls, pairs in [(features.Grammeme, False), (features.GrammemePair, True)]:
+            feat = cls(**kwargs)
+            batch = feat.extract_sentence(parsed_tokens)
+            for tok, parses, batch_res in zip(tokens, parsed_tokens, batch):
+                res = feat(tok, parses)
+                assert batch_res == res
+                assert res[feat.name] == _reference_features(feat, parses, pairs)
+                for p in parses:
+                    assert sorted(feat._filtered_grammemes(p)) == \
+                           sorted(_reference_grammemes(feat, p))
+
+
+def test_Grammeme_ignore_reassigned(morph):
+    feat = features.Grammeme(threshold=0.1)
+    parses = morph.parse('на')
+    assert 'PREP' in feat('на', parses)['Grammeme']
+    feat.ignore = {'PREP'}
+    assert 'PREP' not in feat('на', parses)['Grammeme']
+    feat.ignore = ()
+    feat.only = {'PREP'}
+    assert list(feat('на', parses)['Grammeme']) == ['PREP']
+
+
+def test_Grammeme_old_pickle_state(morph):
+    feat = features.Grammeme.__new__(features.Grammeme)
+    feat.__setstate__({
+        'name': 'Grammeme', 'unambig_name': 'Grammeme[unambig]',
+        'threshold': 0.1, 'add_unambig': False,
+        'ignore': {'PREP'}, 'only': None,
+    })
+    assert feat.ignore == frozenset(['PREP'])
+    assert feat('на', morph.parse('на'))['Grammeme'] == {}
+
+
+def test_grammeme_bits_threads():
+    bits = GrammemeBits()
+    grammemes = ['g%d' % idx for idx in range(200)]
+
+    def assign():
+        for grammeme in grammemes:
+            bits.bit(grammeme)
+            bits.names(bits.mask(grammemes[:3]))
+
+    threads = [threading.Thread(target=assign) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(bits.bit(grammeme) for grammeme in grammemes)) == len(grammemes)
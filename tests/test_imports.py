@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import json
+import pickle
+import subprocess
+import sys
+
+TRAINING_ONLY = ['tqdm', 'tabulate', 'toolz', 'cytoolz']
+
+_SCRIPT = """
+import json, pickle, sys
+with open(sys.argv[1], 'rb') as f:
+    dis = pickle.load(f)
+dis.parse('Мама мыла раму')
+print(json.dumps(sorted(m for m in %r if m in sys.modules)))
+""" % TRAINING_ONLY
+
+
+def test_inference_doesnt_import_training_modules(tmpdir, disambiguator):
+    path = str(tmpdir.join('model.pickle'))
+    with open(path, 'wb') as f:
+        pickle.dump(disambiguator, f)
+    out = subprocess.check_output([sys.executable, '-c', _SCRIPT, path])
+    assert json.loads(out.decode('utf8')) == []
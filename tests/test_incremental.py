@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import random
+
+import pytest
+
+from morphine import cases_model, pos_model, number_model, features
+from morphine.feature_extractor import FeatureExtractor
+
+
+def _result(parses):
+    return [[(str(p.tag), round(p.score, 9)) for p in token_parses]
+            for token_parses in parses]
+
+
+@pytest.mark.parametrize('fe', [
+    cases_model.CaseFeatureExtractor(),
+    pos_model.POSFeatureExtractor(),
+    number_model.NumberFeatureExtractor(),
+])
+def test_transform_window(morph, sents, fe):
+    assert fe.feature_reach() is not None
+    tokens = [token for sent in sents for token in sent]
+    parsed_tokens = [morph.parse(token) for token in tokens]
+    full = fe.transform_single(tokens, parsed_tokens)
+    for start, stop in [(0, 1), (0, 3), (4, 9), (len(tokens) - 2, len(tokens))]:
+        assert fe.transform_window(tokens, parsed_tokens, start, stop) == full[start:stop]
+
+
+def sent_length(tokens, parsed_tokens, feature_dicts):
+    for feature_dict in feature_dicts:
+        feature_dict['length'] = len(tokens)
+
+
+def test_feature_reach(morph):
+    fe = FeatureExtractor([features.token_lower], [
+        features.Pattern([-1, 'token_lower']),
+        features.Pattern([-1, 'token_lower[i-1]'], [1, 'token_lower']),
+    ])
+    assert fe.feature_reach() == 2
+
+    fe.global_features.append(sent_length)
+    assert fe.feature_reach() is None
+    tokens = ['мама', 'мыла', 'раму']
+    parsed_tokens = [morph.parse(token) for token in tokens]
+    assert fe.transform_window(tokens, parsed_tokens, 2, 3)[0]['length'] == 3
+
+
+def test_incremental_parse(disambiguator, sents):
+    words = [token for sent in sents for token in sent]
+    rng = random.Random(0)
+    sent = disambiguator.parse_incremental(sents[0])
+    assert _result(sent.parses) == _result(disambiguator.parse(sents[0]))
+
+    for _ in range(30):
+        start = rng.randint(0, len(sent.tokens))
+        stop = rng.randint(start, min(start + 2, len(sent.tokens)))
+        new_tokens = [rng.choice(words) for _ in range(rng.randint(0, 3))]
+        parses = sent.replace(start, stop, new_tokens)
+        assert _result(parses) == _result(disambiguator.parse(list(sent.tokens)))
+
+
+def test_incremental_edits(disambiguator):
+    sent = disambiguator.parse_incremental()
+    assert sent.parses == []
+    sent.insert(0, ['стали', 'крепче'])
+    sent.insert(0, ['Стали'])
+    assert sent.tokens == ['Стали', 'стали', 'крепче']
+    sent.delete(0, 3)
+    assert sent.parses == []
+
+    with pytest.raises(IndexError):
+        sent.replace(1, 2, ['мама'])
+
+
+def test_incremental_text(disambiguator):
+    sent = disambiguator.parse_incremental('Мама мыла раму')
+    assert sent.tokens == ['Мама', 'мыла', 'раму']
+    assert _result(sent.parses) == _result(disambiguator.parse('Мама мыла раму'))
+    sent.insert(3, 'на юг')
+    assert sent.tokens == ['Мама', 'мыла', 'раму', 'на', 'юг']
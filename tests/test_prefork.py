@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import os
+import sys
+
+import pytest
+
+from morphine.prefork import PreforkPool, process_memory
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="requires os.fork")
+
+
+def test_prefork_pool(disambiguator, sents):
+    results_r, results_w = os.pipe()
+    go_r, go_w = os.pipe()
+
+    def target(dis, index):
+        os.read(go_r, 1)  # wait until the parent has measured memory
+        best = dis.parse(sents[index])[0][0]
+        os.write(results_w, ("%d %s\n" % (index, best.tag)).encode('utf8'))
+
+    pool = PreforkPool(disambiguator, target, workers=2, warmup_sents=sents[:1])
+    with pool:
+        for tagger in disambiguator.partial_taggers:
+            assert tagger.crf._tagger is not None
+
+        report = pool.memory_report()
+        assert [r['role'] for r in report] == ['parent', 'worker 0', 'worker 1']
+        if sys.platform.startswith('linux'):
+            for r in report:
+                assert r['unique'] <= r['rss']
+        os.write(go_w, b'xx')
+
+    assert pool.pids == []
+    os.close(results_w)
+    with os.fdopen(results_r, 'rb') as f:
+        lines = sorted(f.read().decode('utf8').splitlines())
+    expected = [
+        "%d %s" % (i, disambiguator.parse(sents[i])[0][0].tag)
+        for i in range(2)
+    ]
+    assert lines == expected
+
+
+def test_worker_errors_are_reported(disambiguator):
+    def target(dis, index):
+        raise ValueError()
+
+    pool = PreforkPool(disambiguator, target, workers=1).start()
+    assert pool.join() == [1]
+
+
+def test_process_memory():
+    mem = process_memory(os.getpid())
+    assert mem['pid'] == os.getpid()
+    if sys.platform.startswith('linux'):
+        assert mem['rss'] > 0
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from morphine import features
+from morphine.cases_model import CaseFeatureExtractor
+from morphine.feature_extractor import FeatureExtractor, get_parsed_sents
+from morphine import search
+from morphine.search import grid_search, pick_fast, format_results
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_grid_search(morph, sents, workers):
+    parsed_sents = get_parsed_sents(morph, sents)
+    y = [[str(parses[0].tag.case or 'NA') for parses in parsed]
+         for tokens, parsed in parsed_sents]
+    extractors = {
+        'case': CaseFeatureExtractor(),
+        'tiny': FeatureExtractor([features.bias, features.token_lower]),
+    }
+    results = grid_search(
+        extractors,
+        {'c2': [0.01, 1.0], 'max_iterations': [5]},
+        train=(parsed_sents, y), dev=(parsed_sents, y),
+        workers=workers,
+    )
+    assert len(results) == 4
+    assert {r['extractor'] for r in results} == {'case', 'tiny'}
+    assert {r['params']['c2'] for r in results} == {0.01, 1.0}
+    f1s = [r['f1'] for r in results]
+    assert f1s == sorted(f1s, reverse=True)
+    for res in results:
+        assert 0 <= res['accuracy'] <= 1
+        assert res['model_size'] > 0
+        assert res['extract_time'] > 0
+        assert res['tokens_per_sec'] < sum(map(len, y)) / res['extract_time']
+    assert any(r['pareto'] for r in results)
+    assert results[0]['pareto']
+    assert search._features == {}
+
+    fast = pick_fast(results, tolerance=1.0)
+    assert fast['tokens_per_sec'] == max(r['tokens_per_sec'] for r in results)
+    assert pick_fast(results)['f1'] == results[0]['f1']
+    assert 'tiny' in format_results(results)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import pickle
+
+import pytest
+
+from morphine.basetagger import Disambiguator
+from morphine.store import build_store, ParseStore
+
+
+def _key(parses):
+    # analyzer units in methods stacks are equivalent but not identical
+    def stack_key(obj):
+        if isinstance(obj, tuple):
+            return tuple(stack_key(item) for item in obj)
+        if hasattr(obj, 'parse'):
+            return type(obj).__name__
+        return obj
+    return [(p.word, p.tag, p.normal_form, p.score, stack_key(p.methods_stack))
+            for p in parses]
+
+
+@pytest.fixture()
+def store_path(tmpdir, morph, sents, disambiguator):
+    path = str(tmpdir.join('vocab.store'))
+    vocab = [tok for sent in sents for tok in sent] + [
+        'человек-паук', 'хрюкотали', 'И', 'и', 'СССР', 'ООН']
+    build_store(path, morph, vocab,
+                extractors=[t.fe for t in disambiguator.partial_taggers])
+    return path
+
+
+def test_parses(store_path, morph):
+    store = ParseStore(store_path, morph)
+    for word in ['Стали', 'человек-паук', 'хрюкотали', 'мыла']:
+        assert _key(store.parse(word)) == _key(morph.parse(word))
+    assert store.parse('гусь') is None
+    assert (store.hits, store.misses) == (4, 1)
+    # decoded parses are cached, but callers get fresh lists
+    assert store.parse('мыла') == store.parse('мыла')
+    assert store.parse('мыла') is not store.parse('мыла')
+
+    p = store.parse('гуси')[0]
+    assert p.normal_form == 'гусь'
+    assert p.inflect({'gent'}).word == 'гусей'
+
+    with pytest.raises(ValueError):
+        ParseStore(__file__, morph)
+
+
+def test_parses_case_sensitive(store_path, morph):
+    store = ParseStore(store_path, morph)
+    for word in ['И', 'и', 'Мама', 'Стали', 'СССР', 'ООН']:
+        assert _key(store.parse(word)) == _key(morph.parse(word))
+    assert len(store.parse('И')) != len(store.parse('и'))
+    assert store.parse('мама') is None
+
+
+def test_token_features(store_path, morph, disambiguator, sents):
+    store = ParseStore(store_path, morph)
+    assert store.extractors == sorted(['CaseFeatureExtractor',
+                                       'POSFeatureExtractor',
+                                       'NumberFeatureExtractor'])
+    fe = disambiguator.partial_taggers[0].fe
+    stored = store.token_features('CaseFeatureExtractor', 'Стали')
+    assert stored == fe.combined_token_features('Стали', morph.parse('Стали'))
+    assert store.token_features('CaseFeatureExtractor', 'мама') is None
+    assert store.token_features('UnknownExtractor', 'Стали') is None
+
+
+def test_disambiguator_with_store(store_path, morph, disambiguator, sents):
+    store = ParseStore(store_path, morph)
+    taggers = pickle.loads(pickle.dumps(disambiguator.partial_taggers))
+    dis = Disambiguator(morph, taggers, store=store)
+    assert all(t.fe.store is store for t in taggers)
+
+    for sent in sents + [['гусь', 'летит']]:
+        assert list(map(_key, dis.parse(sent))) == \
+               list(map(_key, disambiguator.parse(sent)))
+        parsed = [morph.parse(t) for t in sent]
+        assert taggers[0].fe.transform_single(sent, parsed) == \
+               disambiguator.partial_taggers[0].fe.transform_single(sent, parsed)
+
+    dis2 = pickle.loads(pickle.dumps(dis))
+    assert list(map(_key, dis2.parse(sents[0]))) == \
+           list(map(_key, dis.parse(sents[0])))
+    assert dis2.store.hits > 0
+
+
+def test_token_features_signature(store_path, morph, disambiguator):
+    from morphine import features
+    from morphine.cases_model import CaseFeatureExtractor
+    store = ParseStore(store_path, morph)
+    fe = CaseFeatureExtractor()
+    fe.use_store(store)
+    assert fe.store is store
+
+    # same class name, different token features
+    changed = CaseFeatureExtractor()
+    changed.combined_token_features.feature_funcs[2].threshold = 0.5
+    with pytest.raises(ValueError):
+        changed.use_store(store)
+    other = CaseFeatureExtractor()
+    other.combined_token_features = type(other.combined_token_features)(
+        features.bias, features.token_lower)
+    with pytest.raises(ValueError):
+        other.use_store(store)
+    with pytest.raises(ValueError):
+        fe.use_store(store, name='UnknownExtractor')
+
+    # a disambiguator only attaches the store to matching extractors
+    taggers = pickle.loads(pickle.dumps(disambiguator.partial_taggers))
+    taggers[0].fe.combined_token_features.feature_funcs[2].threshold = 0.5
+    Disambiguator(morph, taggers, store=store)
+    assert taggers[0].fe.store is None
+    assert taggers[1].fe.store is store
+
+
+def test_parse_cache_size(store_path, morph, sents):
+    store = ParseStore(store_path, morph, cache_size=2)
+    words = [tok for sent in sents for tok in sent][:5]
+    for word in words:
+        assert _key(store.parse(word)) == _key(morph.parse(word))
+    assert list(store._parses) == words[-2:]
+    store.parse(words[-2])
+    assert list(store._parses) == [words[-1], words[-2]]
+    assert pickle.loads(pickle.dumps(store)).cache_size == 2
+
+    store = ParseStore(store_path, morph, cache_size=0)
+    assert _key(store.parse(words[0])) == _key(morph.parse(words[0]))
+    assert len(store._parses) == 0
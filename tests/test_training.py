@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from morphine import cases_model, pos_model
+from morphine.training import train_disambiguator, format_report
+from morphine.utils import current_rss
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_train_disambiguator(morph, sents, workers):
+    tagged_sents = [[(tok, str(morph.parse(tok)[0].tag)) for tok in sent]
+                    for sent in sents]
+    case_fe = cases_model.CaseFeatureExtractor()
+    taggers = [
+        cases_model.Tagger(case_fe),
+        cases_model.MultiTagger(case_fe),
+        pos_model.Tagger(pos_model.POSFeatureExtractor()),
+    ]
+    dis, report = train_disambiguator(
+        morph, tagged_sents, taggers,
+        train_params={'max_iterations': 20}, workers=workers,
+    )
+    assert dis.partial_taggers == taggers
+    assert [info['name'] for info in report] == [
+        'parse', 'cases_model.Tagger', 'cases_model.MultiTagger', 'pos_model.Tagger']
+    for info in report[1:]:
+        assert info['train_time'] > 0
+        if workers > 1:
+            # the parent's memory inherited by forked workers isn't counted
+            assert 0 < info['peak_rss'] < current_rss()
+    assert 'pos_model.Tagger' in format_report(report)
+
+    pos_tagger = taggers[2]
+    for tokens, tagged in zip(sents, tagged_sents):
+        labels = pos_tagger.crf.predict_single(
+            pos_tagger.fe.transform_single(tokens, [morph.parse(t) for t in tokens]))
+        assert labels == [pos_tagger.outval(morph.TagClass(tag)) for tok, tag in tagged]
+
+
+def test_train_shared_features_saved_once(morph, sents, monkeypatch):
+    from morphine import training
+    dumped = []
+    dump = training.pickle.dump
+    monkeypatch.setattr(training.pickle, 'dump',
+                        lambda obj, *args: dumped.append(obj) or dump(obj, *args))
+    tagged_sents = [[(tok, str(morph.parse(tok)[0].tag)) for tok in sent]
+                    for sent in sents]
+    case_fe = cases_model.CaseFeatureExtractor()
+    taggers = [cases_model.Tagger(case_fe), cases_model.MultiTagger(case_fe)]
+    dis, report = train_disambiguator(
+        morph, tagged_sents, taggers,
+        train_params={'max_iterations': 5}, workers=2,
+    )
+    assert len(dumped) == 1
+    assert all(tagger.crf is not None for tagger in taggers)
+
+
+def test_reduce_corpus(morph, sents):
+    from morphine import number_model
+    from morphine.feature_extractor import get_parsed_sents
+    from morphine.training import (sentence_ambiguity, reduce_corpus,
+                                   evaluate_reduction)
+
+    tagger = number_model.Tagger(number_model.NumberFeatureExtractor())
+    parsed_sents = get_parsed_sents(morph, sents + [['юг'], ['на']])
+    scores = [sentence_ambiguity(tagger, parsed) for tokens, parsed in parsed_sents]
+    assert scores[-1] == 0
+    assert all(0 <= score <= 1 for score in scores)
+
+    ambiguous = [idx for idx, score in enumerate(scores) if score > 0]
+    assert reduce_corpus(tagger, parsed_sents) == ambiguous
+    assert reduce_corpus(tagger, parsed_sents, keep_unambiguous=1.0) == \
+           list(range(len(parsed_sents)))
+    assert reduce_corpus(tagger, parsed_sents, low_ambiguity=1.0, keep_low=0.0) == []
+
+    y = [[tagger.outval(parses[0].tag) for parses in parsed]
+         for tokens, parsed in parsed_sents]
+    res = evaluate_reduction(tagger, (parsed_sents, y), (parsed_sents, y),
+                             train_params={'max_iterations': 10})
+    assert res['full']['sentences'] == len(parsed_sents)
+    assert res['reduced']['sentences'] == len(ambiguous)
+    assert res['reduced']['tokens'] < res['full']['tokens']
+    for stats in res.values():
+        assert 0 <= stats['accuracy'] <= 1
+
+
+def test_train_with_reduction(morph, sents):
+    from morphine import number_model
+    tagged_sents = [[(tok, str(morph.parse(tok)[0].tag)) for tok in sent]
+                    for sent in sents + [['юг']]]
+    tagger = number_model.Tagger(number_model.NumberFeatureExtractor())
+    dis, report = train_disambiguator(
+        morph, tagged_sents, [tagger], train_params={'max_iterations': 5},
+        workers=1, reduction={'keep_unambiguous': 0.0},
+    )
+    assert report[0]['sentences'] == len(tagged_sents)
+    assert report[1]['sentences'] < len(tagged_sents)
+
+
+def test_reduction_extracts_kept_sentences_only(morph, sents):
+    from morphine import number_model
+
+    class CountingExtractor(number_model.NumberFeatureExtractor):
+        transformed = 0
+
+        def transform(self, parsed_sents):
+            CountingExtractor.transformed += len(parsed_sents)
+            return super(CountingExtractor, self).transform(parsed_sents)
+
+    tagged_sents = [[(tok, str(morph.parse(tok)[0].tag)) for tok in sent]
+                    for sent in sents + [['юг'], ['на']]]
+    tagger = number_model.Tagger(CountingExtractor())
+    dis, report = train_disambiguator(
+        morph, tagged_sents, [tagger], train_params={'max_iterations': 5},
+        workers=1, reduction={'keep_unambiguous': 0.0},
+    )
+    assert CountingExtractor.transformed == report[1]['sentences'] < len(tagged_sents)
+
+    with pytest.raises(ValueError):
+        train_disambiguator(
+            morph, tagged_sents, [tagger], workers=1,
+            reduction={'low_ambiguity': 1.0, 'keep_low': 0.0},
+        )